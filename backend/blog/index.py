@@ -6,6 +6,8 @@ Returns: HTTP response с данными постов
 """
 import json
 import os
+import hashlib
+import time
 from typing import Dict, Any
 from datetime import datetime
 
@@ -14,6 +16,15 @@ try:
 except ImportError:
     psycopg2 = None
 
+# Клиент всегда перепроверяет ответ по ETag, неизменившиеся посты приходят как 304
+CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+# Просмотры пишутся в counter_events и сливаются в blog_posts пачками (см. V0103)
+COUNTER_FLUSH_BATCH = 100
+COUNTER_FLUSH_INTERVAL = 60
+COUNTER_FLUSH_MAX_EVENTS = 5000
+_counter_state = {'recorded': 0, 'last_flush': time.monotonic()}
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -24,7 +35,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Admin-Auth',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Admin-Auth, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -86,6 +97,114 @@ def is_admin(event: Dict[str, Any]) -> bool:
         return False
 
 
+def get_cache_version(cur, scope: str) -> int:
+    """Текущая версия данных (инкрементируется триггерами, см. V0102)"""
+    cur.execute(
+        "SELECT version FROM t_p63326274_course_download_plat.cache_versions WHERE scope = %s",
+        (scope,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def make_etag(scope: str, version: int, params: Dict[str, Any]) -> str:
+    """Сильный ETag: версия данных + нормализованные параметры запроса"""
+    key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(f'{scope}:{version}:{key}'.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    """Совпадает ли If-None-Match клиента с текущим ETag"""
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in candidates or '*' in candidates
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    return {
+        'ETag': etag,
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Origin, Accept-Encoding, X-User-Id',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def record_post_view(cur, slug: str) -> None:
+    """Записать просмотр поста без UPDATE строки blog_posts"""
+    cur.execute(
+        """INSERT INTO t_p63326274_course_download_plat.counter_events (target, target_id, counter, delta)
+           SELECT 'blog_posts', id, 'views_count', 1
+           FROM t_p63326274_course_download_plat.blog_posts WHERE slug = %s""",
+        (slug,)
+    )
+    _counter_state['recorded'] += 1
+
+
+def flush_post_views(conn) -> int:
+    """Слить накопленные просмотры в blog_posts одним UPDATE ... FROM (VALUES ...)"""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """DELETE FROM t_p63326274_course_download_plat.counter_events
+               WHERE id IN (
+                   SELECT id FROM t_p63326274_course_download_plat.counter_events
+                   WHERE target = 'blog_posts'
+                   ORDER BY id
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+               )
+               RETURNING target_id, delta""",
+            (COUNTER_FLUSH_MAX_EVENTS,)
+        )
+        events = cur.fetchall()
+        
+        per_post: Dict[int, int] = {}
+        for post_id, delta in events:
+            per_post[post_id] = per_post.get(post_id, 0) + delta
+        
+        if per_post:
+            values_sql = ', '.join(f"({int(post_id)}, {int(delta)})" for post_id, delta in per_post.items())
+            cur.execute(f"""
+                UPDATE t_p63326274_course_download_plat.blog_posts AS p
+                SET views_count = COALESCE(p.views_count, 0) + v.delta
+                FROM (VALUES {values_sql}) AS v(id, delta)
+                WHERE p.id = v.id
+            """)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    _counter_state['recorded'] = 0
+    _counter_state['last_flush'] = time.monotonic()
+    return len(events)
+
+
+def maybe_flush_post_views(conn) -> None:
+    """Сливать просмотры по порогу размера или времени для этого инстанса"""
+    elapsed = time.monotonic() - _counter_state['last_flush']
+    if _counter_state['recorded'] >= COUNTER_FLUSH_BATCH or elapsed >= COUNTER_FLUSH_INTERVAL:
+        try:
+            flush_post_views(conn)
+        except Exception as e:
+            print(f"Failed to flush post views: {e}")
+
+
 def get_posts(event: Dict[str, Any]) -> Dict[str, Any]:
     """Получение списка постов (опубликованные для всех, все для админа)"""
     params = event.get('queryStringParameters', {}) or {}
@@ -108,6 +227,15 @@ def get_posts(event: Dict[str, Any]) -> Dict[str, Any]:
         conn = psycopg2.connect(dsn)
         cur = conn.cursor()
         
+        # Админская выдача включает черновики и не кэшируется
+        etag = None
+        if not admin:
+            etag = make_etag('blog', get_cache_version(cur, 'blog'), params)
+            if is_not_modified(event, etag):
+                cur.close()
+                conn.close()
+                return not_modified_response(etag)
+        
         if admin:
             if status_filter == 'all':
                 query = """
@@ -159,9 +287,12 @@ def get_posts(event: Dict[str, Any]) -> Dict[str, Any]:
         cur.close()
         conn.close()
         
+        headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+        headers.update(cache_headers(etag) if etag else {'Cache-Control': 'no-store'})
+        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': headers,
             'body': json.dumps({'success': True, 'posts': posts}),
             'isBase64Encoded': False
         }
@@ -203,6 +334,18 @@ def get_post(event: Dict[str, Any]) -> Dict[str, Any]:
         conn = psycopg2.connect(dsn)
         cur = conn.cursor()
         
+        etag = None
+        if not admin:
+            etag = make_etag('blog', get_cache_version(cur, 'blog'), params)
+            if is_not_modified(event, etag):
+                # Просмотр засчитываем и при ответе 304
+                record_post_view(cur, slug)
+                conn.commit()
+                maybe_flush_post_views(conn)
+                cur.close()
+                conn.close()
+                return not_modified_response(etag)
+        
         if admin:
             query = """
                 SELECT id, title, slug, content, excerpt, cover_image_url, status, views_count,
@@ -232,15 +375,11 @@ def get_post(event: Dict[str, Any]) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # Увеличиваем счётчик просмотров (только для неадминов)
+        # Увеличиваем счётчик просмотров (только для неадминов, отложенная запись)
         if not admin:
-            cur.execute(
-                """UPDATE t_p63326274_course_download_plat.blog_posts 
-                   SET views_count = views_count + 1 
-                   WHERE slug = %s""",
-                (slug,)
-            )
+            record_post_view(cur, slug)
             conn.commit()
+            maybe_flush_post_views(conn)
         
         post = {
             'id': row[0],
@@ -259,9 +398,12 @@ def get_post(event: Dict[str, Any]) -> Dict[str, Any]:
         cur.close()
         conn.close()
         
+        headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+        headers.update(cache_headers(etag) if etag else {'Cache-Control': 'no-store'})
+        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': headers,
             'body': json.dumps({'success': True, 'post': post}),
             'isBase64Encoded': False
         }
@@ -1,21 +1,384 @@
 """
 Business: Скачивание архива с файлами работы после оплаты
-Args: event - dict с httpMethod, queryStringParameters (workId, publicKey, userId)
+Args: event - dict с httpMethod, queryStringParameters (workId, publicKey, userId, file)
       context - объект с request_id
-Returns: ZIP-архив с файлами работы
+Returns: ссылку на архив работы или один файл из ZIP-архива (file=путь внутри архива);
+         большой файл распаковывается в S3 и отдаётся редиректом на временную ссылку
 """
 import json
 import os
+import re
+import hmac
+import time
+import hashlib
+import struct
+import zlib
+import mimetypes
 import urllib.request
 import urllib.parse
 import base64
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 try:
     import psycopg2
 except ImportError:
     psycopg2 = None
 
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+
+# Чтение отдельных файлов из удалённого ZIP через HTTP Range: центральный каталог
+# берётся из хвоста архива, затем скачивается только нужный элемент
+ZIP_TAIL_BYTES = 64 * 1024 + 22
+ZIP_CHUNK_BYTES = 1024 * 1024
+# Ответ функции ограничен ~3.5 МБ, а тело уходит в base64
+MAX_MEMBER_BYTES = 2_500_000
+RANGE_TIMEOUT = 20
+# Файлы больше лимита распаковываются потоком в S3 частями multipart upload
+# (в памяти не больше одной части) и отдаются по временной ссылке
+S3_BUCKET = 'kyra'
+MEMBER_PART_BYTES = 8 * 1024 * 1024
+MEMBER_URL_TTL = 3600
+
+
+def http_range(url: str, start: Optional[int], end: Optional[int]) -> Tuple[bytes, int]:
+    """Скачать байты [start, end] (или последние end байт при start=None) и вернуть их с размером объекта"""
+    spec = f'bytes=-{end}' if start is None else f'bytes={start}-{end}'
+    request = urllib.request.Request(url, headers={'Range': spec})
+    with urllib.request.urlopen(request, timeout=RANGE_TIMEOUT) as response:
+        if response.status != 206:
+            raise ValueError('Range requests are not supported for this file')
+        match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+        return response.read(), int(match.group(1)) if match else -1
+
+
+def parse_zip64_extra(extra: bytes, values: List[int]) -> List[int]:
+    """Подставить 64-битные размеры/смещение из extra-поля 0x0001 вместо значений 0xFFFFFFFF"""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from('<HH', extra, position)
+        if header_id == 0x0001:
+            data = extra[position + 4:position + 4 + size]
+            offset = 0
+            for i, value in enumerate(values):
+                if value == 0xFFFFFFFF and offset + 8 <= len(data):
+                    values[i] = struct.unpack_from('<Q', data, offset)[0]
+                    offset += 8
+            break
+        position += 4 + size
+    return values
+
+
+def decode_zip_name(raw: bytes, flags: int) -> str:
+    if flags & 0x800:
+        return raw.decode('utf-8', 'replace')
+    # Архивы из Windows-архиваторов хранят кириллицу в cp866
+    return raw.decode('cp866')
+
+
+def read_zip_directory(url: str) -> List[Dict[str, Any]]:
+    """Список элементов ZIP по центральному каталогу (включая ZIP64) без скачивания архива"""
+    tail, total = http_range(url, None, ZIP_TAIL_BYTES)
+    tail_start = total - len(tail)
+    eocd = tail.rfind(b'PK\x05\x06')
+    if eocd < 0:
+        raise ValueError('Not a ZIP archive')
+    
+    entries_count, cd_size, cd_offset = struct.unpack_from('<HII', tail, eocd + 10)
+    if 0xFFFFFFFF in (cd_size, cd_offset) or entries_count == 0xFFFF:
+        locator = eocd - 20
+        if locator < 0 or tail[locator:locator + 4] != b'PK\x06\x07':
+            raise ValueError('Broken ZIP64 archive')
+        zip64_offset = struct.unpack_from('<Q', tail, locator + 8)[0]
+        if zip64_offset >= tail_start:
+            record = tail[zip64_offset - tail_start:zip64_offset - tail_start + 56]
+        else:
+            record, _ = http_range(url, zip64_offset, zip64_offset + 55)
+        if record[:4] != b'PK\x06\x06':
+            raise ValueError('Broken ZIP64 archive')
+        entries_count, cd_size, cd_offset = struct.unpack_from('<QQQ', record, 32)
+    
+    if cd_offset >= tail_start:
+        directory = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+    else:
+        directory, _ = http_range(url, cd_offset, cd_offset + cd_size - 1)
+    
+    entries = []
+    position = 0
+    for _ in range(entries_count):
+        if directory[position:position + 4] != b'PK\x01\x02':
+            raise ValueError('Broken ZIP central directory')
+        (flags, method, crc, compressed_size, size, name_len, extra_len, comment_len,
+         local_offset) = struct.unpack_from('<8xHH4xIIIHHH8xI', directory, position)
+        name = decode_zip_name(directory[position + 46:position + 46 + name_len], flags)
+        extra = directory[position + 46 + name_len:position + 46 + name_len + extra_len]
+        size, compressed_size, local_offset = parse_zip64_extra(extra, [size, compressed_size, local_offset])
+        position += 46 + name_len + extra_len + comment_len
+        
+        if not name.endswith('/'):
+            entries.append({
+                'name': name,
+                'size': size,
+                'compressed_size': compressed_size,
+                'method': method,
+                'flags': flags,
+                'crc': crc,
+                'offset': local_offset
+            })
+    return entries
+
+
+def iter_zip_member(url: str, entry: Dict[str, Any]) -> Iterator[bytes]:
+    """Потоково отдать содержимое элемента: stored как есть, deflate — с распаковкой; CRC проверяется"""
+    if entry['flags'] & 0x1:
+        raise ValueError('Encrypted ZIP members are not supported')
+    if entry['method'] not in (0, 8):
+        raise ValueError(f"Unsupported ZIP compression method {entry['method']}")
+    
+    header, _ = http_range(url, entry['offset'], entry['offset'] + 29)
+    if header[:4] != b'PK\x03\x04':
+        raise ValueError('Broken ZIP local header')
+    name_len, extra_len = struct.unpack_from('<HH', header, 26)
+    data_start = entry['offset'] + 30 + name_len + extra_len
+    data_end = data_start + entry['compressed_size']
+    
+    decompressor = zlib.decompressobj(-15) if entry['method'] == 8 else None
+    crc = 0
+    for chunk_start in range(data_start, data_end, ZIP_CHUNK_BYTES):
+        chunk, _ = http_range(url, chunk_start, min(chunk_start + ZIP_CHUNK_BYTES, data_end) - 1)
+        data = decompressor.decompress(chunk) if decompressor else chunk
+        crc = zlib.crc32(data, crc)
+        yield data
+    if decompressor:
+        data = decompressor.flush()
+        crc = zlib.crc32(data, crc)
+        yield data
+    if crc != entry['crc']:
+        raise ValueError('ZIP member CRC mismatch')
+
+
+def read_zip_member(url: str, member: str, max_bytes: int = MAX_MEMBER_BYTES) -> Tuple[Optional[Dict[str, Any]], bytes]:
+    """Найти элемент архива по пути и прочитать его целиком, если он не больше max_bytes"""
+    wanted = member.strip('/')
+    entry = next((e for e in read_zip_directory(url) if e['name'].strip('/') == wanted), None)
+    if not entry:
+        return None, b''
+    if entry['size'] > max_bytes:
+        return entry, b''
+    return entry, b''.join(iter_zip_member(url, entry))
+
+
+
+def get_s3_client():
+    if not boto3 or not os.environ.get('YANDEX_S3_KEY_ID'):
+        return None
+    return boto3.client(
+        's3',
+        endpoint_url='https://storage.yandexcloud.net',
+        aws_access_key_id=os.environ.get('YANDEX_S3_KEY_ID'),
+        aws_secret_access_key=os.environ.get('YANDEX_S3_SECRET_KEY'),
+        region_name='ru-central1'
+    )
+
+
+def stage_zip_member(s3_client, url: str, entry: Dict[str, Any], part_bytes: int = MEMBER_PART_BYTES) -> str:
+    """
+    Распаковать элемент архива в S3 и вернуть временную ссылку на него.
+    Ключ зависит от архива, пути и CRC элемента — повторные запросы берут уже распакованный файл
+    """
+    filename = entry['name'].rsplit('/', 1)[-1]
+    digest = hashlib.sha256(f"{url}\0{entry['name']}\0{entry['crc']}".encode('utf-8')).hexdigest()[:32]
+    key = f'zip-members/{digest}/{filename}'
+    disposition = f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}"
+    
+    existing = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix=key, MaxKeys=1).get('Contents', [])
+    if not any(obj['Key'] == key and obj['Size'] == entry['size'] for obj in existing):
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=S3_BUCKET, Key=key,
+            ContentType=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            ContentDisposition=disposition
+        )['UploadId']
+        parts = []
+        
+        def upload_part(data: bytes):
+            etag = s3_client.upload_part(
+                Bucket=S3_BUCKET, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=data
+            )['ETag']
+            parts.append({'PartNumber': len(parts) + 1, 'ETag': etag})
+        
+        try:
+            buffer = bytearray()
+            # CRC проверяется после последнего куска — до complete, так что битый файл не публикуется
+            for data in iter_zip_member(url, entry):
+                buffer += data
+                while len(buffer) >= part_bytes:
+                    upload_part(bytes(buffer[:part_bytes]))
+                    del buffer[:part_bytes]
+            if buffer or not parts:
+                upload_part(bytes(buffer))
+            s3_client.complete_multipart_upload(
+                Bucket=S3_BUCKET, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            s3_client.abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+            raise
+        print(f"[DEBUG] Staged ZIP member {entry['name']} to {key} in {len(parts)} parts")
+    
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': S3_BUCKET, 'Key': key, 'ResponseContentDisposition': disposition},
+        ExpiresIn=MEMBER_URL_TTL
+    )
+
+
+def zip_member_response(url: str, member: str, s3_client=None) -> Dict[str, Any]:
+    """Ответ с одним файлом из ZIP-архива работы"""
+    try:
+        entry, content = read_zip_member(url, member)
+    except ValueError as e:
+        return {
+            'statusCode': 415,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    if not entry:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Файл не найден в архиве'}),
+            'isBase64Encoded': False
+        }
+    
+    if entry['size'] > MAX_MEMBER_BYTES:
+        s3_client = s3_client or get_s3_client()
+        if s3_client:
+            try:
+                location = stage_zip_member(s3_client, url, entry)
+            except ValueError as e:
+                return {
+                    'statusCode': 415,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            return {
+                'statusCode': 302,
+                'headers': {'Location': location, 'Access-Control-Allow-Origin': '*'},
+                'body': '',
+                'isBase64Encoded': False
+            }
+        # Без доступа к S3 большой файл отдать нечем
+        return {
+            'statusCode': 413,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Файл слишком большой, скачайте архив целиком', 'size': entry['size']}),
+            'isBase64Encoded': False
+        }
+    
+    filename = entry['name'].rsplit('/', 1)[-1]
+    print(f"[DEBUG] Serving ZIP member {entry['name']} ({entry['size']} bytes)")
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            'Content-Disposition': f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}",
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': base64.b64encode(content).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+
+# Подписанные токены скачивания выдаёт purchase-work (issue_download_token)
+REVOKED_TOKENS_REFRESH = 60
+_revoked_tokens = {'ids': set(), 'loaded_at': 0.0}
+
+
+def _token_b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def verify_download_token(token: str, user_id: str, work_id: str, client_ip: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Проверить подпись, срок, пользователя, работу и хэш IP; вернуть (payload, ошибка)"""
+    secret = os.environ.get('DOWNLOAD_TOKEN_SECRET')
+    if not secret:
+        return None, 'DOWNLOAD_TOKEN_SECRET not configured'
+    secret = secret.encode('utf-8')
+    
+    body, _, signature = token.partition('.')
+    expected = _token_b64(hmac.new(secret, body.encode('ascii', 'replace'), hashlib.sha256).digest())
+    if not body or not hmac.compare_digest(signature, expected):
+        return None, 'bad signature'
+    
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+    except ValueError:
+        return None, 'bad payload'
+    
+    if payload.get('e', 0) < time.time():
+        return None, 'expired'
+    if str(payload.get('u')) != str(user_id) or str(payload.get('w')) != str(work_id):
+        return None, 'user or work mismatch'
+    if payload.get('ip') and client_ip != 'unknown':
+        ip_hash = hmac.new(secret, f'ip:{client_ip}'.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+        if not hmac.compare_digest(payload['ip'], ip_hash):
+            return None, 'ip mismatch'
+    return payload, None
+
+
+def get_revoked_token_ids(cur) -> set:
+    """Отозванные токены; список маленький и перечитывается раз в REVOKED_TOKENS_REFRESH секунд"""
+    if time.monotonic() - _revoked_tokens['loaded_at'] > REVOKED_TOKENS_REFRESH:
+        cur.execute(
+            "SELECT token_id FROM t_p63326274_course_download_plat.revoked_download_tokens WHERE expires_at > NOW()"
+        )
+        _revoked_tokens['ids'] = {row[0] for row in cur.fetchall()}
+        _revoked_tokens['loaded_at'] = time.monotonic()
+    return _revoked_tokens['ids']
+
+
+# Проверка доступа и запись скачивания за один round trip.
+# Скачивание пишется только в журнал events; user_downloads и downloads_count
+# пересчитывает пачками функция events-rollup
+ENTITLEMENT_SQL = """
+    WITH entitlement AS (
+        SELECT u.id AS user_id,
+               COALESCE(u.role = 'admin' OR w.author_id = u.id, FALSE) AS privileged,
+               p.created_at IS NOT NULL AS purchased,
+               COALESCE(p.created_at > NOW() - INTERVAL '7 days', FALSE) AS purchase_active,
+               EXTRACT(DAY FROM NOW() - p.created_at)::int AS days_passed,
+               w.id AS work_id,
+               w.title,
+               COALESCE(NULLIF(w.download_url, ''), NULLIF(w.file_url, '')) AS download_url
+        FROM t_p63326274_course_download_plat.users u
+        LEFT JOIN t_p63326274_course_download_plat.works w ON w.id = %(work_id)s
+        LEFT JOIN LATERAL (
+            SELECT created_at
+            FROM t_p63326274_course_download_plat.purchases
+            WHERE buyer_id = u.id AND work_id = w.id
+            ORDER BY created_at DESC
+            LIMIT 1
+        ) p ON TRUE
+        WHERE u.id = %(user_id)s
+    ),
+    allowed AS (
+        SELECT user_id, work_id FROM entitlement
+        WHERE work_id IS NOT NULL AND download_url IS NOT NULL AND (privileged OR purchase_active)
+    ),
+    logged AS (
+        INSERT INTO t_p63326274_course_download_plat.events (event_type, user_id, work_id)
+        SELECT 'download', user_id, work_id FROM allowed
+    )
+    SELECT privileged, purchased, purchase_active, days_passed, work_id, title, download_url
+    FROM entitlement
+"""
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -46,6 +409,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     work_id = params.get('workId')
     user_id = headers.get('X-User-Id') or headers.get('x-user-id')
     token = params.get('token')
+    member = params.get('file')
     public_key = params.get('publicKey', 'https://disk.yandex.ru/d/usjmeUqnkY9IfQ')
     
     print(f"[DEBUG] Headers: {headers}")
@@ -68,7 +432,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    # Токен теперь опциональный - проверяем покупку напрямую
+    # Токен опциональный; если передан — проверяем подпись без обращения к БД,
+    # доступ всё равно подтверждается покупкой ниже
+    token_payload = None
+    if token:
+        client_ip = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
+        token_payload, token_error = verify_download_token(token, user_id, work_id, client_ip)
+        if token_error:
+            print(f"[SECURITY] Rejected download token for work_id={work_id}: {token_error}")
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Ссылка для скачивания недействительна или истекла'}),
+                'isBase64Encoded': False
+            }
     
     try:
         # Загружаем данные работы из БД
@@ -80,19 +457,26 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             raise Exception('psycopg2 module not available')
         
         conn = psycopg2.connect(dsn)
+        # Единственный оператор фиксируется сам, без отдельного COMMIT
+        conn.autocommit = True
         cur = conn.cursor()
         
         try:
-            from datetime import datetime, timedelta
+            if token_payload and token_payload.get('id') in get_revoked_token_ids(cur):
+                return {
+                    'statusCode': 403,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Ссылка для скачивания отозвана'}),
+                    'isBase64Encoded': False
+                }
             
-            # Проверяем роль пользователя
-            cur.execute(
-                "SELECT role FROM t_p63326274_course_download_plat.users WHERE id = %s",
-                (user_id,)
-            )
-            user_result = cur.fetchone()
+            # Роль, авторство, окно покупки и ссылка — одним запросом; при разрешённом доступе
+            # он же пишет событие 'download' в events. user_downloads и downloads_count
+            # обновляет позже events-rollup, счётчик здесь не меняется
+            cur.execute(ENTITLEMENT_SQL, {'user_id': user_id, 'work_id': work_id})
+            entitlement = cur.fetchone()
             
-            if not user_result:
+            if not entitlement:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -100,33 +484,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            user_role = user_result[0] if user_result[0] else 'user'
-            is_admin = (user_role == 'admin')
-            
-            # Проверяем, является ли пользователь автором работы
-            cur.execute(
-                "SELECT author_id FROM t_p63326274_course_download_plat.works WHERE id = %s",
-                (work_id,)
-            )
-            work_author_result = cur.fetchone()
-            is_author = False
-            if work_author_result and work_author_result[0]:
-                is_author = (int(user_id) == int(work_author_result[0]))
+            privileged, purchased, purchase_active, days_passed, found_work_id, title, download_url = entitlement
             
             # Админы и авторы скачивают без проверки покупки
-            if not is_admin and not is_author:
-                # Проверяем покупку работы (7-дневный доступ)
-                cur.execute(
-                    """SELECT id, created_at 
-                    FROM t_p63326274_course_download_plat.purchases 
-                    WHERE buyer_id = %s AND work_id = %s
-                    ORDER BY created_at DESC
-                    LIMIT 1""",
-                    (user_id, work_id)
-                )
-                purchase_result = cur.fetchone()
-                
-                if not purchase_result:
+            if not privileged:
+                if not purchased:
                     return {
                         'statusCode': 403,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -134,12 +496,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                purchase_date = purchase_result[1]
-                download_deadline = purchase_date + timedelta(days=7)
-                
                 # Проверяем, не истёк ли 7-дневный период
-                if datetime.now() > download_deadline:
-                    days_passed = (datetime.now() - purchase_date).days
+                if not purchase_active:
                     return {
                         'statusCode': 403,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -150,25 +508,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
             else:
-                print(f"[DEBUG] User is {'admin' if is_admin else 'author'} - skipping purchase check")
-            
-            # Записываем факт скачивания
-            cur.execute(
-                """INSERT INTO t_p63326274_course_download_plat.user_downloads 
-                (user_id, work_id, downloaded_at) 
-                VALUES (%s, %s, NOW())""",
-                (user_id, work_id)
-            )
-            conn.commit()
+                print("[DEBUG] User is admin or author - skipping purchase check")
             
-            # Токен уже проверен выше, просто получаем данные работы
-            cur.execute(
-                "SELECT title, download_url, file_url FROM t_p63326274_course_download_plat.works WHERE id = %s",
-                (work_id,)
-            )
-            work_result = cur.fetchone()
-            
-            if not work_result:
+            if not found_work_id:
                 return {
                     'statusCode': 404,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -176,17 +518,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            title = work_result[0]
-            download_url = work_result[1] or work_result[2]
-            
-            # Инкрементируем счётчик скачиваний
-            cur.execute("""
-                UPDATE t_p63326274_course_download_plat.works 
-                SET downloads_count = COALESCE(downloads_count, 0) + 1 
-                WHERE id = %s
-            """, (work_id,))
-            conn.commit()
-            
             print(f"[DEBUG] Work found: title={title}, download_url={download_url}")
             
             if not download_url:
@@ -218,6 +549,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         print(f"[DEBUG] Encoded URL: {encoded_url}")
         
+        if member:
+            return zip_member_response(encoded_url, member)
+        
         # Безопасное имя файла
         safe_name = ''.join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in title[:50])
         
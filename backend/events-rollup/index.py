@@ -0,0 +1,140 @@
+"""
+Business: Периодическая свёртка журнала events в производные таблицы
+Args: event - dict с httpMethod и X-Admin-Email (вызывается по таймеру или вручную из админки)
+      context - объект с request_id
+Returns: сколько событий свёрнуто
+"""
+import json
+import os
+import time
+from typing import Dict, Any
+
+import psycopg2
+
+SCHEMA = 't_p63326274_course_download_plat'
+ROLLUP_BATCH = 20000
+ROLLUP_MAX_BATCHES = 10
+# Транзакции, вставляющие события, короткие; свёртка не трогает последние секунды,
+# чтобы событие с меньшим id, зафиксированное позже, не оказалось за водяным знаком
+ROLLUP_LAG_SECONDS = 60
+SECURITY_EVENT_TYPES = ('price_manipulation',)
+# Скачивания, у которых работа и пользователь ещё существуют. У events нет внешних ключей,
+# а user_downloads ссылается на works и users: работа или пользователь, удалённые до свёртки
+# (delete-work, чистка фейковых пользователей), иначе сорвали бы пачку и остановили водяной знак
+DOWNLOAD_EVENTS_SQL = f"""
+    SELECT e.user_id, e.work_id, e.created_at FROM {SCHEMA}.events e
+    WHERE e.event_type = 'download' AND e.id > %s AND e.id <= %s
+      AND EXISTS (SELECT 1 FROM {SCHEMA}.works w WHERE w.id = e.work_id)
+      AND EXISTS (SELECT 1 FROM {SCHEMA}.users u WHERE u.id = e.user_id)
+"""
+ADMIN_EMAIL = 'rekrutiw@yandex.ru'
+
+
+def rollup_batch(cur) -> int:
+    """Свернуть одну пачку событий после водяного знака, вернуть число событий"""
+    cur.execute(
+        f"SELECT last_event_id FROM {SCHEMA}.events_rollup_state WHERE name = 'events' FOR UPDATE"
+    )
+    last_id = cur.fetchone()[0]
+
+    cur.execute(
+        f"""SELECT COUNT(*), MAX(id) FROM {SCHEMA}.events
+            WHERE id > %s AND id <= %s AND created_at < NOW() - make_interval(secs => %s)""",
+        (last_id, last_id + ROLLUP_BATCH, ROLLUP_LAG_SECONDS)
+    )
+    count, upper_id = cur.fetchone()
+    if not count:
+        return 0
+
+    window = (last_id, upper_id)
+
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.user_downloads (user_id, work_id, downloaded_at)
+            {DOWNLOAD_EVENTS_SQL}""",
+        window
+    )
+    cur.execute(
+        f"""UPDATE {SCHEMA}.works w
+            SET downloads_count = COALESCE(w.downloads_count, 0) + d.downloads
+            FROM (
+                SELECT work_id, COUNT(*) AS downloads FROM ({DOWNLOAD_EVENTS_SQL}) e
+                GROUP BY work_id
+            ) d
+            WHERE w.id = d.work_id""",
+        window
+    )
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.security_logs (user_id, event_type, details, ip_address, created_at)
+            SELECT user_id, event_type, details, ip_address, created_at FROM {SCHEMA}.events
+            WHERE event_type = ANY(%s) AND id > %s AND id <= %s""",
+        (list(SECURITY_EVENT_TYPES), *window)
+    )
+    cur.execute(
+        f"""UPDATE {SCHEMA}.events_rollup_state
+            SET last_event_id = %s, updated_at = NOW()
+            WHERE name = 'events'""",
+        (upper_id,)
+    )
+    return count
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    # Вызов таймером приходит без httpMethod — не через HTTP, проверка админа ему не нужна
+    from_timer = 'httpMethod' not in event
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Email'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = event.get('headers') or {}
+    admin_email = headers.get('X-Admin-Email') or headers.get('x-admin-email')
+    if not from_timer and admin_email != ADMIN_EMAIL:
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Unauthorized'}),
+            'isBase64Encoded': False
+        }
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    started = time.monotonic()
+    total = 0
+
+    try:
+        # Партиция на следующий месяц создаётся заранее, чтобы события не уходили в DEFAULT
+        cur.execute(
+            f"SELECT {SCHEMA}.ensure_events_partition((CURRENT_DATE + INTERVAL '1 month')::date)"
+        )
+        conn.commit()
+
+        for _ in range(ROLLUP_MAX_BATCHES):
+            rolled = rollup_batch(cur)
+            conn.commit()
+            total += rolled
+            if not rolled:
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    print(f"📊 Свёрнуто событий: {total} за {int((time.monotonic() - started) * 1000)} мс")
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'success': True, 'rolled_up': total}),
+        'isBase64Encoded': False
+    }
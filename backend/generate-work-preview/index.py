@@ -1,13 +1,353 @@
 import json
 import os
+import re
+import hashlib
 import zipfile
 import tempfile
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import requests
 import boto3
 from docx import Document
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 import io
+import numpy as np
+
+try:
+    # AVIF в Pillow до 11-й версии — только через плагин; без него производные только в WebP
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Архив не скачивается целиком: zipfile читает центральный каталог и один .docx через Range
+RANGE_BUFFER_BYTES = 256 * 1024
+RANGE_TIMEOUT = 60
+MAX_DOCX_BYTES = 50 * 1024 * 1024
+# Признаки пояснительной записки в имени файла и документов, которые ею точно не являются
+PZ_NAME_HINTS = ('пз', 'пояснит', 'записк', 'курсов', 'диплом', 'вкр', 'отчет', 'отчёт', 'работа')
+NOT_PZ_NAME_HINTS = ('титул', 'задание', 'рецензи', 'отзыв', 'презентац', 'доклад', 'аннотац',
+                     'антиплагиат', 'бланк', 'заявлени')
+# Ключ кэша превью — SHA-256 документа + рендерер; версию повышаем при любом изменении вида превью
+PREVIEW_RENDERER = 'docx-toc'
+PREVIEW_RENDERER_VERSION = 1
+# Производные превью и обложек для srcset: ширины в пикселях, больше исходника не растягиваем
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_FORMATS = (
+    ('AVIF', 'avif', 'image/avif', {'quality': 55}),
+    ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+)
+# Плейсхолдер BlurHash: компонент по длинной стороне и по короткой, стороны уменьшенной копии
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE_SIZE = 32
+BLURHASH_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+S3_BUCKET = 'kyra'
+S3_PUBLIC_URL = f'https://storage.yandexcloud.net/{S3_BUCKET}/'
+
+
+class HttpRangeFile(io.RawIOBase):
+    """Файл только для чтения поверх HTTP Range: seek/read без скачивания всего объекта"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session = requests.Session()
+        self.position = 0
+        self.bytes_read = 0
+        # stream=True: сервер без Range ответит 200 со всем архивом, тело не читаем
+        with self.session.get(url, headers={'Range': 'bytes=0-0'}, timeout=RANGE_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+        match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+        if response.status_code != 206 or not match:
+            raise ValueError('Range requests are not supported for this file')
+        self.size = int(match.group(1))
+        self.fingerprint = archive_fingerprint(response.headers, self.size)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        if self.position >= self.size or not len(buffer):
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.session.get(self.url, headers={'Range': f'bytes={self.position}-{end}'},
+                                    timeout=RANGE_TIMEOUT)
+        response.raise_for_status()
+        data = response.content
+        buffer[:len(data)] = data
+        self.position += len(data)
+        self.bytes_read += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self.session.close()
+        super().close()
+
+
+def archive_fingerprint(headers, size: int) -> Optional[str]:
+    """Версия архива по ETag (или Last-Modified) и размеру — меняется при перезаливке"""
+    version = headers.get('ETag') or headers.get('Last-Modified')
+    return version.strip('"') + f':{size}' if version else None
+
+
+def open_remote_archive(file_url: str, temp_dir: str) -> Tuple[Any, Optional[str]]:
+    """
+    Файловый объект архива для zipfile и его версия. Через Range читаются только
+    нужные части; без поддержки Range архив потоком пишется во временный файл
+    """
+    try:
+        remote = HttpRangeFile(file_url)
+        return io.BufferedReader(remote, buffer_size=RANGE_BUFFER_BYTES), remote.fingerprint
+    except ValueError as e:
+        print(f"{e}, downloading archive to disk")
+
+    zip_path = os.path.join(temp_dir, 'work.zip')
+    size = 0
+    with requests.get(file_url, stream=True, timeout=RANGE_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(zip_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=RANGE_BUFFER_BYTES):
+                f.write(chunk)
+                size += len(chunk)
+    return open(zip_path, 'rb'), archive_fingerprint(response.headers, size)
+
+
+def extract_member(zip_ref: zipfile.ZipFile, member: zipfile.ZipInfo, target_path: str) -> str:
+    """Потоком распаковать элемент в файл, попутно посчитав SHA-256 содержимого"""
+    digest = hashlib.sha256()
+    with zip_ref.open(member) as source, open(target_path, 'wb') as target:
+        while True:
+            chunk = source.read(RANGE_BUFFER_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+    return digest.hexdigest()
+
+
+def find_preview_artifact(cur, source_sha256: str) -> Optional[List[str]]:
+    """URL готового превью этого документа для текущей версии рендерера"""
+    cur.execute(
+        """SELECT preview_urls FROM t_p63326274_course_download_plat.preview_artifacts
+           WHERE source_sha256 = %s AND renderer = %s AND renderer_version = %s""",
+        (source_sha256, PREVIEW_RENDERER, PREVIEW_RENDERER_VERSION)
+    )
+    row = cur.fetchone()
+    return row[0] if row and row[0] else None
+
+
+def save_preview_artifact(cur, source_sha256: str, preview_urls: List[str], member: zipfile.ZipInfo,
+                          image_variants: Optional[Dict[str, Any]] = None) -> None:
+    cur.execute(
+        """INSERT INTO t_p63326274_course_download_plat.preview_artifacts
+               (source_sha256, renderer, renderer_version, preview_urls, source_name, source_size, image_variants)
+           VALUES (%s, %s, %s, %s, %s, %s, %s)
+           ON CONFLICT (source_sha256, renderer, renderer_version)
+           DO UPDATE SET preview_urls = EXCLUDED.preview_urls, image_variants = EXCLUDED.image_variants,
+                         created_at = NOW()""",
+        (source_sha256, PREVIEW_RENDERER, PREVIEW_RENDERER_VERSION, json.dumps(preview_urls),
+         member_name(member), member.file_size, json.dumps(image_variants) if image_variants else None)
+    )
+
+
+def save_work_preview(cur, work_id, preview_urls: List[str], source_sha256: str,
+                      fingerprint: Optional[str]) -> None:
+    """Превью работы; производные копируются из preview_artifacts, поэтому артефакт сохраняется раньше"""
+    cur.execute(
+        """UPDATE t_p63326274_course_download_plat.works w
+           SET preview_image_url = %s, preview_urls = %s,
+               preview_source_sha256 = %s, preview_archive_etag = %s, preview_renderer = %s,
+               image_variants = COALESCE(w.image_variants, '{}'::jsonb) || jsonb_build_object('preview', (
+                   SELECT pa.image_variants FROM t_p63326274_course_download_plat.preview_artifacts pa
+                   WHERE pa.source_sha256 = %s AND pa.renderer = %s AND pa.renderer_version = %s))
+           WHERE w.id = %s""",
+        (preview_urls[0], json.dumps(preview_urls), source_sha256, fingerprint, PREVIEW_RENDERER,
+         source_sha256, PREVIEW_RENDERER, PREVIEW_RENDERER_VERSION, work_id)
+    )
+
+
+def derivative_formats() -> List[Tuple[str, str, str, Dict[str, Any]]]:
+    """Форматы производных, которые умеет кодировать установленный Pillow"""
+    Image.init()
+    return [fmt for fmt in DERIVATIVE_FORMATS if fmt[0] in Image.SAVE]
+
+
+def file_md5(path: str) -> str:
+    """MD5 содержимого — совпадает с ETag объекта S3, загруженного одним запросом"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(RANGE_BUFFER_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_image_variants(source_path: str, out_dir: str, name: str) -> Dict[str, Any]:
+    """
+    Производные изображения за одно декодирование: все ширины и форматы пишутся в out_dir.
+    Только CPU и диск — в пакетном конвейере выполняется в процессе рендеринга
+    """
+    version = file_md5(source_path)
+    with Image.open(source_path) as img:
+        # JPEG сразу декодируется с уменьшением в 2/4/8 раз, если самая большая ширина это позволяет
+        img.draft('RGB', (max(DERIVATIVE_WIDTHS), max(DERIVATIVE_WIDTHS) * img.height // max(img.width, 1)))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    width, height = img.size
+    blurhash = encode_blurhash(img)
+
+    files = []
+    for target in sorted({min(w, width) for w in DERIVATIVE_WIDTHS}):
+        resized = img if target == width else img.resize(
+            (target, max(1, round(height * target / width))), Image.LANCZOS)
+        for pil_format, ext, mime, options in derivative_formats():
+            path = os.path.join(out_dir, f'{name}_w{target}.{ext}')
+            resized.save(path, pil_format, **options)
+            files.append({'width': target, 'ext': ext, 'mime': mime, 'path': path})
+    return {'width': width, 'height': height, 'version': version, 'blurhash': blurhash, 'files': files}
+
+
+def base83(value: int, length: int) -> str:
+    return ''.join(BLURHASH_ALPHABET[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def encode_blurhash(img: Image.Image) -> str:
+    """
+    BlurHash изображения (~30 символов): косинусное разложение уменьшенной копии.
+    Все компоненты считаются одним einsum по массиву пикселей, без циклов по пикселям
+    """
+    sample = img.copy()
+    sample.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE), Image.BOX)
+    if sample.mode == 'RGBA':
+        # Прозрачные области — на белом фоне, как их видно в карточке
+        background = Image.new('RGB', sample.size, (255, 255, 255))
+        background.paste(sample, mask=sample.getchannel('A'))
+        sample = background
+    pixels = np.asarray(sample, dtype=np.float64) / 255.0
+    linear = np.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+    height, width = linear.shape[:2]
+
+    long_side, short_side = BLURHASH_COMPONENTS
+    components_x, components_y = (long_side, short_side) if width >= height else (short_side, long_side)
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    # factors[j, i] — вклад cos(πix/W)·cos(πjy/H) в каждый канал
+    factors = np.einsum('jy,ix,yxc->jic', basis_y, basis_x, linear) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    dc_srgb = np.clip(dc, 0, 1)
+    dc_srgb = np.where(dc_srgb <= 0.0031308, dc_srgb * 12.92, 1.055 * dc_srgb ** (1 / 2.4) - 0.055)
+    r, g, b = (int(v) for v in np.floor(dc_srgb * 255 + 0.5))
+
+    result = base83(components_x - 1 + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += base83(quantised_max, 1) + base83((r << 16) + (g << 8) + b, 4)
+
+    scaled = ac / max_value
+    quantised = np.clip(np.floor(np.sign(scaled) * np.abs(scaled) ** 0.5 * 9 + 9.5), 0, 18).astype(int)
+    for qr, qg, qb in quantised:
+        result += base83(int(qr) * 19 * 19 + int(qg) * 19 + int(qb), 2)
+    return result
+
+
+def derivative_base_key(source_url: str) -> str:
+    """Ключ S3 без расширения, рядом с которым лежат производные: для своих объектов — рядом с исходником"""
+    if source_url.startswith(S3_PUBLIC_URL):
+        return os.path.splitext(source_url[len(S3_PUBLIC_URL):].split('?', 1)[0])[0]
+    return 'derivatives/external/' + hashlib.sha1(source_url.encode('utf-8')).hexdigest()
+
+
+def upload_image_variants(s3_client, source_url: str, rendered: Dict[str, Any],
+                          source_etag: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Выгрузить производные под ключами {base}_{md5[:12]}_w{width}.{ext} и собрать карту для srcset.
+    Хэш содержимого в ключе: перезалитый под тем же URL исходник получает новые ключи, а не
+    подменяет закэшированные навсегда (immutable) старые. version / etag — для проверки свежести
+    """
+    base_key = f"{derivative_base_key(source_url)}_{rendered['version'][:12]}"
+    srcset: Dict[str, List[str]] = {}
+    for item in rendered['files']:
+        key = f"{base_key}_w{item['width']}.{item['ext']}"
+        s3_client.upload_file(
+            item['path'], S3_BUCKET, key,
+            ExtraArgs={'ACL': 'public-read', 'ContentType': item['mime'],
+                       'CacheControl': 'public, max-age=31536000, immutable'}
+        )
+        srcset.setdefault(item['mime'], []).append(f"{S3_PUBLIC_URL}{key} {item['width']}w")
+    return {
+        'src': source_url,
+        'width': rendered['width'],
+        'height': rendered['height'],
+        'version': rendered['version'],
+        'etag': source_etag or rendered['version'],
+        'blurhash': rendered['blurhash'],
+        'srcset': {mime: ', '.join(entries) for mime, entries in srcset.items()},
+    }
+
+
+def get_s3_client():
+    return boto3.client(
+        's3',
+        endpoint_url='https://storage.yandexcloud.net',
+        aws_access_key_id=os.environ.get('YANDEX_S3_KEY_ID'),
+        aws_secret_access_key=os.environ.get('YANDEX_S3_SECRET_KEY'),
+        region_name='ru-central1'
+    )
+
+
+def member_name(info: zipfile.ZipInfo) -> str:
+    """Имя элемента: без флага UTF-8 zipfile декодирует cp437, а Windows-архиваторы пишут cp866"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('cp866')
+    except UnicodeError:
+        return info.filename
+
+
+def pz_score(name: str) -> int:
+    base = os.path.basename(name).lower()
+    score = sum(2 for hint in PZ_NAME_HINTS if hint in base)
+    score -= sum(5 for hint in NOT_PZ_NAME_HINTS if hint in base)
+    return score
+
+
+def pick_pz_member(zf: zipfile.ZipFile) -> Optional[zipfile.ZipInfo]:
+    """
+    Выбрать пояснительную записку по центральному каталогу, ничего не распаковывая:
+    сначала по признакам в имени, при равенстве — самый большой документ
+    """
+    candidates = []
+    for info in zf.infolist():
+        name = member_name(info)
+        base = os.path.basename(name)
+        if info.is_dir() or not base.lower().endswith('.docx') or base.startswith('~$'):
+            continue
+        if base.startswith('._') or '__MACOSX/' in name or info.file_size > MAX_DOCX_BYTES:
+            continue
+        candidates.append((pz_score(name), info.file_size, info))
+
+    if not candidates:
+        return None
+    return max(candidates, key=lambda item: item[:2])[2]
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -30,7 +370,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    work_id = event.get('queryStringParameters', {}).get('work_id')
+    params = event.get('queryStringParameters') or {}
+    work_id = params.get('work_id')
+    # force=1 — перерисовать, даже если превью этого документа уже есть в кэше
+    force = params.get('force') == '1'
     
     if not work_id:
         return {
@@ -50,9 +393,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cur = conn.cursor()
         
         # Получаем информацию о работе
+        # ETag архива учитывается, только если текущее превью построено этим же рендерером
         cur.execute(
-            "SELECT title, file_url FROM t_p63326274_course_download_plat.works WHERE id = %s",
-            (work_id,)
+            """SELECT title, file_url,
+                      CASE WHEN preview_renderer = %s THEN preview_archive_etag END,
+                      preview_source_sha256
+               FROM t_p63326274_course_download_plat.works WHERE id = %s""",
+            (PREVIEW_RENDERER, work_id)
         )
         
         result = cur.fetchone()
@@ -70,7 +417,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        title, file_url = result
+        title, file_url, archive_etag, source_sha256 = result
         
         if not file_url:
             cur.close()
@@ -85,60 +432,58 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # Скачиваем ZIP архив
-        print(f"Downloading ZIP from {file_url}")
-        zip_response = requests.get(file_url, timeout=60)
-        zip_response.raise_for_status()
-        
         preview_urls = []
+        cache_hit = None
         
-        # Обрабатываем ZIP архив
+        # Обрабатываем ZIP архив: во временный каталог попадает только выбранный .docx
         with tempfile.TemporaryDirectory() as temp_dir:
-            zip_path = os.path.join(temp_dir, 'work.zip')
-            with open(zip_path, 'wb') as f:
-                f.write(zip_response.content)
-            
-            # Распаковываем ZIP
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            print(f"Reading ZIP directory from {file_url}")
+            archive, fingerprint = open_remote_archive(file_url, temp_dir)
             
-            # Ищем Word файлы
-            docx_files = []
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    if file.endswith('.docx') and not file.startswith('~$'):
-                        docx_files.append(os.path.join(root, file))
+            # Архив не менялся с прошлого рендера — хватает поиска в preview_artifacts
+            if not force and fingerprint and fingerprint == archive_etag and source_sha256:
+                preview_urls = find_preview_artifact(cur, source_sha256) or []
+                cache_hit = 'archive' if preview_urls else None
             
-            if not docx_files:
-                cur.close()
-                conn.close()
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'No Word files found in archive'}),
-                    'isBase64Encoded': False
-                }
-            
-            # Берем первый Word файл (обычно это ПЗ)
-            docx_path = docx_files[0]
-            print(f"Processing Word file: {docx_path}")
-            
-            # Создаем превью изображение из DOCX
-            preview_url = create_formatted_preview(docx_path, work_id, temp_dir)
-            if preview_url:
-                preview_urls.append(preview_url)
+            if not preview_urls:
+                with archive, zipfile.ZipFile(archive) as zip_ref:
+                    member = pick_pz_member(zip_ref)
+                    
+                    if not member:
+                        cur.close()
+                        conn.close()
+                        return {
+                            'statusCode': 404,
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': json.dumps({'error': 'No Word files found in archive'}),
+                            'isBase64Encoded': False
+                        }
+                    
+                    docx_path = os.path.join(temp_dir, 'document.docx')
+                    print(f"Processing Word file: {member_name(member)} ({member.file_size} bytes)")
+                    source_sha256 = extract_member(zip_ref, member, docx_path)
+                
+                # Тот же документ мог уже встречаться в другой работе или в прошлой версии архива
+                preview_urls = [] if force else (find_preview_artifact(cur, source_sha256) or [])
+                cache_hit = 'document' if preview_urls else None
+                
+                if not preview_urls:
+                    # Создаем превью изображение из DOCX вместе с производными для srcset
+                    preview_url, image_variants = create_formatted_preview(docx_path, source_sha256, temp_dir)
+                    if preview_url:
+                        preview_urls.append(preview_url)
+                        save_preview_artifact(cur, source_sha256, preview_urls, member, image_variants)
+            else:
+                archive.close()
+        
+        print(f"Preview for work {work_id}: {'cache hit (' + cache_hit + ')' if cache_hit else 'rendered'}")
         
         # Обновляем БД с первым скриншотом и массивом всех URL
         if preview_urls:
-            import json as json_lib
-            urls_json = json_lib.dumps(preview_urls)
-            cur.execute(
-                "UPDATE t_p63326274_course_download_plat.works SET preview_image_url = %s, preview_urls = %s WHERE id = %s",
-                (preview_urls[0], urls_json, work_id)
-            )
+            save_work_preview(cur, work_id, preview_urls, source_sha256, fingerprint)
             conn.commit()
         
         cur.close()
@@ -153,7 +498,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({
                 'preview_urls': preview_urls,
                 'pages_found': len(preview_urls),
-                'work_id': work_id
+                'work_id': work_id,
+                'cached': cache_hit
             }),
             'isBase64Encoded': False
         }
@@ -173,133 +519,144 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 
-def create_formatted_preview(docx_path: str, work_id: str, temp_dir: str) -> Optional[str]:
-    """Создает красиво отформатированное превью из DOCX"""
+def create_formatted_preview(docx_path: str, source_sha256: str,
+                             temp_dir: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Создает красиво отформатированное превью из DOCX и загружает его в S3 вместе с производными"""
     try:
-        doc = Document(docx_path)
-        
-        # Ищем содержание
-        content_lines = []
-        found_content = False
-        
-        for i, para in enumerate(doc.paragraphs):
-            text = para.text.strip()
-            text_lower = text.lower()
-            
-            # Нашли начало содержания
-            if not found_content and any(kw in text_lower for kw in ['содержание', 'оглавление']):
-                found_content = True
-                content_lines.append(('title', text))
-                continue
-            
-            # Собираем строки содержания
-            if found_content:
-                if text and len(text) > 2:
-                    # Проверяем, не начался ли новый раздел (введение и т.д.)
-                    if any(kw in text_lower for kw in ['введение', 'глава', 'раздел', 'список']):
-                        if 'введение' in text_lower:
-                            content_lines.append(('title', text))
-                        break
-                    
-                    # Это строка содержания
-                    content_lines.append(('item', text))
-                
-                # Ограничиваем количество строк
-                if len(content_lines) > 30:
-                    break
-        
-        if not content_lines:
-            # Если не нашли содержание, берем первые 20 строк
-            for para in doc.paragraphs[:20]:
-                if para.text.strip():
-                    content_lines.append(('item', para.text.strip()))
+        img_path = os.path.join(temp_dir, 'preview_content.png')
+        render_formatted_preview(docx_path, img_path)
         
-        # Создаем изображение
-        img_width = 850
-        img_height = 1200
-        img = Image.new('RGB', (img_width, img_height), color='white')
-        draw = ImageDraw.Draw(img)
+        # Загружаем в S3
+        preview_url = upload_to_s3(img_path, source_sha256, 0)
+        if not preview_url:
+            return None, None
         
-        # Загружаем шрифты
+        # Без производных превью всё равно годится: карточка покажет исходный PNG
         try:
-            font_regular = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 13)
-            font_title = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 14)
-        except:
-            font_regular = ImageFont.load_default()
-            font_title = ImageFont.load_default()
+            rendered = render_image_variants(img_path, temp_dir, 'preview')
+            return preview_url, upload_image_variants(get_s3_client(), preview_url, rendered)
+        except Exception as e:
+            print(f"Error creating image variants: {e}")
+            return preview_url, None
         
-        y = 50
-        x_margin = 60
+    except Exception as e:
+        print(f"Error creating formatted preview: {e}")
+        import traceback
+        traceback.print_exc()
+        return None, None
+
+
+def render_formatted_preview(docx_path: str, img_path: str) -> None:
+    """Рисует превью содержания из DOCX в PNG: только CPU и диск, без сети и БД"""
+    doc = Document(docx_path)
+    
+    # Ищем содержание
+    content_lines = []
+    found_content = False
+    
+    for i, para in enumerate(doc.paragraphs):
+        text = para.text.strip()
+        text_lower = text.lower()
+        
+        # Нашли начало содержания
+        if not found_content and any(kw in text_lower for kw in ['содержание', 'оглавление']):
+            found_content = True
+            content_lines.append(('title', text))
+            continue
         
-        for line_type, text in content_lines:
-            if y > img_height - 100:
+        # Собираем строки содержания
+        if found_content:
+            if text and len(text) > 2:
+                # Проверяем, не начался ли новый раздел (введение и т.д.)
+                if any(kw in text_lower for kw in ['введение', 'глава', 'раздел', 'список']):
+                    if 'введение' in text_lower:
+                        content_lines.append(('title', text))
+                    break
+                
+                # Это строка содержания
+                content_lines.append(('item', text))
+            
+            # Ограничиваем количество строк
+            if len(content_lines) > 30:
                 break
+    
+    if not content_lines:
+        # Если не нашли содержание, берем первые 20 строк
+        for para in doc.paragraphs[:20]:
+            if para.text.strip():
+                content_lines.append(('item', para.text.strip()))
+    
+    # Создаем изображение
+    img_width = 850
+    img_height = 1200
+    img = Image.new('RGB', (img_width, img_height), color='white')
+    draw = ImageDraw.Draw(img)
+    
+    # Загружаем шрифты
+    try:
+        font_regular = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 13)
+        font_title = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 14)
+    except:
+        font_regular = ImageFont.load_default()
+        font_title = ImageFont.load_default()
+    
+    y = 50
+    x_margin = 60
+    
+    for line_type, text in content_lines:
+        if y > img_height - 100:
+            break
+        
+        if line_type == 'title':
+            # Заголовок (Содержание, Введение)
+            draw.text((img_width // 2 - 60, y), text, fill='black', font=font_title)
+            y += 35
+        else:
+            # Строка содержания
+            # Разбиваем на номер/название и номер страницы
+            parts = text.rsplit('.', 1)
             
-            if line_type == 'title':
-                # Заголовок (Содержание, Введение)
-                draw.text((img_width // 2 - 60, y), text, fill='black', font=font_title)
-                y += 35
-            else:
-                # Строка содержания
-                # Разбиваем на номер/название и номер страницы
-                parts = text.rsplit('.', 1)
+            if len(parts) == 2 and parts[1].strip().isdigit():
+                # Есть номер страницы
+                title_part = parts[0]
+                page_num = parts[1].strip()
                 
-                if len(parts) == 2 and parts[1].strip().isdigit():
-                    # Есть номер страницы
-                    title_part = parts[0]
-                    page_num = parts[1].strip()
-                    
-                    # Рисуем название
-                    draw.text((x_margin, y), title_part, fill='black', font=font_regular)
-                    
-                    # Рисуем точки
-                    title_width = draw.textlength(title_part, font=font_regular)
-                    dots_start = x_margin + title_width + 10
-                    dots_end = img_width - x_margin - 40
-                    dot_spacing = 5
-                    
-                    for x_dot in range(int(dots_start), int(dots_end), dot_spacing):
-                        draw.text((x_dot, y + 8), '.', fill='black', font=font_regular)
-                    
-                    # Рисуем номер страницы
-                    draw.text((dots_end + 5, y), page_num, fill='black', font=font_regular)
-                else:
-                    # Нет номера страницы, просто текст
-                    draw.text((x_margin, y), text[:90], fill='black', font=font_regular)
+                # Рисуем название
+                draw.text((x_margin, y), title_part, fill='black', font=font_regular)
                 
-                y += 22
-        
-        # Водяной знак
-        watermark = "ПРЕВЬЮ"
-        watermark_width = draw.textlength(watermark, font=font_title)
-        draw.text((img_width - watermark_width - 50, img_height - 50), watermark, fill=(220, 220, 220), font=font_title)
-        
-        img_path = os.path.join(temp_dir, 'preview_content.png')
-        img.save(img_path, 'PNG')
-        
-        # Загружаем в S3
-        return upload_to_s3(img_path, work_id, 0)
-        
-    except Exception as e:
-        print(f"Error creating formatted preview: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+                # Рисуем точки
+                title_width = draw.textlength(title_part, font=font_regular)
+                dots_start = x_margin + title_width + 10
+                dots_end = img_width - x_margin - 40
+                dot_spacing = 5
+                
+                for x_dot in range(int(dots_start), int(dots_end), dot_spacing):
+                    draw.text((x_dot, y + 8), '.', fill='black', font=font_regular)
+                
+                # Рисуем номер страницы
+                draw.text((dots_end + 5, y), page_num, fill='black', font=font_regular)
+            else:
+                # Нет номера страницы, просто текст
+                draw.text((x_margin, y), text[:90], fill='black', font=font_regular)
+            
+            y += 22
+    
+    # Водяной знак
+    watermark = "ПРЕВЬЮ"
+    watermark_width = draw.textlength(watermark, font=font_title)
+    draw.text((img_width - watermark_width - 50, img_height - 50), watermark, fill=(220, 220, 220), font=font_title)
+    
+    img.save(img_path, 'PNG')
 
 
-def upload_to_s3(image_path: str, work_id: str, page_num: int) -> Optional[str]:
-    """Загружает изображение в S3 и возвращает публичный URL"""
+def upload_to_s3(image_path: str, source_sha256: str, page_num: int) -> Optional[str]:
+    """Загружает изображение в S3 и возвращает публичный URL; имя объекта зависит от содержимого документа"""
     try:
-        s3_client = boto3.client(
-            's3',
-            endpoint_url='https://storage.yandexcloud.net',
-            aws_access_key_id=os.environ.get('YANDEX_S3_KEY_ID'),
-            aws_secret_access_key=os.environ.get('YANDEX_S3_SECRET_KEY'),
-            region_name='ru-central1'
-        )
+        s3_client = get_s3_client()
         
-        bucket_name = 'kyra'
-        object_name = f'previews/work_{work_id}_page_{page_num}.png'
+        bucket_name = S3_BUCKET
+        object_name = (f'previews/{PREVIEW_RENDERER}/{source_sha256[:2]}/'
+                       f'{source_sha256}_v{PREVIEW_RENDERER_VERSION}_page_{page_num}.png')
         
         s3_client.upload_file(
             image_path,
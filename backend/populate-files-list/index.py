@@ -1,17 +1,54 @@
 import json
 import os
-from typing import Dict, Any, List
+import re
+import struct
+from typing import Dict, Any, List, Optional, Tuple
 import urllib.parse
 import urllib.request
+import time
 import zipfile
 import io
+import lzma
+from concurrent.futures import ThreadPoolExecutor
+
+# Из архива читаются только хвост с End-of-Central-Directory и центральный каталог.
+# Обычно EOCD в последних 22 байтах; длинный комментарий архива может сдвинуть его на 64 КБ
+ZIP_TAIL_BYTES = 8 * 1024
+ZIP_MAX_TAIL_BYTES = 64 * 1024 + 22
+RANGE_TIMEOUT = 30
+
+# RAR и 7z читаются только по заголовкам, данные файлов не скачиваются и не распаковываются
+HEADER_WINDOW_BYTES = 16 * 1024
+RAR4_SIGNATURE = b'Rar!\x1a\x07\x00'
+RAR5_SIGNATURE = b'Rar!\x1a\x07\x01\x00'
+SEVEN_ZIP_SIGNATURE = b'7z\xbc\xaf\x27\x1c'
+SEVEN_ZIP_START_HEADER = 32
+
+SCHEMA = 't_p63326274_course_download_plat'
+# Листинг архива — это несколько Range-запросов, время уходит на сеть, а не на CPU
+POPULATE_WORKERS = 8
+POPULATE_CHUNK_SIZE = 32
+# Бюджет одного вызова с запасом до таймаута функции; между чанками курсор уже сохранён
+POPULATE_TIME_BUDGET = 20.0
+# Сетевые ошибки повторяются в следующих проходах, но не бесконечно; ссылка не на архив
+# и пустой архив не повторяются совсем. Новая ссылка на архив сбрасывает счётчик
+POPULATE_MAX_ATTEMPTS = 3
+ARCHIVE_URL_SQL = "COALESCE(NULLIF(w.download_url, ''), w.file_url)"
+PENDING_WORKS_FILTER = f'''
+    AND (w.download_url IS NOT NULL OR w.file_url IS NOT NULL)
+    AND (w.files_list IS NULL OR w.files_list = '[]'::jsonb)
+    AND NOT (w.files_list_attempts >= {POPULATE_MAX_ATTEMPTS}
+             AND w.files_list_failed_url IS NOT DISTINCT FROM {ARCHIVE_URL_SQL})
+'''
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Обновление списка файлов для всех работ в каталоге
-    Args: event с httpMethod
+    Заполнение files_list для работ каталога с продолжением с места остановки
+    Args: event с httpMethod (POST — обработать очередную порцию, GET — прогресс),
+          queryStringParameters: restart=1 начинает проход заново, budget — секунды на вызов
           context с request_id
-    Returns: HTTP response с количеством обновленных работ
+    Returns: HTTP response с числом обновлённых работ, курсором и скоростью
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -20,7 +57,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Max-Age': '86400'
             },
@@ -28,7 +65,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    if method != 'POST':
+    if method not in ('GET', 'POST'):
         return {
             'statusCode': 405,
             'headers': {
@@ -39,6 +76,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
+    params = event.get('queryStringParameters') or {}
+    
+    try:
+        budget = min(float(params.get('budget') or POPULATE_TIME_BUDGET), POPULATE_TIME_BUDGET)
+    except ValueError:
+        budget = 0
+    if method == 'POST' and not budget > 0:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'budget must be a positive number of seconds'})
+        }
+    
     try:
         import psycopg2
         dsn = os.environ.get('DATABASE_URL')
@@ -48,86 +102,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         conn = psycopg2.connect(dsn)
         cur = conn.cursor()
         
-        # Получаем все работы с download_url или file_url
-        cur.execute("""
-            SELECT id, title, download_url, file_url 
-            FROM t_p63326274_course_download_plat.works 
-            WHERE (download_url IS NOT NULL OR file_url IS NOT NULL)
-            AND (files_list IS NULL OR files_list = '[]'::jsonb)
-            LIMIT 100
-        """)
-        
-        works = cur.fetchall()
-        updated_count = 0
-        errors = []
-        
-        for work_id, title, download_url, file_url in works:
-            archive_url = download_url or file_url
-            if not archive_url:
-                continue
-            
-            try:
-                # Кодируем URL (кириллицу и пробелы)
-                parsed = urllib.parse.urlparse(archive_url)
-                encoded_path = urllib.parse.quote(parsed.path.encode('utf-8'), safe='/')
-                encoded_url = urllib.parse.urlunparse((
-                    parsed.scheme,
-                    parsed.netloc,
-                    encoded_path,
-                    parsed.params,
-                    parsed.query,
-                    parsed.fragment
-                ))
-                
-                # Скачиваем архив
-                req = urllib.request.Request(encoded_url)
-                req.add_header('User-Agent', 'Mozilla/5.0')
-                
-                with urllib.request.urlopen(req, timeout=30) as response:
-                    archive_data = response.read()
-                
-                files_list = []
-                
-                # Определяем тип архива и извлекаем список файлов
-                if archive_url.lower().endswith('.zip'):
-                    with zipfile.ZipFile(io.BytesIO(archive_data)) as zf:
-                        for file_info in zf.filelist:
-                            if not file_info.is_dir():
-                                file_name = file_info.filename.split('/')[-1]
-                                files_list.append({
-                                    'name': file_name,
-                                    'type': get_file_type(file_name),
-                                    'size': file_info.file_size
-                                })
-                
-                elif archive_url.lower().endswith('.rar'):
-                    # Для RAR используем простой парсинг (без распаковки)
-                    # В продакшене можно добавить unrar
-                    files_list.append({
-                        'name': 'Архив RAR',
-                        'type': 'archive',
-                        'size': len(archive_data)
-                    })
-                
-                # Обновляем БД
-                if files_list:
-                    files_json = json.dumps(files_list, ensure_ascii=False)
-                    cur.execute(
-                        "UPDATE t_p63326274_course_download_plat.works SET files_list = %s WHERE id = %s",
-                        (files_json, work_id)
-                    )
-                    updated_count += 1
-                    print(f"Updated work {work_id}: {len(files_list)} files")
-            
-            except Exception as e:
-                error_msg = f"Work {work_id} ({title[:50]}): {str(e)}"
-                errors.append(error_msg)
-                print(f"Error: {error_msg}")
-                continue
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        try:
+            if method == 'GET':
+                result = load_progress(cur)
+            else:
+                result = populate_files(conn, cur, restart=params.get('restart') == '1', budget=budget)
+        finally:
+            cur.close()
+            conn.close()
         
         return {
             'statusCode': 200,
@@ -136,11 +118,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'isBase64Encoded': False,
-            'body': json.dumps({
-                'updated': updated_count,
-                'total': len(works),
-                'errors': errors[:10]  # Первые 10 ошибок
-            })
+            'body': json.dumps(result, default=str)
         }
     
     except Exception as e:
@@ -158,6 +136,766 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 
+def encode_archive_url(archive_url: str) -> str:
+    '''Кодируем URL (кириллицу и пробелы)'''
+    parsed = urllib.parse.urlparse(archive_url)
+    encoded_path = urllib.parse.quote(parsed.path.encode('utf-8'), safe='/')
+    return urllib.parse.urlunparse((
+        parsed.scheme,
+        parsed.netloc,
+        encoded_path,
+        parsed.params,
+        parsed.query,
+        parsed.fragment
+    ))
+
+
+def build_files_list(archive_url: str) -> List[Dict[str, Any]]:
+    '''Список файлов архива работы в формате works.files_list'''
+    if not archive_url.lower().endswith(('.zip', '.rar', '.7z')):
+        return []
+    
+    files_list = []
+    for file_path, file_size in list_remote_archive(encode_archive_url(archive_url)):
+        file_name = file_path.split('/')[-1]
+        files_list.append({
+            'name': file_name,
+            'type': get_file_type(file_name),
+            'size': file_size
+        })
+    return files_list
+
+
+def fetch_files_list(work: Tuple[int, str, Optional[str], Optional[str]]) -> Tuple[int, Optional[List[Dict[str, Any]]], Optional[str]]:
+    '''Задача пула: (work_id, files_list, ошибка) — исключения не выходят за пределы потока'''
+    work_id, title, download_url, file_url = work
+    try:
+        return work_id, build_files_list(download_url or file_url), None
+    except Exception as e:
+        return work_id, None, f"Work {work_id} ({(title or '')[:50]}): {str(e)}"
+
+
+def load_progress(cur) -> Dict[str, Any]:
+    '''Состояние текущего прохода: курсор, счётчики, сколько работ осталось и сколько исключено'''
+    cur.execute(f"""
+        SELECT s.last_work_id, s.processed, s.updated, s.failed, s.pass_started_at, s.updated_at,
+               (SELECT COUNT(*) FROM {SCHEMA}.works w
+                WHERE w.id > s.last_work_id {PENDING_WORKS_FILTER}),
+               (SELECT COUNT(*) FROM {SCHEMA}.works w
+                WHERE (w.files_list IS NULL OR w.files_list = '[]'::jsonb)
+                  AND w.files_list_attempts >= {POPULATE_MAX_ATTEMPTS}
+                  AND w.files_list_failed_url IS NOT DISTINCT FROM {ARCHIVE_URL_SQL})
+        FROM {SCHEMA}.populate_files_state s
+        WHERE s.name = 'files_list'
+    """)
+    row = cur.fetchone() or (0, 0, 0, 0, None, None, 0, 0)
+    last_work_id, processed, updated, failed, pass_started_at, updated_at, remaining, given_up = row
+    return {
+        'cursor': last_work_id,
+        'processed': processed,
+        'updated': updated,
+        'failed': failed,
+        'remaining': remaining,
+        'given_up': given_up,
+        'pass_started_at': pass_started_at,
+        'updated_at': updated_at
+    }
+
+
+def populate_files(conn, cur, restart: bool, budget: float) -> Dict[str, Any]:
+    '''
+    Порция работы в пределах budget секунд: работы после курсора читаются
+    чанками по id, архивы листаются пулом потоков, результат чанка пишется
+    одним UPDATE вместе со сдвигом курсора — таймаут теряет не больше чанка
+    '''
+    started = time.monotonic()
+    
+    # Два одновременных запуска прошли бы по одним и тем же работам
+    cur.execute("SELECT pg_try_advisory_lock(hashtext('populate-files-list'))")
+    if not cur.fetchone()[0]:
+        return {'busy': True, 'updated': 0, 'total': 0, 'errors': []}
+    
+    try:
+        cur.execute(f"SELECT last_work_id FROM {SCHEMA}.populate_files_state WHERE name = 'files_list'")
+        cursor = 0 if restart else cur.fetchone()[0]
+        
+        if cursor == 0:
+            # Новый проход: счётчики прошлого остаются видны в GET до этого момента
+            cur.execute(f"""
+                UPDATE {SCHEMA}.populate_files_state
+                SET last_work_id = 0, processed = 0, updated = 0, failed = 0,
+                    pass_started_at = NOW(), updated_at = NOW()
+                WHERE name = 'files_list'
+            """)
+            conn.commit()
+        
+        processed = 0
+        updated = 0
+        errors: List[str] = []
+        done = False
+        
+        with ThreadPoolExecutor(max_workers=POPULATE_WORKERS) as pool:
+            while time.monotonic() - started < budget:
+                cur.execute(f"""
+                    SELECT id, title, download_url, file_url
+                    FROM {SCHEMA}.works w
+                    WHERE id > %s {PENDING_WORKS_FILTER}
+                    ORDER BY id
+                    LIMIT %s
+                """, (cursor, POPULATE_CHUNK_SIZE))
+                works = cur.fetchall()
+                if not works:
+                    done = True
+                    break
+                
+                results = list(pool.map(fetch_files_list, works))
+                found = [(work_id, json.dumps(files, ensure_ascii=False))
+                         for work_id, files, _ in results if files]
+                failed = [error for _, _, error in results if error]
+                # Ошибка — ещё одна попытка; пустой список (не архив или пустой архив) — сразу все
+                attempts = [(work_id, 1 if error else POPULATE_MAX_ATTEMPTS)
+                            for work_id, files, error in results if not files]
+                cursor = works[-1][0]
+                
+                if found:
+                    cur.execute(f"""
+                        UPDATE {SCHEMA}.works w
+                        SET files_list = v.files_list::jsonb
+                        FROM unnest(%s::int[], %s::text[]) AS v(id, files_list)
+                        WHERE w.id = v.id
+                    """, ([work_id for work_id, _ in found], [files for _, files in found]))
+                if attempts:
+                    cur.execute(f"""
+                        UPDATE {SCHEMA}.works w
+                        SET files_list_attempts = CASE
+                                WHEN w.files_list_failed_url IS NOT DISTINCT FROM {ARCHIVE_URL_SQL}
+                                THEN LEAST(w.files_list_attempts + v.step, %s)
+                                ELSE v.step
+                            END,
+                            files_list_failed_url = {ARCHIVE_URL_SQL}
+                        FROM unnest(%s::int[], %s::int[]) AS v(id, step)
+                        WHERE w.id = v.id
+                    """, (POPULATE_MAX_ATTEMPTS, [work_id for work_id, _ in attempts], [step for _, step in attempts]))
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.populate_files_state
+                    SET last_work_id = %s, processed = processed + %s, updated = updated + %s,
+                        failed = failed + %s, updated_at = NOW()
+                    WHERE name = 'files_list'
+                """, (cursor, len(works), len(found), len(failed)))
+                conn.commit()
+                
+                processed += len(works)
+                updated += len(found)
+                errors.extend(failed)
+                for error in failed:
+                    print(f"Error: {error}")
+        
+        if done:
+            # Проход закончен: следующий запуск начнёт сначала и повторит упавшие работы,
+            # у которых ещё остались попытки
+            cur.execute(f"""
+                UPDATE {SCHEMA}.populate_files_state
+                SET last_work_id = 0, updated_at = NOW()
+                WHERE name = 'files_list'
+            """)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(hashtext('populate-files-list'))")
+        conn.commit()
+    
+    elapsed = time.monotonic() - started
+    print(f"📦 populate-files-list: {processed} работ, {updated} обновлено за {elapsed:.1f} с, курсор {cursor}")
+    
+    progress = load_progress(cur)
+    return {
+        'updated': updated,
+        'total': processed,
+        'failed': len(errors),
+        'errors': errors[:10],  # Первые 10 ошибок
+        'done': done,
+        'cursor': cursor if not done else 0,
+        'remaining': progress['remaining'],
+        'pass': progress,
+        'elapsed_ms': int(elapsed * 1000),
+        'works_per_second': round(processed / elapsed, 2) if elapsed > 0 else 0
+    }
+
+
+def http_range(url: str, range_spec: str) -> Tuple[bytes, int, bool]:
+    '''
+    Запрос диапазона байт (bytes=a-b или bytes=-n)
+    Returns: (данные, полный размер объекта, поддержан ли Range)
+    '''
+    req = urllib.request.Request(url, headers={'Range': f'bytes={range_spec}', 'User-Agent': 'Mozilla/5.0'})
+    with urllib.request.urlopen(req, timeout=RANGE_TIMEOUT) as response:
+        if response.status != 206:
+            # Сервер без Range отдаёт объект целиком
+            data = response.read()
+            return data, len(data), False
+        match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+        data = response.read()
+        return data, int(match.group(1)) if match else len(data), True
+
+
+def zip64_extra_values(extra: bytes, values: List[int]) -> List[int]:
+    '''Подставляет 64-битные значения из extra-поля ZIP64 (0x0001) вместо 0xFFFFFFFF'''
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, size = struct.unpack_from('<HH', extra, position)
+        if header_id == 0x0001:
+            data = extra[position + 4:position + 4 + size]
+            offset = 0
+            for i, value in enumerate(values):
+                if value == 0xFFFFFFFF and offset + 8 <= len(data):
+                    values[i] = struct.unpack_from('<Q', data, offset)[0]
+                    offset += 8
+            break
+        position += 4 + size
+    return values
+
+
+def list_remote_zip(url: str) -> List[Tuple[str, int]]:
+    '''
+    Список файлов ZIP-архива по центральному каталогу через HTTP Range (поддерживается ZIP64)
+    Returns: [(путь внутри архива, распакованный размер)] без директорий
+    '''
+    tail, total, ranged = http_range(url, f'-{ZIP_TAIL_BYTES}')
+    if not ranged:
+        with zipfile.ZipFile(io.BytesIO(tail)) as zf:
+            return [(info.filename, info.file_size) for info in zf.filelist if not info.is_dir()]
+    
+    eocd = tail.rfind(b'PK\x05\x06')
+    if eocd < 0 and len(tail) < total:
+        tail, total, _ = http_range(url, f'-{ZIP_MAX_TAIL_BYTES}')
+        eocd = tail.rfind(b'PK\x05\x06')
+    if eocd < 0:
+        raise Exception('End of central directory not found')
+    tail_start = total - len(tail)
+    
+    entries_count, cd_size, cd_offset = struct.unpack_from('<HII', tail, eocd + 10)
+    if entries_count == 0xFFFF or 0xFFFFFFFF in (cd_size, cd_offset):
+        locator = eocd - 20
+        if locator < 0 or tail[locator:locator + 4] != b'PK\x06\x07':
+            raise Exception('ZIP64 locator not found')
+        record_offset = struct.unpack_from('<Q', tail, locator + 8)[0]
+        if record_offset >= tail_start:
+            record = tail[record_offset - tail_start:record_offset - tail_start + 56]
+        else:
+            record, _, _ = http_range(url, f'{record_offset}-{record_offset + 55}')
+        if record[:4] != b'PK\x06\x06':
+            raise Exception('ZIP64 end of central directory not found')
+        entries_count, cd_size, cd_offset = struct.unpack_from('<QQQ', record, 32)
+    
+    if cd_offset >= tail_start:
+        directory = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+    else:
+        directory, _, _ = http_range(url, f'{cd_offset}-{cd_offset + cd_size - 1}')
+    
+    files = []
+    position = 0
+    for _ in range(entries_count):
+        if directory[position:position + 4] != b'PK\x01\x02':
+            raise Exception('Broken central directory')
+        flags, compressed_size, file_size, name_len, extra_len, comment_len, local_offset = struct.unpack_from(
+            '<8xH10xIIHHH8xI', directory, position
+        )
+        raw_name = directory[position + 46:position + 46 + name_len]
+        # Без флага UTF-8 Windows-архиваторы пишут кириллицу в cp866
+        file_name = raw_name.decode('utf-8', 'replace') if flags & 0x800 else raw_name.decode('cp866')
+        extra = directory[position + 46 + name_len:position + 46 + name_len + extra_len]
+        file_size = zip64_extra_values(extra, [file_size, compressed_size, local_offset])[0]
+        position += 46 + name_len + extra_len + comment_len
+        
+        if not file_name.endswith('/'):
+            files.append((file_name, file_size))
+    
+    return files
+
+
+class RemoteFile:
+    '''
+    Последовательное чтение удалённого файла окнами через HTTP Range:
+    мелкие заголовки подряд читаются из одного окна, а не отдельными запросами
+    '''
+    
+    def __init__(self, url: str, window: int = HEADER_WINDOW_BYTES):
+        self.url = url
+        self.window = window
+        self.size: Optional[int] = None
+        self.buffer_start = 0
+        self.buffer = b''
+        self.requests = 0
+    
+    def read(self, offset: int, length: int) -> bytes:
+        end = offset + length
+        if self.buffer_start <= offset and end <= self.buffer_start + len(self.buffer):
+            return self.buffer[offset - self.buffer_start:end - self.buffer_start]
+        
+        fetch_end = offset + max(length, self.window) - 1
+        if self.size is not None:
+            fetch_end = min(fetch_end, self.size - 1)
+        if offset > fetch_end:
+            return b''
+        data, total, ranged = http_range(self.url, f'{offset}-{fetch_end}')
+        self.requests += 1
+        self.size = total
+        # Сервер без Range отдаёт архив целиком — дальше читаем из памяти
+        self.buffer_start, self.buffer = (offset, data) if ranged else (0, data)
+        return self.buffer[offset - self.buffer_start:end - self.buffer_start]
+
+
+def decode_rar_unicode_name(std_name: bytes, encoded: bytes) -> str:
+    '''Распаковка имени RAR 2.x-4.x с флагом LHD_UNICODE (алгоритм unrar EncodeFileName::Decode)'''
+    chars = []
+    pos = 0
+    dec_pos = 0
+    flags = 0
+    flag_bits = 0
+    high_byte = encoded[pos]
+    pos += 1
+    
+    while pos < len(encoded):
+        if flag_bits == 0:
+            flags = encoded[pos]
+            pos += 1
+            flag_bits = 8
+        flag_bits -= 2
+        mode = (flags >> flag_bits) & 3
+        
+        if mode == 0:
+            chars.append(encoded[pos])
+            pos += 1
+        elif mode == 1:
+            chars.append(encoded[pos] + (high_byte << 8))
+            pos += 1
+        elif mode == 2:
+            chars.append(encoded[pos] + (encoded[pos + 1] << 8))
+            pos += 2
+        else:
+            length = encoded[pos]
+            pos += 1
+            if length & 0x80:
+                correction = encoded[pos]
+                pos += 1
+                for _ in range((length & 0x7F) + 2):
+                    chars.append(((std_name[len(chars)] + correction) & 0xFF) + (high_byte << 8))
+            else:
+                for _ in range(length + 2):
+                    chars.append(std_name[len(chars)])
+            continue
+        dec_pos += 1
+    
+    # Символы вне BMP записаны суррогатными парами UTF-16
+    return ''.join(chr(c) for c in chars).encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'replace')
+
+
+def list_rar4(remote: RemoteFile) -> List[Tuple[str, int]]:
+    '''Список файлов RAR 1.5-4.x по заголовкам блоков; данные файлов пропускаются'''
+    files = []
+    offset = len(RAR4_SIGNATURE)
+    
+    while True:
+        header = remote.read(offset, 7)
+        if len(header) < 7:
+            break
+        _, block_type, flags, head_size = struct.unpack('<HBHH', header)
+        if head_size < 7:
+            raise Exception('Broken RAR block header')
+        block = remote.read(offset, head_size)
+        add_size = struct.unpack_from('<I', block, 7)[0] if flags & 0x8000 and head_size >= 11 else 0
+        
+        if block_type == 0x73 and flags & 0x0080:
+            raise Exception('RAR headers are encrypted')
+        
+        if block_type == 0x74:
+            pack_size, unp_size = struct.unpack_from('<II', block, 7)
+            name_size = struct.unpack_from('<H', block, 26)[0]
+            name_start = 32
+            if flags & 0x0100:
+                high_pack, high_unp = struct.unpack_from('<II', block, 32)
+                pack_size |= high_pack << 32
+                unp_size |= high_unp << 32
+                name_start = 40
+            add_size = pack_size
+            raw_name = block[name_start:name_start + name_size]
+            
+            if flags & 0x0200:
+                if b'\x00' in raw_name:
+                    std_name, encoded = raw_name.split(b'\x00', 1)
+                    try:
+                        name = decode_rar_unicode_name(std_name, encoded)
+                    except IndexError:
+                        name = std_name.decode('cp866')
+                else:
+                    name = raw_name.decode('utf-8', 'replace')
+            else:
+                # Без Unicode-флага: UTF-8 у unix-версий, OEM-кодировка (cp866) у русской Windows
+                try:
+                    name = raw_name.decode('utf-8')
+                except UnicodeDecodeError:
+                    name = raw_name.decode('cp866')
+            
+            # Директории, продолжения из прошлого тома и старые версии файла (name;N) не считаем
+            if flags & 0x00E0 != 0x00E0 and not flags & 0x0001 and not flags & 0x0800:
+                files.append((name.replace('\\', '/'), unp_size))
+        
+        elif block_type == 0x7B:
+            break
+        
+        offset += head_size + add_size
+    
+    return files
+
+
+def read_vint(data: bytes, pos: int) -> Tuple[int, int]:
+    '''Целое переменной длины RAR5: 7 бит на байт, старший бит — продолжение'''
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def rar5_has_version(header: bytes, extra_size: int) -> bool:
+    '''Есть ли в дополнительной области заголовка запись версии файла (тип 4)'''
+    pos = len(header) - extra_size
+    while extra_size and pos < len(header):
+        record_size, data_start = read_vint(header, pos)
+        record_type, _ = read_vint(header, data_start)
+        if record_type == 4:
+            return True
+        pos = data_start + record_size
+    return False
+
+
+def list_rar5(remote: RemoteFile) -> List[Tuple[str, int]]:
+    '''Список файлов RAR5 по заголовкам блоков; данные файлов пропускаются'''
+    files = []
+    offset = len(RAR5_SIGNATURE)
+    
+    while True:
+        prefix = remote.read(offset, 7)
+        if len(prefix) < 5:
+            break
+        header_size, header_start = read_vint(prefix, 4)
+        header = remote.read(offset + header_start, header_size)
+        
+        block_type, pos = read_vint(header, 0)
+        block_flags, pos = read_vint(header, pos)
+        data_size = 0
+        extra_size = 0
+        if block_flags & 0x1:
+            extra_size, pos = read_vint(header, pos)
+        if block_flags & 0x2:
+            data_size, pos = read_vint(header, pos)
+        
+        if block_type == 4:
+            raise Exception('RAR headers are encrypted')
+        
+        if block_type == 2:
+            file_flags, pos = read_vint(header, pos)
+            unp_size, pos = read_vint(header, pos)
+            _, pos = read_vint(header, pos)
+            if file_flags & 0x2:
+                pos += 4
+            if file_flags & 0x4:
+                pos += 4
+            _, pos = read_vint(header, pos)
+            _, pos = read_vint(header, pos)
+            name_length, pos = read_vint(header, pos)
+            name = header[pos:pos + name_length].decode('utf-8', 'replace')
+            
+            # Директории, продолжения из прошлого тома (0x08) и старые версии файла не считаем
+            if not file_flags & 0x1 and not block_flags & 0x8 and not rar5_has_version(header, extra_size):
+                files.append((name, 0 if file_flags & 0x8 else unp_size))
+        
+        elif block_type == 5:
+            break
+        
+        offset += header_start + header_size + data_size
+    
+    return files
+
+
+class SevenZipReader:
+    '''Разбор заголовка 7z (Header / EncodedHeader) по спецификации 7zFormat.txt'''
+    
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+    
+    def byte(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+    
+    def take(self, length: int) -> bytes:
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+    
+    def number(self) -> int:
+        first = self.byte()
+        mask = 0x80
+        value = 0
+        for i in range(8):
+            if not first & mask:
+                return value | ((first & (mask - 1)) << (8 * i))
+            value |= self.byte() << (8 * i)
+            mask >>= 1
+        return value
+    
+    def bits(self, count: int) -> List[bool]:
+        result = []
+        mask = 0
+        current = 0
+        for _ in range(count):
+            if not mask:
+                current = self.byte()
+                mask = 0x80
+            result.append(bool(current & mask))
+            mask >>= 1
+        return result
+    
+    def digests(self, count: int) -> List[bool]:
+        defined = self.bits(count) if not self.byte() else [True] * count
+        self.pos += 4 * sum(defined)
+        return defined
+    
+    def pack_info(self) -> Dict[str, Any]:
+        info = {'pack_pos': self.number(), 'sizes': []}
+        streams = self.number()
+        while True:
+            prop = self.byte()
+            if prop == 0x00:
+                return info
+            if prop == 0x09:
+                info['sizes'] = [self.number() for _ in range(streams)]
+            elif prop == 0x0A:
+                self.digests(streams)
+    
+    def folder(self) -> Dict[str, Any]:
+        coders = []
+        total_out = 0
+        total_in = 0
+        for _ in range(self.number()):
+            flag = self.byte()
+            coder = {'id': self.take(flag & 0x0F), 'props': b''}
+            ins, outs = (self.number(), self.number()) if flag & 0x10 else (1, 1)
+            if flag & 0x20:
+                coder['props'] = self.take(self.number())
+            coders.append(coder)
+            total_in += ins
+            total_out += outs
+        bound_out = set()
+        for _ in range(total_out - 1):
+            self.number()
+            bound_out.add(self.number())
+        packed = total_in - (total_out - 1)
+        if packed > 1:
+            for _ in range(packed):
+                self.number()
+        return {'coders': coders, 'total_out': total_out, 'bound_out': bound_out}
+    
+    def unpack_info(self) -> List[Dict[str, Any]]:
+        if self.byte() != 0x0B:
+            raise Exception('Broken 7z folder info')
+        count = self.number()
+        if self.byte():
+            raise Exception('External 7z folders are not supported')
+        folders = [self.folder() for _ in range(count)]
+        if self.byte() != 0x0C:
+            raise Exception('Broken 7z unpack sizes')
+        for folder in folders:
+            sizes = [self.number() for _ in range(folder['total_out'])]
+            main = [i for i in range(folder['total_out']) if i not in folder['bound_out']]
+            folder['unpack_size'] = sizes[main[0]] if main else sizes[-1]
+        while True:
+            prop = self.byte()
+            if prop == 0x00:
+                return folders
+            if prop == 0x0A:
+                for folder, has_crc in zip(folders, self.digests(count)):
+                    folder['has_crc'] = has_crc
+    
+    def substreams_info(self, folders: List[Dict[str, Any]]) -> List[int]:
+        counts = [1] * len(folders)
+        sizes: List[int] = []
+        prop = self.byte()
+        if prop == 0x0D:
+            counts = [self.number() for _ in folders]
+            prop = self.byte()
+        if prop == 0x09:
+            for folder, count in zip(folders, counts):
+                if not count:
+                    continue
+                parts = [self.number() for _ in range(count - 1)]
+                sizes.extend(parts + [folder['unpack_size'] - sum(parts)])
+            prop = self.byte()
+        else:
+            for folder, count in zip(folders, counts):
+                if count == 1:
+                    sizes.append(folder['unpack_size'])
+        while prop != 0x00:
+            if prop == 0x0A:
+                # CRC потока папки с одним файлом уже записан в CodersInfo
+                self.digests(sum(count for folder, count in zip(folders, counts)
+                                 if count != 1 or not folder.get('has_crc')))
+            prop = self.byte()
+        return sizes
+    
+    def streams_info(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {'pack': None, 'folders': [], 'sizes': None}
+        while True:
+            prop = self.byte()
+            if prop == 0x00:
+                break
+            if prop == 0x06:
+                info['pack'] = self.pack_info()
+            elif prop == 0x07:
+                info['folders'] = self.unpack_info()
+            elif prop == 0x08:
+                info['sizes'] = self.substreams_info(info['folders'])
+        if info['sizes'] is None:
+            info['sizes'] = [folder['unpack_size'] for folder in info['folders']]
+        return info
+    
+    def files_info(self, stream_sizes: List[int]) -> List[Tuple[str, int]]:
+        count = self.number()
+        empty_stream = [False] * count
+        empty_file: List[bool] = []
+        attributes: List[Optional[int]] = [None] * count
+        names: List[str] = []
+        
+        while True:
+            prop = self.number()
+            if prop == 0x00:
+                break
+            size = self.number()
+            end = self.pos + size
+            if prop == 0x0E:
+                empty_stream = self.bits(count)
+            elif prop == 0x0F:
+                empty_file = self.bits(sum(empty_stream))
+            elif prop == 0x11:
+                if self.byte():
+                    raise Exception('External 7z names are not supported')
+                names = self.take(end - self.pos).decode('utf-16-le').split('\x00')[:count]
+            elif prop == 0x15:
+                defined = self.bits(count) if not self.byte() else [True] * count
+                if self.byte():
+                    raise Exception('External 7z attributes are not supported')
+                for i, is_defined in enumerate(defined):
+                    if is_defined:
+                        attributes[i] = struct.unpack('<I', self.take(4))[0]
+            self.pos = end
+        
+        files = []
+        sizes = iter(stream_sizes)
+        empty_index = 0
+        for i in range(count):
+            name = names[i] if i < len(names) else f'file_{i}'
+            if not empty_stream[i]:
+                files.append((name, next(sizes, 0)))
+                continue
+            is_file = empty_index < len(empty_file) and empty_file[empty_index]
+            empty_index += 1
+            is_dir = not is_file or (attributes[i] is not None and attributes[i] & 0x10)
+            if not is_dir:
+                files.append((name, 0))
+        return files
+
+
+def decode_7z_header(remote: RemoteFile, info: Dict[str, Any]) -> bytes:
+    '''Распаковать сжатый заголовок 7z (LZMA/LZMA2) — только заголовок, не данные архива'''
+    folder = info['folders'][0]
+    if any(coder['id'] == b'\x06\xf1\x07\x01' for coder in folder['coders']):
+        raise Exception('7z headers are encrypted')
+    if len(folder['coders']) != 1:
+        raise Exception('Unsupported 7z header coders')
+    coder = folder['coders'][0]
+    props = coder['props']
+    
+    if coder['id'] == b'\x03\x01\x01':
+        lc_lp_pb = props[0]
+        filters = [{
+            'id': lzma.FILTER_LZMA1,
+            'lc': lc_lp_pb % 9,
+            'lp': (lc_lp_pb // 9) % 5,
+            'pb': lc_lp_pb // 45,
+            'dict_size': struct.unpack('<I', props[1:5])[0]
+        }]
+    elif coder['id'] == b'\x21':
+        dict_byte = props[0]
+        dict_size = 0xFFFFFFFF if dict_byte == 40 else (2 | (dict_byte & 1)) << (dict_byte // 2 + 11)
+        filters = [{'id': lzma.FILTER_LZMA2, 'dict_size': dict_size}]
+    else:
+        raise Exception(f'Unsupported 7z header coder {coder["id"].hex()}')
+    
+    packed = remote.read(SEVEN_ZIP_START_HEADER + info['pack']['pack_pos'], info['pack']['sizes'][0])
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=filters)
+    return decompressor.decompress(packed, max_length=folder['unpack_size'])
+
+
+def list_7z(remote: RemoteFile) -> List[Tuple[str, int]]:
+    '''Список файлов 7z по заголовку в конце архива'''
+    start = remote.read(0, SEVEN_ZIP_START_HEADER)
+    next_offset, next_size = struct.unpack_from('<QQ', start, 12)
+    if not next_size:
+        return []
+    header = remote.read(SEVEN_ZIP_START_HEADER + next_offset, next_size)
+    
+    while True:
+        reader = SevenZipReader(header)
+        kind = reader.byte()
+        if kind == 0x17:
+            header = decode_7z_header(remote, reader.streams_info())
+            continue
+        if kind != 0x01:
+            raise Exception('Broken 7z header')
+        
+        stream_sizes: List[int] = []
+        while True:
+            prop = reader.byte()
+            if prop == 0x00:
+                return []
+            if prop == 0x02:
+                while reader.byte() != 0x00:
+                    reader.take(reader.number())
+            elif prop == 0x03:
+                reader.streams_info()
+            elif prop == 0x04:
+                stream_sizes = reader.streams_info()['sizes']
+            elif prop == 0x05:
+                return reader.files_info(stream_sizes)
+
+
+def list_remote_archive(url: str) -> List[Tuple[str, int]]:
+    '''
+    Список файлов архива без распаковки: ZIP по центральному каталогу,
+    RAR4/RAR5 и 7z по заголовкам. Формат определяется по сигнатуре
+    '''
+    remote = RemoteFile(url)
+    signature = remote.read(0, 8)
+    
+    if signature.startswith(RAR5_SIGNATURE):
+        return list_rar5(remote)
+    if signature.startswith(RAR4_SIGNATURE):
+        return list_rar4(remote)
+    if signature.startswith(SEVEN_ZIP_SIGNATURE):
+        return list_7z(remote)
+    if signature.startswith(b'PK'):
+        return list_remote_zip(url)
+    raise Exception('Unknown archive format')
+
+
 def get_file_type(filename: str) -> str:
     '''Определяет тип файла по расширению'''
     name_lower = filename.lower()
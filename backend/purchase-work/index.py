@@ -6,9 +6,21 @@ Returns: Статус покупки и разрешение на скачива
 """
 import json
 import os
-from typing import Dict, Any
+import re
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
 import psycopg2
 
+# Подписанный токен скачивания проверяется в download-work без обращения к БД
+DOWNLOAD_TOKEN_TTL = 1800
+# base64url(payload).base64url(HMAC-SHA256) — подпись всегда 43 символа
+DOWNLOAD_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]+\.[A-Za-z0-9_-]{43}$')
+
 # Загружаем func2url для отправки email через support API
 try:
     with open('/function/backend/func2url.json', 'r') as f:
@@ -48,6 +60,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'POST' and action == 'generate-token':
         return generate_download_token(event)
     
+    if method == 'POST' and action == 'revoke-token':
+        return revoke_download_token(event)
+    
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -73,6 +88,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        config_error = download_token_config_error()
+        if config_error:
+            return config_error
+        
         dsn = os.environ.get('DATABASE_URL')
         if not dsn:
             raise Exception('DATABASE_URL not configured')
@@ -106,9 +125,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             # КРИТИЧНО: Игнорируем цену от клиента, используем только из БД
             if client_price and client_price != price:
                 print(f"⚠️ SECURITY: Price manipulation attempt! User {user_id} tried to buy work {work_id} for {client_price}, real price is {price}")
-                # Логируем попытку мошенничества
+                # Логируем попытку мошенничества (в security_logs попадёт через events-rollup)
                 cur.execute(
-                    """INSERT INTO t_p63326274_course_download_plat.security_logs 
+                    """INSERT INTO t_p63326274_course_download_plat.events 
                     (user_id, event_type, details, ip_address) 
                     VALUES (%s, %s, %s, %s)""",
                     (user_id, 'price_manipulation', f'Attempted to pay {client_price} instead of {price} for work {work_id}', 
@@ -209,19 +228,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             if existing_purchase:
                 print(f"[PURCHASE] Work already purchased, generating re-download token")
                 # Генерируем новый токен для повторного скачивания
-                import secrets
-                from datetime import datetime, timedelta
-                
-                download_token = secrets.token_urlsafe(48)
-                token_expires_at = datetime.now() + timedelta(minutes=30)
                 ip_address = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-                
-                cur.execute(
-                    """INSERT INTO t_p63326274_course_download_plat.download_tokens 
-                    (token, user_id, work_id, expires_at, ip_address) 
-                    VALUES (%s, %s, %s, %s, %s)""",
-                    (download_token, user_id, db_work_id, token_expires_at, ip_address)
-                )
+                download_token, token_expires_at = issue_download_token(int(user_id), int(db_work_id), ip_address)
                 
                 conn.commit()
                 
@@ -350,19 +358,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             
             # Генерируем временный токен для скачивания (30 минут)
-            import secrets
-            from datetime import datetime, timedelta
-            
-            download_token = secrets.token_urlsafe(48)
-            token_expires_at = datetime.now() + timedelta(minutes=30)
             ip_address = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-            
-            cur.execute(
-                """INSERT INTO t_p63326274_course_download_plat.download_tokens 
-                (token, user_id, work_id, expires_at, ip_address) 
-                VALUES (%s, %s, %s, %s, %s)""",
-                (download_token, user_id, db_work_id, token_expires_at, ip_address)
-            )
+            download_token, token_expires_at = issue_download_token(int(user_id), int(db_work_id), ip_address)
             
             conn.commit()
             
@@ -378,7 +375,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'message': 'Purchase successful',
                     'isAdmin': is_admin,
                     'downloadToken': download_token,
-                    'tokenExpiresIn': 1800
+                    'tokenExpiresIn': DOWNLOAD_TOKEN_TTL
                 }),
                 'isBase64Encoded': False
             }
@@ -420,6 +417,126 @@ def get_db_connection():
     conn.autocommit = False
     return conn
 
+def _token_b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _token_unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+def get_download_token_secret() -> bytes:
+    secret = os.environ.get('DOWNLOAD_TOKEN_SECRET')
+    if not secret:
+        raise Exception('DOWNLOAD_TOKEN_SECRET not configured')
+    return secret.encode('utf-8')
+
+def download_token_config_error() -> Optional[Dict[str, Any]]:
+    """Ответ 503, если не задан секрет подписи токенов: проверяется до списаний и записей в БД"""
+    if os.environ.get('DOWNLOAD_TOKEN_SECRET'):
+        return None
+    print("[CONFIG] DOWNLOAD_TOKEN_SECRET is not set: download tokens cannot be issued")
+    return {
+        'statusCode': 503,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({
+            'error': 'Скачивание временно недоступно: сервис не настроен',
+            'details': 'DOWNLOAD_TOKEN_SECRET not configured'
+        }),
+        'isBase64Encoded': False
+    }
+
+def hash_client_ip(secret: bytes, ip_address: str) -> str:
+    return hmac.new(secret, f'ip:{ip_address}'.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+def issue_download_token(user_id: int, work_id: int, ip_address: str) -> Tuple[str, datetime]:
+    """Токен вида payload.signature (HMAC-SHA256): пользователь, работа, срок, хэш IP и id для отзыва"""
+    secret = get_download_token_secret()
+    expires = int(time.time()) + DOWNLOAD_TOKEN_TTL
+    payload = {
+        'u': user_id,
+        'w': work_id,
+        'e': expires,
+        'ip': hash_client_ip(secret, ip_address) if ip_address and ip_address != 'unknown' else None,
+        'id': secrets.token_urlsafe(9)
+    }
+    body = _token_b64(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    signature = _token_b64(hmac.new(secret, body.encode('ascii'), hashlib.sha256).digest())
+    return f'{body}.{signature}', datetime.fromtimestamp(expires)
+
+def decode_download_token(token: str) -> Optional[Dict[str, Any]]:
+    """Полезная нагрузка токена при верной подписи, иначе None"""
+    # Форма проверяется до секрета: мусор отклоняется даже без настроенного DOWNLOAD_TOKEN_SECRET
+    if not isinstance(token, str) or not DOWNLOAD_TOKEN_PATTERN.match(token):
+        return None
+    secret = get_download_token_secret()
+    body, _, signature = token.partition('.')
+    expected = _token_b64(hmac.new(secret, body.encode('ascii', 'replace'), hashlib.sha256).digest())
+    if not body or not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        return json.loads(_token_unb64(body))
+    except ValueError:
+        return None
+
+def revoke_download_token(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Отозвать токен скачивания (только админ); запись живёт до истечения токена"""
+    headers = event.get('headers', {})
+    user_id = headers.get('X-User-Id') or headers.get('x-user-id')
+    body_data = json.loads(event.get('body') or '{}')
+    token = body_data.get('token', '')
+    
+    # Токен правильной формы без секрета не проверить — это ошибка настройки, а не запроса
+    if isinstance(token, str) and DOWNLOAD_TOKEN_PATTERN.match(token):
+        config_error = download_token_config_error()
+        if config_error:
+            return config_error
+    
+    payload = decode_download_token(token)
+    
+    if not payload:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Недействительный токен'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            "SELECT role FROM t_p63326274_course_download_plat.users WHERE id = %s",
+            (user_id,)
+        )
+        user_result = cur.fetchone()
+        if not user_result or user_result[0] != 'admin':
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Доступ запрещён'}),
+                'isBase64Encoded': False
+            }
+        
+        # Список отзыва маленький: истёкшие записи удаляются при каждой вставке
+        cur.execute("DELETE FROM t_p63326274_course_download_plat.revoked_download_tokens WHERE expires_at < NOW()")
+        cur.execute(
+            """INSERT INTO t_p63326274_course_download_plat.revoked_download_tokens (token_id, expires_at)
+            VALUES (%s, to_timestamp(%s)::timestamp)
+            ON CONFLICT (token_id) DO NOTHING""",
+            (payload['id'], payload['e'])
+        )
+        conn.commit()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'success': True, 'revoked': payload['id']}),
+            'isBase64Encoded': False
+        }
+    finally:
+        cur.close()
+        conn.close()
+
 def user_has_paid(cur, user_id: int, work_id: int) -> bool:
     cur.execute(
         """
@@ -457,6 +574,10 @@ def create_order(event: Dict[str, Any]) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    config_error = download_token_config_error()
+    if config_error:
+        return config_error
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
@@ -515,19 +636,8 @@ def create_order(event: Dict[str, Any]) -> Dict[str, Any]:
         # Проверяем, не куплена ли уже работа
         if user_has_paid(cur, int(user_id), work_id_db):
             # Генерируем новый токен для повторного скачивания
-            import secrets
-            from datetime import datetime, timedelta
-            
-            download_token = secrets.token_urlsafe(48)
-            token_expires_at = datetime.now() + timedelta(minutes=30)
             ip_address = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-            
-            cur.execute(
-                """INSERT INTO t_p63326274_course_download_plat.download_tokens 
-                (token, user_id, work_id, expires_at, ip_address) 
-                VALUES (%s, %s, %s, %s, %s)""",
-                (download_token, user_id, work_id_db, token_expires_at, ip_address)
-            )
+            download_token, token_expires_at = issue_download_token(int(user_id), int(work_id_db), ip_address)
             
             conn.commit()
             cur.close()
@@ -540,7 +650,7 @@ def create_order(event: Dict[str, Any]) -> Dict[str, Any]:
                     'ok': True,
                     'alreadyPaid': True,
                     'downloadToken': download_token,
-                    'tokenExpiresIn': 1800,
+                    'tokenExpiresIn': DOWNLOAD_TOKEN_TTL,
                     'message': 'Работа уже куплена'
                 }),
                 'isBase64Encoded': False
@@ -644,19 +754,8 @@ def create_order(event: Dict[str, Any]) -> Dict[str, Any]:
         )
         
         # Генерируем временный токен для скачивания
-        import secrets
-        from datetime import datetime, timedelta
-        
-        download_token = secrets.token_urlsafe(48)
-        token_expires_at = datetime.now() + timedelta(minutes=30)
         ip_address = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-        
-        cur.execute(
-            """INSERT INTO t_p63326274_course_download_plat.download_tokens 
-            (token, user_id, work_id, expires_at, ip_address) 
-            VALUES (%s, %s, %s, %s, %s)""",
-            (download_token, user_id, work_id_db, token_expires_at, ip_address)
-        )
+        download_token, token_expires_at = issue_download_token(int(user_id), int(work_id_db), ip_address)
         
         conn.commit()
         
@@ -674,7 +773,7 @@ def create_order(event: Dict[str, Any]) -> Dict[str, Any]:
                 'success': True,
                 'newBalance': new_balance,
                 'downloadToken': download_token,
-                'tokenExpiresIn': 1800,
+                'tokenExpiresIn': DOWNLOAD_TOKEN_TTL,
                 'message': 'Purchase successful'
             }),
             'isBase64Encoded': False
@@ -776,6 +875,10 @@ def generate_download_token(event: Dict[str, Any]) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    config_error = download_token_config_error()
+    if config_error:
+        return config_error
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
@@ -830,19 +933,8 @@ def generate_download_token(event: Dict[str, Any]) -> Dict[str, Any]:
                 }
         
         # Генерируем токен
-        import secrets
-        from datetime import datetime, timedelta
-        
-        download_token = secrets.token_urlsafe(48)
-        token_expires_at = datetime.now() + timedelta(minutes=30)
         ip_address = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-        
-        cur.execute(
-            """INSERT INTO t_p63326274_course_download_plat.download_tokens 
-            (token, user_id, work_id, expires_at, ip_address) 
-            VALUES (%s, %s, %s, %s, %s)""",
-            (download_token, user_id, work_id, token_expires_at, ip_address)
-        )
+        download_token, token_expires_at = issue_download_token(int(user_id), int(work_id), ip_address)
         
         conn.commit()
         
@@ -853,7 +945,7 @@ def generate_download_token(event: Dict[str, Any]) -> Dict[str, Any]:
                 'success': True,
                 'token': download_token,
                 'expiresAt': token_expires_at.isoformat(),
-                'expiresIn': 1800
+                'expiresIn': DOWNLOAD_TOKEN_TTL
             }),
             'isBase64Encoded': False
         }
@@ -5,6 +5,7 @@ Returns: HTTP response с данными отзывов
 '''
 import json
 import os
+import hashlib
 import psycopg2
 import random
 from typing import Dict, Any
@@ -12,6 +13,9 @@ from datetime import datetime, timedelta
 
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
 
+# Клиент всегда перепроверяет ответ по ETag, неизменившиеся отзывы приходят как 304
+CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
 # Список реалистичных ников пользователей
 FAKE_USERNAMES = [
     'techStudent2023', 'engineer_pro', 'study_helper', 'workMaster',
@@ -75,6 +79,34 @@ def escape_sql_string(s):
         return 'NULL'
     return "'" + str(s).replace("'", "''") + "'"
 
+def get_cache_version(cur, scope: str) -> int:
+    """Текущая версия данных (инкрементируется триггерами, см. V0102)"""
+    cur.execute(f"SELECT version FROM t_p63326274_course_download_plat.cache_versions WHERE scope = {escape_sql_string(scope)}")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def make_etag(scope: str, version: int, params: Dict[str, Any]) -> str:
+    """Сильный ETag: версия данных + нормализованные параметры запроса"""
+    key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(f'{scope}:{version}:{key}'.encode('utf-8')).hexdigest()[:32] + '"'
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    """Совпадает ли If-None-Match клиента с текущим ETag"""
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in candidates or '*' in candidates
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    return {
+        'ETag': etag,
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Origin, Accept-Encoding',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -84,7 +116,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Admin-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Admin-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -126,6 +158,15 @@ def get_reviews(event: Dict[str, Any]) -> Dict[str, Any]:
     cur = conn.cursor()
     
     try:
+        etag = make_etag('reviews', get_cache_version(cur, 'reviews'), params)
+        if is_not_modified(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': {'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
+                'body': '',
+                'isBase64Encoded': False
+            }
+        
         if work_id:
             work_id_int = int(work_id)
             query = f"""
@@ -184,7 +225,7 @@ def get_reviews(event: Dict[str, Any]) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
             'body': json.dumps({'reviews': reviews}),
             'isBase64Encoded': False
         }
@@ -1,11 +1,17 @@
 import json
 import urllib.request
 import urllib.parse
+import time
+
+# Секунды на один вызов populate-files-list и на весь триггер
+CALL_BUDGET = 20
+TRIGGER_TIME_BUDGET = 240
+
 
 def handler(event, context):
     '''
     Триггер для запуска populate-files-list функции
-    Просто вызывает другую функцию через HTTP
+    Вызывает её через HTTP, пока проход по работам не закончится
     '''
     method = event.get('httpMethod', 'GET')
     
@@ -25,28 +31,38 @@ def handler(event, context):
         # URL функции populate-files-list
         base_url = 'https://functions.poehali.dev/f223384a-8ec5-4596-8058-0031ec710c9e'
         
-        # Вызываем функцию батчами (по 50 работ)
-        # Всего ~480 работ, значит нужно ~10 батчей
+        # populate-files-list сам хранит курсор: каждый вызов продолжает с места остановки,
+        # поэтому вызываем, пока проход не закончится или не выйдет время триггера
+        started = time.monotonic()
         total_updated = 0
+        total_processed = 0
+        calls = 0
+        done = False
+        last_result = {}
         all_errors = []
         
-        for batch in range(10):
-            url = f'{base_url}?batch={batch}'
-            
-            req = urllib.request.Request(url, method='POST')
+        while not done and time.monotonic() - started < TRIGGER_TIME_BUDGET:
+            req = urllib.request.Request(f'{base_url}?budget={CALL_BUDGET}', method='POST')
             req.add_header('Content-Type', 'application/json')
+            calls += 1
             
             try:
                 with urllib.request.urlopen(req, timeout=60) as response:
-                    result = json.loads(response.read().decode('utf-8'))
-                    total_updated += result.get('updated', 0)
-                    all_errors.extend(result.get('errors', []))
-                    
-                    # Если больше нет работ, прекращаем
-                    if result.get('total', 0) == 0:
-                        break
+                    last_result = json.loads(response.read().decode('utf-8'))
             except Exception as e:
-                all_errors.append(f'Batch {batch}: {str(e)}')
+                all_errors.append(f'Call {calls}: {str(e)}')
+                break
+            
+            # Предыдущий запуск ещё работает — он сам продвинет курсор
+            if last_result.get('busy'):
+                break
+            
+            total_updated += last_result.get('updated', 0)
+            total_processed += last_result.get('total', 0)
+            all_errors.extend(last_result.get('errors', []))
+            done = last_result.get('done', False)
+        
+        elapsed = time.monotonic() - started
         
         return {
             'statusCode': 200,
@@ -57,6 +73,14 @@ def handler(event, context):
             'body': json.dumps({
                 'success': True,
                 'total_updated': total_updated,
+                'total_processed': total_processed,
+                'calls': calls,
+                'done': done,
+                'busy': bool(last_result.get('busy')),
+                'cursor': last_result.get('cursor'),
+                'remaining': last_result.get('remaining'),
+                'elapsed_ms': int(elapsed * 1000),
+                'works_per_second': round(total_processed / elapsed, 2) if elapsed > 0 else 0,
                 'errors': all_errors[:20]
             }),
             'isBase64Encoded': False
@@ -73,6 +73,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     # Build update query dynamically using Simple Query Protocol
     updates = []
+    # Сменившиеся превью / обложки: их производные (image_variants) больше не подходят
+    variant_resets = []
     
     if title is not None:
         escaped_title = title.replace("'", "''")
@@ -124,13 +126,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if cover_images is not None:
         cover_images_json = json.dumps(cover_images, ensure_ascii=False).replace("'", "''")
         updates.append(f"cover_images = '{cover_images_json}'")
+        # Производные строились для прежних обложек; новые построит generate_image_derivatives
+        variant_resets.append((f"cover_images IS DISTINCT FROM '{cover_images_json}'", 'covers'))
     
     if preview_image_url is not None:
         if preview_image_url == '':
             updates.append("preview_image_url = NULL")
+            variant_resets.append(("TRUE", 'preview'))
         else:
             escaped_preview = preview_image_url.replace("'", "''")
             updates.append(f"preview_image_url = '{escaped_preview}'")
+            variant_resets.append((f"preview_image_url IS DISTINCT FROM '{escaped_preview}'", 'preview'))
     
     if yandex_disk_link is not None:
         if yandex_disk_link == '':
@@ -162,6 +168,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'No fields to update'})
         }
     
+    if variant_resets:
+        # В SET колонки ещё старые: ключ убирается, только если значение действительно меняется
+        resets = ''.join(f" - (CASE WHEN {condition} THEN '{key}' ELSE '' END)" for condition, key in variant_resets)
+        updates.append(f"image_variants = image_variants{resets}")
+    
     # Execute update using Simple Query Protocol
     update_query = f"UPDATE t_p63326274_course_download_plat.works SET {', '.join(updates)} WHERE id = {int(work_id)}"
     cursor.execute(update_query)
@@ -103,10 +103,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             # Массив всех URL для галереи
             urls_json = json.dumps(uploaded_urls).replace("'", "''")
             
+            # Производные прежнего превью больше не подходят (тот же URL может указывать на новый файл);
+            # до прогона generate_image_derivatives карточка покажет исходник
             update_query = f"""
                 UPDATE t_p63326274_course_download_plat.works 
                 SET preview_image_url = '{escaped_url}',
-                    preview_urls = '{urls_json}'
+                    preview_urls = '{urls_json}',
+                    image_variants = image_variants - 'preview'
                 WHERE id = {int(work_id)}
             """
             cur.execute(update_query)
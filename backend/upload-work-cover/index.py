@@ -4,13 +4,141 @@ Args: event with httpMethod POST, body with images/composition and work_id
 Returns: HTTP response with uploaded image URLs or success message
 '''
 
+import io
 import json
+import hashlib
 import base64
 import os
 import uuid
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 import psycopg2
 import boto3
+from PIL import Image, ImageOps
+import numpy as np
+
+try:
+    # AVIF в Pillow до 11-й версии — только через плагин; без него производные только в WebP
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Производные обложек для srcset: ширины в пикселях, больше исходника не растягиваем
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_FORMATS = (
+    ('AVIF', 'avif', 'image/avif', {'quality': 55}),
+    ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+)
+# Плейсхолдер BlurHash: компонент по длинной стороне и по короткой, стороны уменьшенной копии
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE_SIZE = 32
+BLURHASH_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def base83(value: int, length: int) -> str:
+    return ''.join(BLURHASH_ALPHABET[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def encode_blurhash(img: Image.Image) -> str:
+    """
+    BlurHash изображения (~30 символов): косинусное разложение уменьшенной копии.
+    Все компоненты считаются одним einsum по массиву пикселей, без циклов по пикселям
+    """
+    sample = img.copy()
+    sample.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE), Image.BOX)
+    if sample.mode == 'RGBA':
+        # Прозрачные области — на белом фоне, как их видно в карточке
+        background = Image.new('RGB', sample.size, (255, 255, 255))
+        background.paste(sample, mask=sample.getchannel('A'))
+        sample = background
+    pixels = np.asarray(sample, dtype=np.float64) / 255.0
+    linear = np.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+    height, width = linear.shape[:2]
+
+    long_side, short_side = BLURHASH_COMPONENTS
+    components_x, components_y = (long_side, short_side) if width >= height else (short_side, long_side)
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    # factors[j, i] — вклад cos(πix/W)·cos(πjy/H) в каждый канал
+    factors = np.einsum('jy,ix,yxc->jic', basis_y, basis_x, linear) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    dc_srgb = np.clip(dc, 0, 1)
+    dc_srgb = np.where(dc_srgb <= 0.0031308, dc_srgb * 12.92, 1.055 * dc_srgb ** (1 / 2.4) - 0.055)
+    r, g, b = (int(v) for v in np.floor(dc_srgb * 255 + 0.5))
+
+    result = base83(components_x - 1 + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += base83(quantised_max, 1) + base83((r << 16) + (g << 8) + b, 4)
+
+    scaled = ac / max_value
+    quantised = np.clip(np.floor(np.sign(scaled) * np.abs(scaled) ** 0.5 * 9 + 9.5), 0, 18).astype(int)
+    for qr, qg, qb in quantised:
+        result += base83(int(qr) * 19 * 19 + int(qg) * 19 + int(qb), 2)
+    return result
+
+
+def render_image_variants(image_bytes: bytes) -> Tuple[int, int, str, List[Tuple[int, str, str, bytes]]]:
+    """Все ширины и форматы производных и BlurHash за одно декодирование исходника"""
+    Image.init()
+    formats = [fmt for fmt in DERIVATIVE_FORMATS if fmt[0] in Image.SAVE]
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # JPEG сразу декодируется с уменьшением в 2/4/8 раз, если самая большая ширина это позволяет
+        img.draft('RGB', (max(DERIVATIVE_WIDTHS), max(DERIVATIVE_WIDTHS) * img.height // max(img.width, 1)))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    width, height = img.size
+    blurhash = encode_blurhash(img)
+
+    variants = []
+    for target in sorted({min(w, width) for w in DERIVATIVE_WIDTHS}):
+        resized = img if target == width else img.resize(
+            (target, max(1, round(height * target / width))), Image.LANCZOS)
+        for pil_format, ext, mime, options in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            variants.append((target, ext, mime, buffer.getvalue()))
+    return width, height, blurhash, variants
+
+
+def upload_image_variants(s3_client, bucket_name: str, object_key: str, public_url: str,
+                          image_bytes: bytes) -> Dict[str, Any]:
+    """
+    Производные обложки под ключами {key без расширения}_{md5[:12]}_w{width}.{ext} и карта для srcset;
+    хэш содержимого в ключе не даёт immutable-кэшу отдавать производные старого файла
+    """
+    width, height, blurhash, variants = render_image_variants(image_bytes)
+    # MD5 совпадает с ETag объекта, загруженного одним put_object, — по нему проверяется свежесть
+    version = hashlib.md5(image_bytes).hexdigest()
+    base_key = f"{os.path.splitext(object_key)[0]}_{version[:12]}"
+    srcset: Dict[str, List[str]] = {}
+    for target, ext, mime, data in variants:
+        key = f"{base_key}_w{target}.{ext}"
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=key,
+            Body=data,
+            ContentType=mime,
+            CacheControl='public, max-age=31536000, immutable',
+            ACL='public-read'
+        )
+        srcset.setdefault(mime, []).append(f"https://storage.yandexcloud.net/{bucket_name}/{key} {target}w")
+    return {
+        'src': public_url,
+        'width': width,
+        'height': height,
+        'version': version,
+        'etag': version,
+        'blurhash': blurhash,
+        'srcset': {mime: ', '.join(entries) for mime, entries in srcset.items()}
+    }
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -107,6 +235,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     bucket_name = 'kyra'
     image_urls: List[str] = []
+    cover_variants: List[Dict[str, Any]] = []
     
     for idx, img_data in enumerate(images):
         if not img_data.startswith('data:image'):
@@ -137,10 +266,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         public_url = f"https://storage.yandexcloud.net/{bucket_name}/{object_key}"
         image_urls.append(public_url)
+        
+        # Обложка сохранена как загружена; без производных карточка покажет её как есть
+        try:
+            cover_variants.append(
+                upload_image_variants(s3_client, bucket_name, object_key, public_url, image_bytes)
+            )
+        except Exception as e:
+            print(f"Error creating cover variants: {e}")
     
     cur.execute(
-        "UPDATE works SET cover_images = %s WHERE id = %s",
-        (image_urls, work_id)
+        """UPDATE works SET cover_images = %s,
+               image_variants = COALESCE(image_variants, '{}'::jsonb) || jsonb_build_object('covers', %s::jsonb)
+           WHERE id = %s""",
+        (image_urls, json.dumps(cover_variants), work_id)
     )
     
     conn.commit()
@@ -1,9 +1,79 @@
 import json
 import os
+import time
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from typing import Dict, Any
 
+# Инкременты пишутся в counter_events и сливаются в work_stats пачками (см. V0103)
+COUNTER_FLUSH_BATCH = 200
+COUNTER_FLUSH_INTERVAL = 30
+COUNTER_FLUSH_MAX_EVENTS = 5000
+COUNTER_COLUMNS = ('views_count', 'downloads_count', 'reviews_count')
+_counter_state = {'recorded': 0, 'last_flush': time.monotonic()}
+
+
+def flush_stats(conn) -> int:
+    '''Слить накопленные события в work_stats батчевым upsert из VALUES'''
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """DELETE FROM counter_events
+               WHERE id IN (
+                   SELECT id FROM counter_events
+                   WHERE target = 'work_stats'
+                   ORDER BY id
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+               )
+               RETURNING target_id, counter, delta""",
+            (COUNTER_FLUSH_MAX_EVENTS,)
+        )
+        events = cur.fetchall()
+        
+        totals: Dict[int, Dict[str, int]] = {}
+        for work_id, counter, delta in events:
+            if counter in COUNTER_COLUMNS:
+                per_work = totals.setdefault(work_id, dict.fromkeys(COUNTER_COLUMNS, 0))
+                per_work[counter] += delta
+        
+        if totals:
+            values_sql = ', '.join(
+                f"({int(work_id)}, {d['views_count']}, {d['downloads_count']}, {d['reviews_count']})"
+                for work_id, d in totals.items()
+            )
+            cur.execute(f"""
+                INSERT INTO work_stats (work_id, views_count, downloads_count, reviews_count)
+                SELECT * FROM (VALUES {values_sql}) AS v(work_id, views_count, downloads_count, reviews_count)
+                ON CONFLICT (work_id) DO UPDATE SET
+                    views_count = work_stats.views_count + EXCLUDED.views_count,
+                    downloads_count = work_stats.downloads_count + EXCLUDED.downloads_count,
+                    reviews_count = work_stats.reviews_count + EXCLUDED.reviews_count,
+                    updated_at = CURRENT_TIMESTAMP
+            """)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    _counter_state['recorded'] = 0
+    _counter_state['last_flush'] = time.monotonic()
+    return len(events)
+
+
+def maybe_flush_stats(conn) -> None:
+    '''Сливать события по порогу размера или времени для этого инстанса'''
+    elapsed = time.monotonic() - _counter_state['last_flush']
+    if _counter_state['recorded'] >= COUNTER_FLUSH_BATCH or elapsed >= COUNTER_FLUSH_INTERVAL:
+        try:
+            flush_stats(conn)
+        except Exception as e:
+            print(f"Failed to flush work stats: {e}")
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Управление статистикой работ (просмотры, скачивания, отзывы)
@@ -105,12 +175,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
                 column = column_map[action]
                 
+                # Отложенная запись: без блокировки строки work_stats на каждый хит
                 cur.execute(
-                    f"INSERT INTO work_stats (work_id, {column}) VALUES (%s, 1) ON CONFLICT (work_id) DO UPDATE SET {column} = work_stats.{column} + 1, updated_at = CURRENT_TIMESTAMP RETURNING views_count, downloads_count, reviews_count",
+                    "INSERT INTO counter_events (target, target_id, counter, delta) VALUES ('work_stats', %s, %s, 1)",
+                    (int(work_id), column)
+                )
+                _counter_state['recorded'] += 1
+                
+                # Сохранённые значения плюс ещё не слитые события, одним снимком
+                cur.execute(
+                    """SELECT COALESCE(MAX(s.views_count), 0) + COALESCE(SUM(e.delta) FILTER (WHERE e.counter = 'views_count'), 0) AS views_count,
+                              COALESCE(MAX(s.downloads_count), 0) + COALESCE(SUM(e.delta) FILTER (WHERE e.counter = 'downloads_count'), 0) AS downloads_count,
+                              COALESCE(MAX(s.reviews_count), 0) + COALESCE(SUM(e.delta) FILTER (WHERE e.counter = 'reviews_count'), 0) AS reviews_count
+                       FROM (SELECT %s AS work_id) AS w
+                       LEFT JOIN work_stats s ON s.work_id = w.work_id
+                       LEFT JOIN counter_events e ON e.target = 'work_stats' AND e.target_id = w.work_id""",
                     (int(work_id),)
                 )
-                conn.commit()
                 stats = cur.fetchone()
+                conn.commit()
+            
+            maybe_flush_stats(conn)
             
             return {
                 'statusCode': 200,
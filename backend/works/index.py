@@ -6,10 +6,18 @@ Returns: HTTP response с данными работ
 
 import json
 import os
+import base64
+import gzip
+import hashlib
+import boto3
 import psycopg2
 import requests
 import re
-from typing import Dict, Any, List, Optional
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 from docx import Document
 from openai import OpenAI
 from io import BytesIO
@@ -18,66 +26,923 @@ from PIL import Image
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 
+# Старые клиенты запрашивают каталог без limit и ожидают все работы разом
+LEGACY_PAGE_SIZE = 1000
+# Размер страницы по умолчанию для постраничной загрузки по курсору
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Клиент всегда перепроверяет ответ по ETag, неизменившиеся данные приходят как 304
+CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+
+# Счётчики пишутся в counter_events и сливаются в works пачками (см. V0103)
+COUNTER_FLUSH_BATCH = 200
+COUNTER_FLUSH_INTERVAL = 30
+COUNTER_FLUSH_MAX_EVENTS = 5000
+COUNTER_COLUMNS = {'views_count', 'downloads_count', 'views', 'downloads', 'reviews_count'}
+_counter_state = {'recorded': 0, 'last_flush': time.monotonic()}
+
+# Колонки карточки каталога, порядок соответствует catalog_item_from_row
+CATALOG_COLUMNS = """id, title, work_type, subject, description, 
+                           price_points, rating, downloads, category, preview_image_url, author_id, preview_urls,
+                           author_name, language, software, views_count, reviews_count, keywords, file_url, downloads_count, discount,
+                           created_at, image_variants"""
+
+# Колонки страницы работы, порядок соответствует work_detail_from_row
+DETAIL_COLUMNS = """id, title, work_type, subject, description, composition, 
+                           price_points, rating, downloads, created_at, yandex_disk_link, 
+                           preview_image_url, file_url, author_id, preview_urls,
+                           author_name, language, software, views_count, reviews_count, keywords, downloads_count, cover_images, discount, image_variants"""
+# Максимум работ в одном запросе ?ids=
+MAX_BATCH_IDS = 200
+
+# Соседей в work_neighbors хранится не больше TOP_K билдера
+RELATED_LIMIT = 12
+
+TOTAL_MODES = ('exact', 'estimate', 'none')
+# Порог точного подсчёта для фильтрованных выборок в режиме estimate
+TOTAL_COUNT_CAP = 1000
+
+# Статические снапшоты каталога в Object Storage (для загрузки SPA напрямую с CDN)
+SNAPSHOT_BUCKET = 'kyra'
+SNAPSHOT_PREFIX = 'catalog-snapshots/v1'
+# Шард — диапазон id фиксированной ширины: новая, одобренная или удалённая работа меняет
+# только свой шард, остальные совпадают по содержимому и повторно не выгружаются
+SNAPSHOT_SHARD_ID_SPAN = 500
+SNAPSHOT_ALL = 'all'
+# Старые шарды удаляются не сразу: клиенты могли закэшировать предыдущий манифест
+SNAPSHOT_DELETE_GRACE = 600
+
+# Импорт с Яндекс.Диска: размер одного INSERT и срок жизни закэшированного листинга
+IMPORT_BATCH_SIZE = 500
+IMPORT_LISTING_TTL_MINUTES = 60
+
+# Подсказки поиска: индекс живёт в памяти инстанса
+SUGGEST_CHECK_INTERVAL = 60
+SUGGEST_LIMIT = 10
+SUGGEST_SCAN_LIMIT = 500
+_suggest_index: Optional[Dict[str, Any]] = None
+
+FACET_NAMES = ('category', 'work_type', 'subject', 'software', 'language')
+FACETS_CACHE_SIZE = 256
+_facets_cache: OrderedDict = OrderedDict()
+
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL)
 
+def record_counter(cur, work_id: int, counter: str, delta: int = 1) -> None:
+    """Записать инкремент счётчика без UPDATE горячей строки works"""
+    cur.execute(f"""
+        INSERT INTO t_p63326274_course_download_plat.counter_events (target, target_id, counter, delta)
+        VALUES ('works', {int(work_id)}, '{counter}', {int(delta)})
+    """)
+    _counter_state['recorded'] += 1
+
+def flush_counters(conn) -> int:
+    """Слить накопленные события в works батчевыми UPDATE ... FROM (VALUES ...)"""
+    cur = conn.cursor()
+    try:
+        # Удаление и применение в одной транзакции: при сбое события остаются в таблице
+        cur.execute(f"""
+            DELETE FROM t_p63326274_course_download_plat.counter_events
+            WHERE id IN (
+                SELECT id FROM t_p63326274_course_download_plat.counter_events
+                WHERE target = 'works'
+                ORDER BY id
+                LIMIT {COUNTER_FLUSH_MAX_EVENTS}
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING target_id, counter, delta
+        """)
+        events = cur.fetchall()
+        
+        totals: Dict[str, Dict[int, int]] = {}
+        for target_id, counter, delta in events:
+            if counter in COUNTER_COLUMNS:
+                per_work = totals.setdefault(counter, {})
+                per_work[target_id] = per_work.get(target_id, 0) + delta
+        
+        for counter, per_work in totals.items():
+            values_sql = ', '.join(f"({int(work_id)}, {int(delta)})" for work_id, delta in per_work.items())
+            cur.execute(f"""
+                UPDATE t_p63326274_course_download_plat.works AS w
+                SET {counter} = COALESCE(w.{counter}, 0) + v.delta
+                FROM (VALUES {values_sql}) AS v(id, delta)
+                WHERE w.id = v.id
+            """)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    _counter_state['recorded'] = 0
+    _counter_state['last_flush'] = time.monotonic()
+    return len(events)
+
+def maybe_flush_counters(conn) -> None:
+    """Сливать счётчики по порогу размера или времени для этого инстанса"""
+    elapsed = time.monotonic() - _counter_state['last_flush']
+    if _counter_state['recorded'] >= COUNTER_FLUSH_BATCH or elapsed >= COUNTER_FLUSH_INTERVAL:
+        try:
+            flushed = flush_counters(conn)
+            if flushed:
+                print(f"📈 Слито событий счётчиков: {flushed}")
+        except Exception as e:
+            print(f"⚠️ Не удалось слить счётчики: {e}")
+
+def get_cache_version(cur, scope: str) -> int:
+    """Текущая версия данных (инкрементируется триггерами, см. V0102)"""
+    cur.execute(f"SELECT version FROM t_p63326274_course_download_plat.cache_versions WHERE scope = '{scope}'")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def make_etag(scope: str, version: int, params: Dict[str, Any]) -> str:
+    """Сильный ETag: версия данных + нормализованные параметры запроса"""
+    key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(f'{scope}:{version}:{key}'.encode('utf-8')).hexdigest()[:32] + '"'
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    """Совпадает ли If-None-Match клиента с текущим ETag"""
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in candidates or '*' in candidates
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    return {
+        'ETag': etag,
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Origin, Accept-Encoding',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
+        'body': ''
+    }
+
+def encode_cursor(created_at: datetime, work_id: int) -> str:
+    """Упаковать позицию (created_at, id) в непрозрачный курсор"""
+    raw = json.dumps([created_at.isoformat(), work_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Распаковать курсор обратно в (created_at, id), ValueError при ошибке"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at_str, work_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at_str), int(work_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def build_search_tsquery(search: str) -> Optional[str]:
+    """Собрать префиксный tsquery (русская морфология) из поисковой строки; None — в строке нет слов"""
+    tokens = re.findall(r'[^\W_]+', search.lower())
+    if not tokens:
+        return None
+    terms = ' & '.join(f"{token}:*" for token in tokens[:8])
+    return f"to_tsquery('russian', '{terms}')"
+
+def build_catalog_where(query_params: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """WHERE для выборки каталога и tsquery поиска (если он есть)"""
+    category = query_params.get('category')
+    search = query_params.get('search')
+    author_id = query_params.get('author_id')
+    
+    # Базовый запрос
+    where_clauses = []
+    
+    # Исключаем удалённые записи
+    where_clauses.append("title NOT LIKE '[УДАЛЕНО]%'")
+    
+    # Фильтрация по статусу
+    status_filter = query_params.get('status')
+    if status_filter:
+        safe_status = status_filter.replace("'", "''")
+        where_clauses.append(f"status = '{safe_status}'")
+    elif not author_id:
+        # Для каталога показываем только одобренные работы
+        where_clauses.append("status = 'approved'")
+    
+    # Фильтрация по автору (для профиля пользователя)
+    if author_id:
+        where_clauses.append(f"author_id = {int(author_id)}")
+    
+    if category and category != 'all':
+        safe_category = category.replace("'", "''")
+        where_clauses.append(f"category = '{safe_category}'")
+    
+    # Полнотекстовый поиск по search_vector (GIN-индекс) вместо ILIKE.
+    # Строка только из знаков препинания не даёт tsquery, а только из стоп-слов («и», «по») —
+    # пустой tsquery, который ничему не соответствует; в обоих случаях поиск не фильтрует.
+    # numnode от константы сворачивается при планировании, индекс по-прежнему используется
+    ts_query = build_search_tsquery(search) if search else None
+    if ts_query:
+        where_clauses.append(f"(numnode({ts_query}) = 0 OR search_vector @@ {ts_query})")
+    
+    return " AND ".join(where_clauses), ts_query
+
+def get_catalog_total(cur, query_params: Dict[str, Any], where_sql: str, total_mode: str) -> Tuple[Optional[int], bool]:
+    """Общее количество работ для выдачи и признак того, что оно точное"""
+    if total_mode == 'none':
+        return None, False
+    
+    # Без поиска и автора total читается из works_counts (поддерживается триггером)
+    if not query_params.get('search') and not query_params.get('author_id'):
+        safe_status = (query_params.get('status') or 'approved').replace("'", "''")
+        category = query_params.get('category')
+        count_sql = f"""
+            SELECT COALESCE(SUM(total), 0) FROM t_p63326274_course_download_plat.works_counts
+            WHERE status = '{safe_status}'
+        """
+        if category and category != 'all':
+            safe_category = category.replace("'", "''")
+            count_sql += f" AND category = '{safe_category}'"
+        cur.execute(count_sql)
+        return int(cur.fetchone()[0]), True
+    
+    if total_mode == 'exact':
+        cur.execute(f"SELECT COUNT(*) FROM t_p63326274_course_download_plat.works WHERE {where_sql}")
+        return cur.fetchone()[0], True
+    
+    # estimate: точный счёт до порога, дальше оценка планировщика
+    cur.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM t_p63326274_course_download_plat.works WHERE {where_sql} LIMIT {TOTAL_COUNT_CAP + 1}
+        ) AS capped
+    """)
+    capped = cur.fetchone()[0]
+    if capped <= TOTAL_COUNT_CAP:
+        return capped, True
+    
+    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM t_p63326274_course_download_plat.works WHERE {where_sql}")
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return max(int(plan[0]['Plan']['Plan Rows']), TOTAL_COUNT_CAP + 1), False
+
+def get_catalog_facets(cur, query_params: Dict[str, Any], version: int) -> Dict[str, Any]:
+    """Счётчики по всем фасетам каталога за один проход (GROUPING SETS)"""
+    search = query_params.get('search') or ''
+    cache_key = json.dumps([
+        query_params.get('category') or 'all',
+        re.findall(r'[^\W_]+', search.lower()),
+        query_params.get('status'),
+        query_params.get('author_id')
+    ], ensure_ascii=False)
+    
+    # Кэш на тёплый инстанс; версия 'works' меняется при модерации и правках работ
+    cached = _facets_cache.get(cache_key)
+    if cached and cached[0] == version:
+        _facets_cache.move_to_end(cache_key)
+        return cached[1]
+    
+    where_sql, _ = build_catalog_where(query_params)
+    cur.execute(f"""
+        SELECT CASE
+                   WHEN GROUPING(w.category) = 0 THEN 'category'
+                   WHEN GROUPING(w.work_type) = 0 THEN 'work_type'
+                   WHEN GROUPING(w.subject) = 0 THEN 'subject'
+                   WHEN GROUPING(w.language) = 0 THEN 'language'
+                   WHEN GROUPING(sw.value) = 0 THEN 'software'
+                   ELSE 'total'
+               END AS facet,
+               COALESCE(w.category, w.work_type, w.subject, w.language, sw.value) AS value,
+               COUNT(DISTINCT w.id)
+        FROM t_p63326274_course_download_plat.works w
+        LEFT JOIN LATERAL jsonb_array_elements_text(
+            CASE WHEN w.software LIKE '[%' THEN w.software::jsonb ELSE '[]'::jsonb END
+        ) AS sw(value) ON TRUE
+        WHERE {where_sql}
+        GROUP BY GROUPING SETS ((w.category), (w.work_type), (w.subject), (w.language), (sw.value), ())
+    """)
+    
+    facets: Dict[str, List[Dict[str, Any]]] = {name: [] for name in FACET_NAMES}
+    total = 0
+    for facet, value, count in cur.fetchall():
+        if facet == 'total':
+            total = count
+        elif value:
+            facets[facet].append({'value': value, 'count': count})
+    for values in facets.values():
+        values.sort(key=lambda item: (-item['count'], item['value']))
+    
+    result = {'facets': facets, 'total': total}
+    _facets_cache[cache_key] = (version, result)
+    if len(_facets_cache) > FACETS_CACHE_SIZE:
+        _facets_cache.popitem(last=False)
+    return result
+
+def normalize_suggest_text(text: str) -> str:
+    return ' '.join(re.findall(r'[^\W_]+', (text or '').lower().replace('ё', 'е')))
+
+def build_suggest_index(cur, version: int) -> Dict[str, Any]:
+    """Отсортированный массив ключей для префиксного поиска: хвосты названий с каждого слова,
+    ключевые слова и предметы одобренных работ"""
+    cur.execute("""
+        SELECT id, title, keywords, subject, COALESCE(views_count, 0) + 10 * COALESCE(downloads_count, 0)
+        FROM t_p63326274_course_download_plat.works
+        WHERE status = 'approved' AND title NOT LIKE '[УДАЛЕНО]%'
+    """)
+    
+    entries: List[Dict[str, Any]] = []
+    weights: List[int] = []
+    terms: Dict[Tuple[str, str], int] = {}
+    pairs: List[Tuple[str, int]] = []
+    
+    def add_term(kind: str, text: str, weight: int) -> None:
+        text = (text or '').strip()
+        normalized = normalize_suggest_text(text)
+        if not normalized:
+            return
+        index = terms.get((kind, normalized))
+        if index is None:
+            index = terms[(kind, normalized)] = len(entries)
+            entries.append({'type': kind, 'text': text})
+            weights.append(0)
+            pairs.append((normalized, index))
+        weights[index] += weight
+    
+    for work_id, title, keywords, subject, popularity in cur.fetchall():
+        normalized = normalize_suggest_text(title)
+        if normalized:
+            index = len(entries)
+            entries.append({'type': 'work', 'text': title, 'id': work_id})
+            weights.append(popularity)
+            words = normalized.split(' ')
+            for position in range(len(words)):
+                pairs.append((' '.join(words[position:]), index))
+        
+        try:
+            keyword_list = json.loads(keywords) if keywords else []
+        except (TypeError, ValueError):
+            keyword_list = [keywords]
+        for keyword in keyword_list if isinstance(keyword_list, list) else []:
+            add_term('keyword', str(keyword), 1)
+        add_term('subject', subject, 1)
+    
+    pairs.sort()
+    return {
+        'version': version,
+        'checked_at': time.monotonic(),
+        'keys': [key for key, _ in pairs],
+        'refs': [index for _, index in pairs],
+        'entries': entries,
+        'weights': weights
+    }
+
+def get_suggest_index() -> Dict[str, Any]:
+    """Индекс подсказок текущего инстанса; водяной знак (версия works) проверяется не чаще SUGGEST_CHECK_INTERVAL"""
+    global _suggest_index
+    index = _suggest_index
+    if index and time.monotonic() - index['checked_at'] < SUGGEST_CHECK_INTERVAL:
+        return index
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        version = get_cache_version(cur, 'works')
+        if index and index['version'] == version:
+            index['checked_at'] = time.monotonic()
+            return index
+        started = time.monotonic()
+        _suggest_index = build_suggest_index(cur, version)
+        print(f"🔤 Индекс подсказок перестроен: {len(_suggest_index['keys'])} ключей за {int((time.monotonic() - started) * 1000)} мс")
+        return _suggest_index
+    finally:
+        cur.close()
+        conn.close()
+
+def suggest(index: Dict[str, Any], query: str, limit: int) -> List[Dict[str, Any]]:
+    """Подсказки по префиксу: бинарный поиск по отсортированным ключам, лучшие по популярности"""
+    prefix = normalize_suggest_text(query)
+    if not prefix:
+        return []
+    
+    keys = index['keys']
+    refs = index['refs']
+    position = bisect_left(keys, prefix)
+    candidates = set()
+    while position < len(keys) and keys[position].startswith(prefix) and len(candidates) < SUGGEST_SCAN_LIMIT:
+        candidates.add(refs[position])
+        position += 1
+    
+    weights = index['weights']
+    best = sorted(candidates, key=lambda ref: (-weights[ref], ref))[:limit]
+    return [index['entries'][ref] for ref in best]
+
+def catalog_item_from_row(row: tuple) -> Dict[str, Any]:
+    """Карточка работы для выдачи каталога из строки CATALOG_COLUMNS"""
+    work_id = row[0]
+    
+    preview_urls_str = row[11]
+    if isinstance(preview_urls_str, str):
+        preview_urls = json.loads(preview_urls_str) if preview_urls_str else []
+    elif isinstance(preview_urls_str, list):
+        preview_urls = preview_urls_str
+    else:
+        preview_urls = []
+    
+    software_str = row[14]
+    if isinstance(software_str, str):
+        software = json.loads(software_str) if software_str and software_str != '[]' else []
+    elif isinstance(software_str, list):
+        software = software_str
+    else:
+        software = []
+    
+    keywords_str = row[17]
+    if isinstance(keywords_str, str):
+        keywords = json.loads(keywords_str) if keywords_str and keywords_str != '[]' else []
+    elif isinstance(keywords_str, list):
+        keywords = keywords_str
+    else:
+        keywords = []
+    
+    work = {
+        'id': work_id,
+        'title': row[1],
+        'work_type': row[2],
+        'subject': row[3],
+        'preview': row[4][:150] + '...' if row[4] and len(row[4]) > 150 else (row[4] or ''),
+        'price_points': row[5],
+        'rating': float(row[6]) if row[6] else 0,
+        'downloads': row[7] or 0,
+        'category': row[8],
+        'preview_image_url': row[9],
+        'author_id': row[10],
+        'preview_urls': preview_urls,
+        'author_name': row[12],
+        'language': row[13] or 'Русский',
+        'software': software,
+        'views_count': row[15] or 0,
+        'reviews_count': row[16] or 0,
+        'keywords': keywords,
+        'file_url': row[18],
+        'downloads_count': row[19] or 0,
+        'discount': row[20] or 0,
+        'image_variants': row[22] or {}
+    }
+    return work
+
+def get_s3_client():
+    return boto3.client(
+        's3',
+        endpoint_url='https://storage.yandexcloud.net',
+        aws_access_key_id=os.environ.get('YANDEX_S3_KEY_ID'),
+        aws_secret_access_key=os.environ.get('YANDEX_S3_SECRET_KEY'),
+        region_name='ru-central1'
+    )
+
+def snapshot_slug(category: str) -> str:
+    """Безопасная часть ключа S3 для категории"""
+    slug = re.sub(r'[^a-z0-9_-]', '', category.lower())
+    return slug or 'c' + hashlib.sha1(category.encode('utf-8')).hexdigest()[:10]
+
+def load_snapshot_manifest(s3) -> Dict[str, Any]:
+    try:
+        obj = s3.get_object(Bucket=SNAPSHOT_BUCKET, Key=f'{SNAPSHOT_PREFIX}/manifest.json')
+        return json.loads(obj['Body'].read())
+    except s3.exceptions.NoSuchKey:
+        return {'categories': {}, 'pending_delete': []}
+
+def render_snapshot_pages(cur, category: str) -> Tuple[List[Tuple[int, bytes, int]], int]:
+    """
+    Отрисовать одобренные работы категории в gzip-JSON шарды по диапазонам id (от новых к старым).
+    Общее число работ в шарды не пишется — оно только в манифесте
+    """
+    where_sql = "title NOT LIKE '[УДАЛЕНО]%' AND status = 'approved'"
+    if category != SNAPSHOT_ALL:
+        safe_category = category.replace("'", "''")
+        where_sql += f" AND category = '{safe_category}'"
+    cur.execute(f"""
+        SELECT {CATALOG_COLUMNS}
+        FROM t_p63326274_course_download_plat.works
+        WHERE {where_sql}
+        ORDER BY id DESC
+    """)
+    items = [catalog_item_from_row(row) for row in cur.fetchall()]
+    total = len(items)
+    
+    shards: Dict[int, List[Dict[str, Any]]] = {}
+    for item in items:
+        shards.setdefault(item['id'] // SNAPSHOT_SHARD_ID_SPAN, []).append(item)
+    
+    pages = []
+    for shard, chunk in shards.items():
+        payload = json.dumps(
+            {'category': category, 'shard': shard, 'works': chunk},
+            ensure_ascii=False, separators=(',', ':')
+        )
+        # mtime=0 даёт одинаковые байты для одинакового содержимого
+        pages.append((shard, gzip.compress(payload.encode('utf-8'), mtime=0), len(chunk)))
+    return pages, total
+
+def publish_catalog_snapshots(conn, full: bool = False) -> Dict[str, Any]:
+    """Перестроить шарды изменившихся категорий и опубликовать манифест"""
+    started = time.monotonic()
+    cur = conn.cursor()
+    try:
+        # Категории помечает триггер на works (V0105); при сбое пометки откатятся
+        cur.execute("DELETE FROM t_p63326274_course_download_plat.catalog_snapshot_dirty RETURNING category")
+        categories = {row[0] for row in cur.fetchall()}
+        if full:
+            cur.execute("""
+                SELECT DISTINCT category FROM t_p63326274_course_download_plat.works
+                WHERE status = 'approved' AND category IS NOT NULL
+            """)
+            categories |= {row[0] for row in cur.fetchall()}
+        
+        if not categories:
+            conn.commit()
+            return {'categories': [], 'uploaded': 0, 'unchanged': 0}
+        
+        s3 = get_s3_client()
+        manifest = load_snapshot_manifest(s3)
+        if full:
+            categories |= set(manifest['categories'])
+        categories.discard('')
+        categories.add(SNAPSHOT_ALL)
+        
+        uploaded = 0
+        unchanged = 0
+        now = time.time()
+        obsolete = []
+        
+        for category in sorted(categories):
+            pages, total = render_snapshot_pages(cur, category)
+            old_keys = {page['key'] for page in manifest['categories'].get(category, {}).get('pages', [])}
+            new_pages = []
+            
+            for shard, data, count in pages:
+                digest = hashlib.sha256(data).hexdigest()[:16]
+                key = f'{SNAPSHOT_PREFIX}/{snapshot_slug(category)}/shard-{shard}-{digest}.json.gz'
+                if key in old_keys:
+                    unchanged += 1
+                else:
+                    s3.put_object(
+                        Bucket=SNAPSHOT_BUCKET,
+                        Key=key,
+                        Body=data,
+                        ContentType='application/json',
+                        ContentEncoding='gzip',
+                        CacheControl='public, max-age=31536000, immutable',
+                        ACL='public-read'
+                    )
+                    uploaded += 1
+                new_pages.append({
+                    'shard': shard,
+                    'key': key,
+                    'url': f'https://storage.yandexcloud.net/{SNAPSHOT_BUCKET}/{key}',
+                    'count': count
+                })
+            
+            obsolete.extend(old_keys - {page['key'] for page in new_pages})
+            if total:
+                manifest['categories'][category] = {'total': total, 'pages': new_pages}
+            else:
+                manifest['categories'].pop(category, None)
+        
+        # Удаляем шарды, которые вышли из манифеста больше SNAPSHOT_DELETE_GRACE секунд назад
+        pending = manifest.get('pending_delete', [])
+        expired = [item['key'] for item in pending if now - item['since'] > SNAPSHOT_DELETE_GRACE]
+        for start in range(0, len(expired), 1000):
+            s3.delete_objects(
+                Bucket=SNAPSHOT_BUCKET,
+                Delete={'Objects': [{'Key': key} for key in expired[start:start + 1000]]}
+            )
+        manifest['pending_delete'] = [item for item in pending if item['key'] not in set(expired)]
+        manifest['pending_delete'] += [{'key': key, 'since': now} for key in obsolete]
+        
+        manifest.pop('page_size', None)
+        manifest['shard_id_span'] = SNAPSHOT_SHARD_ID_SPAN
+        manifest['generated_at'] = datetime.utcnow().isoformat() + 'Z'
+        s3.put_object(
+            Bucket=SNAPSHOT_BUCKET,
+            Key=f'{SNAPSHOT_PREFIX}/manifest.json',
+            Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json',
+            CacheControl='public, max-age=60',
+            ACL='public-read'
+        )
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    
+    elapsed = time.monotonic() - started
+    print(f"🗂️ Снапшоты каталога: категорий {len(categories)}, загружено {uploaded}, без изменений {unchanged}, {elapsed:.1f} с")
+    return {'categories': sorted(categories), 'uploaded': uploaded, 'unchanged': unchanged}
+
+def work_detail_from_row(row: tuple) -> Dict[str, Any]:
+    """Полная карточка работы из строки DETAIL_COLUMNS"""
+    preview_urls_str = row[14]
+    if isinstance(preview_urls_str, str):
+        preview_urls = json.loads(preview_urls_str) if preview_urls_str else []
+    elif isinstance(preview_urls_str, list):
+        preview_urls = preview_urls_str
+    else:
+        preview_urls = []
+    
+    software_str = row[17]
+    if isinstance(software_str, str):
+        software = json.loads(software_str) if software_str and software_str != '[]' else []
+    elif isinstance(software_str, list):
+        software = software_str
+    else:
+        software = []
+    
+    keywords_str = row[20]
+    if isinstance(keywords_str, str):
+        keywords = json.loads(keywords_str) if keywords_str and keywords_str != '[]' else []
+    elif isinstance(keywords_str, list):
+        keywords = keywords_str
+    else:
+        keywords = []
+    
+    cover_images = row[22] if row[22] else []
+    if not isinstance(cover_images, list):
+        cover_images = []
+    
+    work = {
+        'id': row[0],
+        'title': row[1],
+        'work_type': row[2],
+        'subject': row[3],
+        'description': row[4],
+        'composition': row[5],
+        'price_points': row[6],
+        'rating': float(row[7]) if row[7] else 0,
+        'downloads': row[8],
+        'created_at': row[9].isoformat() if row[9] else None,
+        'yandex_disk_link': row[10],
+        'preview_image_url': row[11],
+        'file_url': row[12],
+        'author_id': row[13],
+        'preview_urls': preview_urls,
+        'author_name': row[15],
+        'language': row[16] or 'Русский',
+        'software': software,
+        'views_count': row[18] or 0,
+        'reviews_count': row[19] or 0,
+        'keywords': keywords,
+        'downloads_count': row[21] or 0,
+        'cover_images': cover_images,
+        'discount': row[23] or 0,
+        'image_variants': row[24] or {}
+    }
+    return work
+
+def fetch_work_details(cur, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Карточки работ вместе с work_files одним запросом"""
+    ids_sql = ', '.join(str(int(i)) for i in ids)
+    cur.execute(f"""
+        SELECT {DETAIL_COLUMNS},
+               COALESCE((
+                   SELECT json_agg(json_build_object('url', f.file_url, 'type', f.file_type, 'order', f.display_order)
+                                   ORDER BY f.display_order)
+                   FROM t_p63326274_course_download_plat.work_files f
+                   WHERE f.work_id = works.id
+               ), '[]'::json)
+        FROM t_p63326274_course_download_plat.works
+        WHERE id = ANY(ARRAY[{ids_sql}])
+    """)
+    
+    details = {}
+    for row in cur.fetchall():
+        work = work_detail_from_row(row)
+        files = row[25]
+        work['files'] = json.loads(files) if isinstance(files, str) else files
+        details[work['id']] = work
+    return details
+
 def get_yandex_disk_folders(public_key: str) -> List[Dict[str, Any]]:
-    """Получить список папок с прямыми ссылками для скачивания"""
+    """Получить список папок с прямыми ссылками для скачивания (все страницы листинга)"""
     url = 'https://cloud-api.yandex.net/v1/disk/public/resources'
-    params = {'public_key': public_key, 'limit': 1000}
+    page_size = 1000
     
     print(f"🔍 Получаю список папок из Яндекс.Диска: {public_key}")
-    response = requests.get(url, params=params)
-    data = response.json()
     
     folders = []
-    if '_embedded' in data and 'items' in data['_embedded']:
-        print(f"✅ Найдено элементов в корне: {len(data['_embedded']['items'])}")
-        for item in data['_embedded']['items']:
+    offset = 0
+    while True:
+        params = {'public_key': public_key, 'limit': page_size, 'offset': offset}
+        response = requests.get(url, params=params, timeout=30)
+        data = response.json()
+        items = data.get('_embedded', {}).get('items', [])
+        
+        for item in items:
             if item['type'] == 'dir':
-                folder_name = item['name']
-                folder_public_url = item.get('public_url', '')
-                print(f"📁 Добавляю папку: {folder_name}")
-                
                 folders.append({
-                    'name': folder_name,
-                    'public_url': folder_public_url
+                    'name': item['name'],
+                    'public_url': item.get('public_url', '')
                 })
+        
+        if len(items) < page_size:
+            break
+        offset += page_size
     
     print(f"📊 Итого папок для импорта: {len(folders)}")
     return folders
 
-def get_files_in_folder(public_key: str, folder_path: str) -> List[Dict[str, Any]]:
-    """Получить все файлы из конкретной папки по пути"""
-    url = 'https://cloud-api.yandex.net/v1/disk/public/resources'
-    params = {'public_key': public_key, 'path': folder_path, 'limit': 1000}
+def load_import_job(cur, public_key: str, restart: bool = False) -> Dict[str, Any]:
+    """Задание импорта с закэшированным листингом; листинг обновляется по TTL или restart"""
+    safe_key = public_key.replace("'", "''")
+    cur.execute(f"""
+        SELECT folders, next_offset, listed_at > NOW() - INTERVAL '{IMPORT_LISTING_TTL_MINUTES} minutes'
+        FROM t_p63326274_course_download_plat.import_jobs
+        WHERE public_key = '{safe_key}'
+    """)
+    row = cur.fetchone()
+    if row and row[2] and not restart:
+        folders = json.loads(row[0]) if isinstance(row[0], str) else row[0]
+        return {'folders': folders, 'next_offset': row[1]}
     
-    response = requests.get(url, params=params)
-    data = response.json()
+    folders = get_yandex_disk_folders(public_key)
+    folders_json = json.dumps(folders, ensure_ascii=False).replace("'", "''")
+    cur.execute(f"""
+        INSERT INTO t_p63326274_course_download_plat.import_jobs
+            (public_key, folders, total, next_offset, imported, skipped, listed_at, updated_at)
+        VALUES ('{safe_key}', '{folders_json}'::jsonb, {len(folders)}, 0, 0, 0, NOW(), NOW())
+        ON CONFLICT (public_key) DO UPDATE SET
+            folders = EXCLUDED.folders, total = EXCLUDED.total, next_offset = 0,
+            imported = 0, skipped = 0, listed_at = NOW(), updated_at = NOW()
+    """)
+    return {'folders': folders, 'next_offset': 0}
+
+def save_import_checkpoint(cur, public_key: str, next_offset: int, imported: int, skipped: int) -> None:
+    safe_key = public_key.replace("'", "''")
+    cur.execute(f"""
+        UPDATE t_p63326274_course_download_plat.import_jobs
+        SET next_offset = GREATEST(next_offset, {int(next_offset)}),
+            imported = imported + {int(imported)},
+            skipped = skipped + {int(skipped)},
+            updated_at = NOW()
+        WHERE public_key = '{safe_key}'
+    """)
+
+def import_folders_batch(cur, folders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Вставить пачку папок одним INSERT ... ON CONFLICT DO NOTHING, вернуть созданные работы"""
+    if not folders:
+        return []
     
-    files = []
-    if '_embedded' in data and 'items' in data['_embedded']:
-        for item in data['_embedded']['items']:
-            if item['type'] == 'file':
-                file_path = item['path']
-                download_url_endpoint = f"https://cloud-api.yandex.net/v1/disk/public/resources/download?public_key={public_key}&path={file_path}"
-                
-                try:
-                    dl_response = requests.get(download_url_endpoint)
-                    dl_data = dl_response.json()
-                    file_url = dl_data.get('href', '')
-                    
-                    if file_url:
-                        files.append({
-                            'name': item['name'],
-                            'download_url': file_url,
-                            'mime_type': item.get('mime_type', ''),
-                            'size': item.get('size', 0)
-                        })
-                except Exception as e:
-                    pass
-    
-    return files
+    rows = []
+    names_by_link = {}
+    for folder in folders:
+        parsed = parse_work_title_and_type(folder['name'])
+        title = parsed['title']
+        work_type = parsed['work_type']
+        link = folder.get('public_url') or ''
+        if link:
+            names_by_link[link] = folder['name']
+        
+        description = f'Работа по теме: {title}. Тип работы: {work_type}.'
+        values = [title, work_type, 'общий', description, 'Документация и файлы']
+        safe_values = ', '.join("'" + value.replace("'", "''") + "'" for value in values)
+        safe_link = link.replace("'", "''")
+        rows.append(f"({safe_values}, 150, NULLIF('{safe_link}', ''))")
+    
+    cur.execute(f"""
+        INSERT INTO t_p63326274_course_download_plat.works
+            (title, work_type, subject, description, composition, price_points, yandex_disk_link)
+        VALUES {', '.join(rows)}
+        ON CONFLICT (yandex_disk_link) WHERE yandex_disk_link IS NOT NULL DO NOTHING
+        RETURNING id, title, yandex_disk_link
+    """)
+    return [
+        {'filename': names_by_link.get(link, title), 'work_id': work_id, 'title': title}
+        for work_id, title, link in cur.fetchall()
+    ]
+
+# Таблицы со ссылкой на работу, уникальные по (пользователь, работа): при слиянии дубликатов
+# запись переносится на оставшуюся работу, если у пользователя её там ещё нет
+MERGE_USER_TABLES = (('purchases', 'buyer_id'), ('favorites', 'user_id'), ('reviews', 'user_id'))
+# events — ещё не свёрнутые скачивания дубликата засчитываются оставшейся работе
+MERGE_PLAIN_TABLES = ('plagiarism_checks', 'author_earnings', 'user_downloads', 'orders', 'events')
+# Ссылки на purchases.id: перед удалением лишней покупки переводятся на оставшуюся
+MERGE_PURCHASE_REFERENCES = (('author_earnings', 'purchase_id'),)
+
+# Дубликат — то же название у того же автора и того же типа работы: одноимённые работы
+# разных авторов не сливаются, иначе продажи и отзывы одного автора уйдут другому
+DUPLICATES_RANKED_SQL = """
+    SELECT id, title, status, title_fingerprint, author_id, work_type,
+           FIRST_VALUE(id) OVER w AS survivor_id,
+           ROW_NUMBER() OVER w AS rn,
+           COUNT(*) OVER (PARTITION BY title_fingerprint, author_id, work_type) AS group_size
+    FROM t_p63326274_course_download_plat.works
+    WHERE title NOT LIKE '[УДАЛЕНО]%' AND title_fingerprint <> ''
+    WINDOW w AS (PARTITION BY title_fingerprint, author_id, work_type ORDER BY (status = 'approved') DESC, id)
+"""
+
+def find_duplicate_works(cur) -> List[Dict[str, Any]]:
+    """Отчёт о группах дубликатов (отпечаток названия, автор, тип) без изменений в базе"""
+    cur.execute(f"""
+        SELECT r.title_fingerprint, r.author_id, r.work_type, r.id, r.title, r.status, r.rn,
+               (SELECT COUNT(*) FROM t_p63326274_course_download_plat.purchases p WHERE p.work_id = r.id)
+        FROM ({DUPLICATES_RANKED_SQL}) r
+        WHERE r.group_size > 1
+        ORDER BY r.title_fingerprint, r.author_id, r.work_type, r.rn
+    """)
+    
+    groups = []
+    for fingerprint, author_id, work_type, work_id, title, status, rn, purchases in cur.fetchall():
+        work = {'id': work_id, 'title': title, 'status': status, 'purchases': purchases}
+        if rn == 1:
+            groups.append({'fingerprint': fingerprint, 'author_id': author_id, 'work_type': work_type,
+                           'survivor': work, 'duplicates': []})
+        else:
+            groups[-1]['duplicates'].append(work)
+    return groups
+
+def merge_duplicate_works(cur) -> int:
+    """Слить дубликаты в оставшуюся работу: покупки, отзывы и избранное переносятся, дубликаты удаляются"""
+    cur.execute(f"""
+        CREATE TEMP TABLE work_merges ON COMMIT DROP AS
+        SELECT id AS duplicate_id, survivor_id FROM ({DUPLICATES_RANKED_SQL}) r
+        WHERE r.rn > 1
+    """)
+    cur.execute("SELECT COUNT(*) FROM work_merges")
+    merged = cur.fetchone()[0]
+    if not merged:
+        return 0
+    
+    for table, user_column in MERGE_USER_TABLES:
+        if table == 'purchases':
+            # Оставшаяся покупка — у сохраняемой работы, иначе первая по id (как в DELETE ниже);
+            # начисления автору по удаляемым покупкам переходят на неё
+            for ref_table, ref_column in MERGE_PURCHASE_REFERENCES:
+                cur.execute(f"""
+                    UPDATE t_p63326274_course_download_plat.{ref_table} ref
+                    SET {ref_column} = k.kept_id
+                    FROM (
+                        SELECT t.id AS purchase_id, (
+                            SELECT o.id FROM t_p63326274_course_download_plat.purchases o
+                            LEFT JOIN work_merges om ON om.duplicate_id = o.work_id
+                            WHERE o.buyer_id = t.buyer_id
+                              AND COALESCE(om.survivor_id, o.work_id) = m.survivor_id
+                            ORDER BY (o.work_id = m.survivor_id) DESC, o.id
+                            LIMIT 1
+                        ) AS kept_id
+                        FROM t_p63326274_course_download_plat.purchases t
+                        JOIN work_merges m ON t.work_id = m.duplicate_id
+                    ) k
+                    WHERE ref.{ref_column} = k.purchase_id AND k.kept_id <> k.purchase_id
+                """)
+        # Запись остаётся одна на пользователя: у оставшейся работы или у первой из дубликатов
+        cur.execute(f"""
+            DELETE FROM t_p63326274_course_download_plat.{table} t
+            USING work_merges m
+            WHERE t.work_id = m.duplicate_id AND EXISTS (
+                SELECT 1 FROM t_p63326274_course_download_plat.{table} o
+                LEFT JOIN work_merges om ON om.duplicate_id = o.work_id
+                WHERE o.{user_column} = t.{user_column}
+                  AND COALESCE(om.survivor_id, o.work_id) = m.survivor_id
+                  AND (o.work_id = m.survivor_id OR o.id < t.id)
+            )
+        """)
+        cur.execute(f"""
+            UPDATE t_p63326274_course_download_plat.{table} t
+            SET work_id = m.survivor_id
+            FROM work_merges m
+            WHERE t.work_id = m.duplicate_id
+        """)
+    
+    for table in MERGE_PLAIN_TABLES:
+        cur.execute(f"""
+            UPDATE t_p63326274_course_download_plat.{table} t
+            SET work_id = m.survivor_id
+            FROM work_merges m
+            WHERE t.work_id = m.duplicate_id
+        """)
+    
+    cur.execute("""
+        DELETE FROM t_p63326274_course_download_plat.work_files f
+        USING work_merges m
+        WHERE f.work_id = m.duplicate_id
+    """)
+    cur.execute("""
+        DELETE FROM t_p63326274_course_download_plat.works w
+        USING work_merges m
+        WHERE w.id = m.duplicate_id
+    """)
+    cur.execute("""
+        UPDATE t_p63326274_course_download_plat.works w
+        SET reviews_count = (
+            SELECT COUNT(*) FROM t_p63326274_course_download_plat.reviews r WHERE r.work_id = w.id
+        )
+        WHERE w.id IN (SELECT DISTINCT survivor_id FROM work_merges)
+    """)
+    return merged
 
 def parse_work_title_and_type(folder_name: str) -> Dict[str, str]:
     """Извлечь название и тип работы из названия папки"""
@@ -156,7 +1021,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Email',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Email, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -166,224 +1031,182 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         query_params = event.get('queryStringParameters') or {}
         work_id = query_params.get('id')
         
+        if query_params.get('action') == 'suggest':
+            # Подсказки отвечают из памяти, база нужна только для перестроения индекса
+            limit = min(max(int(query_params.get('limit', SUGGEST_LIMIT)), 1), SUGGEST_LIMIT)
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Cache-Control': f'public, max-age={SUGGEST_CHECK_INTERVAL}'},
+                'body': json.dumps({'suggestions': suggest(get_suggest_index(), query_params.get('q', ''), limit)}, ensure_ascii=False)
+            }
+        
         conn = get_db_connection()
         cur = conn.cursor()
         
         try:
-            if work_id:
+            # Версия каталога меняется только при изменении контента работ,
+            # поэтому неизменившийся ответ отдаём как 304 без основного запроса
+            version = get_cache_version(cur, 'works')
+            etag = make_etag('works', version, query_params)
+            if is_not_modified(event, etag):
+                if work_id and not query_params.get('action'):
+                    record_counter(cur, int(work_id), 'views_count')
+                    conn.commit()
+                    maybe_flush_counters(conn)
+                return not_modified_response(etag)
+            
+            if query_params.get('action') == 'facets':
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
+                    'body': json.dumps(get_catalog_facets(cur, query_params, version))
+                }
+            
+            if query_params.get('action') == 'related':
+                # Похожие работы предрасчитаны офлайн (scripts/build_work_neighbors.py)
+                if not (work_id or '').isdigit():
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'id required'})
+                    }
+                limit = min(max(int(query_params.get('limit', RELATED_LIMIT)), 1), RELATED_LIMIT)
                 cur.execute(f"""
-                    SELECT id, title, work_type, subject, description, composition, 
-                           price_points, rating, downloads, created_at, yandex_disk_link, 
-                           preview_image_url, file_url, author_id, preview_urls,
-                           author_name, language, software, views_count, reviews_count, keywords, downloads_count, cover_images, discount
-                    FROM t_p63326274_course_download_plat.works WHERE id = {int(work_id)}
+                    SELECT {', '.join('w.' + c.strip() for c in CATALOG_COLUMNS.split(','))}
+                    FROM t_p63326274_course_download_plat.work_neighbors wn
+                    JOIN t_p63326274_course_download_plat.works w ON w.id = wn.neighbor_id
+                    WHERE wn.work_id = {int(work_id)} AND w.status = 'approved'
+                    ORDER BY wn.score DESC
+                    LIMIT {limit}
                 """)
-                row = cur.fetchone()
-                
-                if not row:
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
+                    'body': json.dumps({'works': [catalog_item_from_row(row) for row in cur.fetchall()]})
+                }
+            
+            ids_param = query_params.get('ids')
+            if ids_param is not None:
+                # Детали многих работ одним запросом, файлы агрегируются json_agg, просмотры не считаются
+                try:
+                    ids = list(dict.fromkeys(int(part) for part in ids_param.split(',') if part.strip()))
+                except ValueError:
+                    ids = None
+                if not ids or len(ids) > MAX_BATCH_IDS:
                     return {
-                        'statusCode': 404,
+                        'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Work not found'})
+                        'body': json.dumps({'error': f'ids must be 1..{MAX_BATCH_IDS} comma-separated integers'})
                     }
                 
-                preview_urls_str = row[14]
-                if isinstance(preview_urls_str, str):
-                    preview_urls = json.loads(preview_urls_str) if preview_urls_str else []
-                elif isinstance(preview_urls_str, list):
-                    preview_urls = preview_urls_str
-                else:
-                    preview_urls = []
-                
-                software_str = row[17]
-                if isinstance(software_str, str):
-                    software = json.loads(software_str) if software_str and software_str != '[]' else []
-                elif isinstance(software_str, list):
-                    software = software_str
-                else:
-                    software = []
+                found = fetch_work_details(cur, ids)
                 
-                keywords_str = row[20]
-                if isinstance(keywords_str, str):
-                    keywords = json.loads(keywords_str) if keywords_str and keywords_str != '[]' else []
-                elif isinstance(keywords_str, list):
-                    keywords = keywords_str
-                else:
-                    keywords = []
-                
-                cover_images = row[22] if row[22] else []
-                if not isinstance(cover_images, list):
-                    cover_images = []
-                
-                work = {
-                    'id': row[0],
-                    'title': row[1],
-                    'work_type': row[2],
-                    'subject': row[3],
-                    'description': row[4],
-                    'composition': row[5],
-                    'price_points': row[6],
-                    'rating': float(row[7]) if row[7] else 0,
-                    'downloads': row[8],
-                    'created_at': row[9].isoformat() if row[9] else None,
-                    'yandex_disk_link': row[10],
-                    'preview_image_url': row[11],
-                    'file_url': row[12],
-                    'author_id': row[13],
-                    'preview_urls': preview_urls,
-                    'author_name': row[15],
-                    'language': row[16] or 'Русский',
-                    'software': software,
-                    'views_count': row[18] or 0,
-                    'reviews_count': row[19] or 0,
-                    'keywords': keywords,
-                    'downloads_count': row[21] or 0,
-                    'cover_images': cover_images,
-                    'discount': row[23] or 0
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
+                    'body': json.dumps({
+                        'works': [found[i] for i in ids if i in found],
+                        'missing': [i for i in ids if i not in found]
+                    })
                 }
+            
+            if work_id:
+                work = fetch_work_details(cur, [int(work_id)]).get(int(work_id))
                 
-                cur.execute(f"""
-                    SELECT file_url, file_type, display_order
-                    FROM t_p63326274_course_download_plat.work_files WHERE work_id = {int(work_id)} ORDER BY display_order
-                """)
-                
-                work['files'] = [
-                    {'url': f[0], 'type': f[1], 'order': f[2]}
-                    for f in cur.fetchall()
-                ]
+                if not work:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Work not found'})
+                    }
                 
-                # Инкрементируем счётчик просмотров
-                cur.execute(f"""
-                    UPDATE t_p63326274_course_download_plat.works 
-                    SET views_count = COALESCE(views_count, 0) + 1 
-                    WHERE id = {int(work_id)}
-                """)
+                # Инкрементируем счётчик просмотров (отложенная запись)
+                record_counter(cur, int(work_id), 'views_count')
                 conn.commit()
+                maybe_flush_counters(conn)
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
                     'body': json.dumps(work)
                 }
             else:
                 # Пагинация и фильтрация
-                # Увеличен лимит до 1000 для отображения всех работ в каталоге
-                limit = int(query_params.get('limit', 1000))
+                # Курсор (created_at, id) для постраничной загрузки, offset остаётся для старых клиентов
+                cursor = query_params.get('cursor')
+                default_limit = DEFAULT_PAGE_SIZE if cursor is not None else LEGACY_PAGE_SIZE
+                limit = min(max(int(query_params.get('limit', default_limit)), 1), MAX_PAGE_SIZE)
                 offset = int(query_params.get('offset', 0))
-                category = query_params.get('category')
-                search = query_params.get('search')
-                author_id = query_params.get('author_id')
-                
-                # Базовый запрос
-                where_clauses = []
-                
-                # Исключаем удалённые записи
-                where_clauses.append("title NOT LIKE '[УДАЛЕНО]%'")
-                
-                # Фильтрация по статусу
-                status_filter = query_params.get('status')
-                if status_filter:
-                    safe_status = status_filter.replace("'", "''")
-                    where_clauses.append(f"status = '{safe_status}'")
-                elif not author_id:
-                    # Для каталога показываем только одобренные работы
-                    where_clauses.append("status = 'approved'")
-                
-                # Фильтрация по автору (для профиля пользователя)
-                if author_id:
-                    where_clauses.append(f"author_id = {int(author_id)}")
-                
-                if category and category != 'all':
-                    safe_category = category.replace("'", "''")
-                    where_clauses.append(f"category = '{safe_category}'")
-                
-                if search:
-                    safe_search = search.replace("'", "''")
-                    where_clauses.append(f"(title ILIKE '%{safe_search}%' OR description ILIKE '%{safe_search}%')")
+                after: Optional[Tuple[datetime, int]] = None
+                if cursor:
+                    try:
+                        after = decode_cursor(cursor)
+                    except ValueError:
+                        return {
+                            'statusCode': 400,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': json.dumps({'error': 'Invalid cursor'})
+                        }
+                sort = query_params.get('sort')
+                where_sql, ts_query = build_catalog_where(query_params)
                 
-                where_sql = " AND ".join(where_clauses)
+                # Сортировка по релевантности постраничная только через offset
+                by_relevance = sort == 'relevance' and ts_query is not None
+                if by_relevance:
+                    after = None
                 
                 # Получить общее количество
-                count_query = f"""
-                    SELECT COUNT(*) FROM t_p63326274_course_download_plat.works 
-                    WHERE {where_sql}
-                """
-                cur.execute(count_query)
-                total = cur.fetchone()[0]
+                total_mode = query_params.get('total_mode', 'exact')
+                if total_mode not in TOTAL_MODES:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f"total_mode must be one of: {', '.join(TOTAL_MODES)}"})
+                    }
+                total, total_exact = get_catalog_total(cur, query_params, where_sql, total_mode)
                 
                 # Получить работы с пагинацией
+                # Сортировка совпадает с индексом idx_works_catalog_keyset, поэтому
+                # каждая страница по курсору читается как range scan по индексу
+                page_sql = f"WHERE {where_sql}"
+                order_sql = "created_at DESC, id DESC"
+                if by_relevance:
+                    order_sql = f"ts_rank(search_vector, {ts_query}) DESC, {order_sql}"
+                if after:
+                    page_sql += f" AND (created_at, id) < ('{after[0].isoformat()}'::timestamp, {after[1]})"
+                    page_offset = 0
+                else:
+                    page_offset = offset
+                
                 query = f"""
-                    SELECT id, title, work_type, subject, description, 
-                           price_points, rating, downloads, category, preview_image_url, author_id, preview_urls,
-                           author_name, language, software, views_count, reviews_count, keywords, file_url, downloads_count, discount
+                    SELECT {CATALOG_COLUMNS}
                     FROM t_p63326274_course_download_plat.works 
-                    WHERE {where_sql}
-                    ORDER BY created_at DESC
-                    LIMIT {int(limit)} OFFSET {int(offset)}
+                    {page_sql}
+                    ORDER BY {order_sql}
+                    LIMIT {limit + 1} OFFSET {int(page_offset)}
                     """
                 cur.execute(query)
+                rows = cur.fetchall()
                 
-                works = []
-                for row in cur.fetchall():
-                    work_id = row[0]
-                    
-                    preview_urls_str = row[11]
-                    if isinstance(preview_urls_str, str):
-                        preview_urls = json.loads(preview_urls_str) if preview_urls_str else []
-                    elif isinstance(preview_urls_str, list):
-                        preview_urls = preview_urls_str
-                    else:
-                        preview_urls = []
-                    
-                    software_str = row[14]
-                    if isinstance(software_str, str):
-                        software = json.loads(software_str) if software_str and software_str != '[]' else []
-                    elif isinstance(software_str, list):
-                        software = software_str
-                    else:
-                        software = []
-                    
-                    keywords_str = row[17]
-                    if isinstance(keywords_str, str):
-                        keywords = json.loads(keywords_str) if keywords_str and keywords_str != '[]' else []
-                    elif isinstance(keywords_str, list):
-                        keywords = keywords_str
-                    else:
-                        keywords = []
-                    
-                    work = {
-                        'id': work_id,
-                        'title': row[1],
-                        'work_type': row[2],
-                        'subject': row[3],
-                        'preview': row[4][:150] + '...' if row[4] and len(row[4]) > 150 else (row[4] or ''),
-                        'price_points': row[5],
-                        'rating': float(row[6]) if row[6] else 0,
-                        'downloads': row[7] or 0,
-                        'category': row[8],
-                        'preview_image_url': row[9],
-                        'author_id': row[10],
-                        'preview_urls': preview_urls,
-                        'author_name': row[12],
-                        'language': row[13] or 'Русский',
-                        'software': software,
-                        'views_count': row[15] or 0,
-                        'reviews_count': row[16] or 0,
-                        'keywords': keywords,
-                        'file_url': row[18],
-                        'downloads_count': row[19] or 0,
-                        'discount': row[20] or 0
-                    }
-                    works.append(work)
+                # Лишняя строка означает, что есть следующая страница
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                next_cursor = None
+                if has_more and not by_relevance and rows[-1][21]:
+                    next_cursor = encode_cursor(rows[-1][21], rows[-1][0])
+                
+                works = [catalog_item_from_row(row) for row in rows]
                 
                 return {
                     'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache_headers(etag)},
                     'body': json.dumps({
                         'works': works,
                         'total': total,
+                        'total_exact': total_exact,
                         'limit': limit,
-                        'offset': offset
+                        'offset': offset,
+                        'next_cursor': next_cursor
                     })
                 }
         finally:
@@ -403,6 +1226,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         body_data = json.loads(event.get('body', '{}'))
         action = body_data.get('action')
         
+        if action == 'flush_counters':
+            # Принудительный слив счётчиков (вызывается по расписанию)
+            conn = get_db_connection()
+            
+            try:
+                flushed = flush_counters(conn)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, 'flushed': flushed})
+                }
+            finally:
+                conn.close()
+        
+        if action == 'publish_snapshots':
+            conn = get_db_connection()
+            
+            try:
+                result = publish_catalog_snapshots(conn, full=bool(body_data.get('full')))
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'success': True, **result})
+                }
+            finally:
+                conn.close()
+        
         if action == 'clear_all':
             conn = get_db_connection()
             cur = conn.cursor()
@@ -439,19 +1291,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cur = conn.cursor()
             
             try:
-                # Найти и удалить дубликаты по yandex_disk_link (более точный способ)
-                cur.execute("""
-                    DELETE FROM t_p63326274_course_download_plat.works
-                    WHERE id NOT IN (
-                        SELECT MIN(id)
-                        FROM t_p63326274_course_download_plat.works
-                        GROUP BY COALESCE(yandex_disk_link, title)
-                    )
-                """)
-                deleted_count = cur.rowcount
+                if body_data.get('dry_run'):
+                    groups = find_duplicate_works(cur)
+                    duplicates = sum(len(group['duplicates']) for group in groups)
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({
+                            'success': True,
+                            'dry_run': True,
+                            'groups': groups,
+                            'duplicates': duplicates,
+                            'message': f'Найдено дубликатов: {duplicates} в {len(groups)} группах'
+                        }, ensure_ascii=False)
+                    }
+                
+                deleted_count = merge_duplicate_works(cur)
                 conn.commit()
                 
-                print(f"🗑️ Удалено дубликатов по yandex_disk_link: {deleted_count}")
+                print(f"🗑️ Слито дубликатов по отпечатку названия: {deleted_count}")
                 
                 return {
                     'statusCode': 200,
@@ -462,14 +1320,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'message': f'Удалено дубликатов: {deleted_count}'
                     })
                 }
+            except Exception:
+                conn.rollback()
+                raise
             finally:
                 cur.close()
                 conn.close()
         
         if action == 'import':
             public_key = body_data.get('public_key')
-            offset = body_data.get('offset', 0)
-            limit = body_data.get('limit', 50)
+            limit = int(body_data.get('limit', IMPORT_BATCH_SIZE))
             
             if not public_key:
                 return {
@@ -478,77 +1338,49 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'public_key required'})
                 }
             
-            folders = get_yandex_disk_folders(public_key)
-            total_folders = len(folders)
-            
-            # Применяем offset и limit
-            folders_batch = folders[offset:offset+limit]
-            
-            imported = []
-            errors = []
-            
             conn = get_db_connection()
             cur = conn.cursor()
             
-            print(f"🚀 Начинаю импорт батча {offset}-{offset+len(folders_batch)} из {total_folders} работ...")
-            
             try:
-                for folder in folders_batch:
-                    folder_name = folder['name']
-                    yandex_disk_link = folder.get('public_url', '')
-                    
-                    parsed = parse_work_title_and_type(folder_name)
-                    title = parsed['title']
-                    work_type = parsed['work_type']
-                    
-                    subject = 'общий'
-                    description = f'Работа по теме: {title}. Тип работы: {work_type}.'
-                    composition = 'Документация и файлы'
-                    price_points = 150
-                    
+                # Листинг папки кэшируется в import_jobs вместе с контрольной точкой
+                job = load_import_job(cur, public_key, restart=bool(body_data.get('restart')))
+                conn.commit()
+                folders = job['folders']
+                total_folders = len(folders)
+                
+                # Без offset продолжаем с сохранённой контрольной точки
+                offset = body_data.get('offset')
+                offset = job['next_offset'] if offset is None else int(offset)
+                end = min(offset + limit, total_folders)
+                
+                print(f"🚀 Начинаю импорт батча {offset}-{end} из {total_folders} работ...")
+                
+                started = time.monotonic()
+                imported = []
+                errors = []
+                skipped = 0
+                # Докуда импорт дошёл без ошибок: контрольная точка не перескакивает упавший батч
+                stopped_at = end
+                
+                for batch_start in range(offset, end, IMPORT_BATCH_SIZE):
+                    batch = folders[batch_start:min(batch_start + IMPORT_BATCH_SIZE, end)]
                     try:
-                        # Escape single quotes for SQL
-                        safe_title = title.replace("'", "''")
-                        safe_work_type = work_type.replace("'", "''")
-                        safe_subject = subject.replace("'", "''")
-                        safe_desc = description.replace("'", "''")
-                        safe_comp = composition.replace("'", "''")
-                        safe_link = yandex_disk_link.replace("'", "''")
-                        
-                        # Проверка на дубликат по yandex_disk_link
-                        cur.execute(f"""
-                            SELECT id FROM t_p63326274_course_download_plat.works 
-                            WHERE yandex_disk_link = '{safe_link}'
-                        """)
-                        existing = cur.fetchone()
-                        
-                        if existing:
-                            print(f"⏭️ Пропускаю дубликат: {title} (ID={existing[0]})")
-                            continue
-                        
-                        cur.execute(f"""
-                            INSERT INTO t_p63326274_course_download_plat.works (title, work_type, subject, description, composition, price_points, yandex_disk_link)
-                            VALUES ('{safe_title}', '{safe_work_type}', '{safe_subject}', '{safe_desc}', '{safe_comp}', {price_points}, '{safe_link}')
-                            RETURNING id
-                        """)
-                        
-                        work_id = cur.fetchone()[0]
+                        inserted = import_folders_batch(cur, batch)
+                        skipped += len(batch) - len(inserted)
+                        imported.extend(inserted)
+                        save_import_checkpoint(cur, public_key, batch_start + len(batch), len(inserted), len(batch) - len(inserted))
                         conn.commit()
-                        
-                        print(f"✅ Создана работа ID={work_id}: {title}")
-                        
-                        imported.append({
-                            'filename': folder_name,
-                            'work_id': work_id,
-                            'title': title
-                        })
-                        
                     except Exception as e:
-                        errors.append({
-                            'filename': folder_name,
-                            'error': str(e)
-                        })
                         conn.rollback()
+                        errors.extend({'filename': folder['name'], 'error': str(e)} for folder in batch)
+                        # Следующий вызов начнёт с этого батча и повторит его
+                        stopped_at = batch_start
+                        break
+                
+                elapsed = time.monotonic() - started
+                processed = stopped_at - offset
+                folders_per_second = round(processed / elapsed, 1) if elapsed > 0 else processed
+                print(f"✅ Импортировано {len(imported)}, пропущено дубликатов {skipped}, {folders_per_second} папок/с")
                 
                 return {
                     'statusCode': 200,
@@ -556,12 +1388,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({
                         'success': True,
                         'imported': len(imported),
+                        'skipped': skipped,
                         'errors': len(errors),
                         'total': total_folders,
                         'offset': offset,
                         'limit': limit,
-                        'has_more': offset + limit < total_folders,
-                        'next_offset': offset + limit if offset + limit < total_folders else None,
+                        'has_more': stopped_at < total_folders,
+                        'next_offset': stopped_at if stopped_at < total_folders else None,
+                        'elapsed_ms': int(elapsed * 1000),
+                        'folders_per_second': folders_per_second,
                         'details': {
                             'imported': imported,
                             'errors': errors
@@ -626,17 +1461,33 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             cur = conn.cursor()
             
             try:
-                if activity_type == 'view':
-                    cur.execute(f"UPDATE t_p63326274_course_download_plat.works SET views = COALESCE(views, 0) + 1, downloads = COALESCE(downloads, 0) + 1 WHERE id = {int(work_id)}")
-                elif activity_type == 'download':
-                    cur.execute(f"UPDATE t_p63326274_course_download_plat.works SET downloads = COALESCE(downloads, 0) + 1, views = COALESCE(views, 0) + 1 WHERE id = {int(work_id)}")
-                elif activity_type == 'review':
-                    cur.execute(f"UPDATE t_p63326274_course_download_plat.works SET reviews_count = COALESCE(reviews_count, 0) + 1 WHERE id = {int(work_id)}")
+                counters = {
+                    'view': ['views', 'downloads'],
+                    'download': ['downloads', 'views'],
+                    'review': ['reviews_count']
+                }.get(activity_type, [])
+                for counter in counters:
+                    record_counter(cur, int(work_id), counter)
                 
-                cur.execute(f"SELECT views, downloads, reviews_count FROM t_p63326274_course_download_plat.works WHERE id = {int(work_id)}")
+                # Сохранённые значения плюс ещё не слитые события, одним снимком
+                cur.execute(f"""
+                    SELECT w.views, w.downloads, w.reviews_count,
+                           COALESCE(SUM(e.delta) FILTER (WHERE e.counter = 'views'), 0),
+                           COALESCE(SUM(e.delta) FILTER (WHERE e.counter = 'downloads'), 0),
+                           COALESCE(SUM(e.delta) FILTER (WHERE e.counter = 'reviews_count'), 0)
+                    FROM t_p63326274_course_download_plat.works w
+                    LEFT JOIN t_p63326274_course_download_plat.counter_events e
+                        ON e.target = 'works' AND e.target_id = w.id
+                    WHERE w.id = {int(work_id)}
+                    GROUP BY w.id
+                """)
                 stats = cur.fetchone()
                 
-                conn.commit()
+                if stats:
+                    conn.commit()
+                    maybe_flush_counters(conn)
+                else:
+                    conn.rollback()
                 
                 if not stats:
                     return {
@@ -651,9 +1502,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({
                         'success': True,
                         'workId': work_id,
-                        'views': stats[0] if stats[0] else 0,
-                        'downloads': stats[1] if stats[1] else 0,
-                        'reviewsCount': stats[2] if stats[2] else 0
+                        'views': (stats[0] or 0) + stats[3],
+                        'downloads': (stats[1] or 0) + stats[4],
+                        'reviewsCount': (stats[2] or 0) + stats[5]
                     })
                 }
             finally:
@@ -734,6 +1585,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     VALUES ({int(author_id)}, '{safe_title}', '{safe_message}', 'error', FALSE, NOW())
                 """)
             
+            # Снапшоты здесь не перестраиваются: триггер пометил категорию в catalog_snapshot_dirty,
+            # очередь разбирает action=publish_snapshots по таймеру или из админки
             conn.commit()
             
             return {
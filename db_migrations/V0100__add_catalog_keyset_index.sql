@@ -0,0 +1,14 @@
+-- Keyset-пагинация каталога: сортировка (created_at DESC, id DESC) должна быть полной
+UPDATE t_p63326274_course_download_plat.works
+SET created_at = COALESCE(updated_at, NOW())
+WHERE created_at IS NULL;
+
+ALTER TABLE t_p63326274_course_download_plat.works
+ALTER COLUMN created_at SET NOT NULL;
+
+-- Составные индексы: каждая страница каталога читается как range scan
+CREATE INDEX IF NOT EXISTS idx_works_catalog_keyset
+ON t_p63326274_course_download_plat.works (status, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_works_catalog_category_keyset
+ON t_p63326274_course_download_plat.works (status, category, created_at DESC, id DESC);
@@ -0,0 +1,14 @@
+-- Полнотекстовый поиск по каталогу (русская морфология)
+-- Веса: название (A) > ключевые слова (B) > описание (C)
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+    setweight(to_tsvector('russian', COALESCE(keywords, '')), 'B') ||
+    setweight(to_tsvector('russian', COALESCE(description, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_works_search_vector
+ON t_p63326274_course_download_plat.works USING GIN (search_vector);
+
+COMMENT ON COLUMN t_p63326274_course_download_plat.works.search_vector IS 'tsvector для поиска в каталоге, пересчитывается автоматически';
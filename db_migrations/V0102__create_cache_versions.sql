@@ -0,0 +1,49 @@
+-- Версии данных для ETag / If-None-Match в GET-обработчиках (works, blog, reviews)
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.cache_versions (
+    scope VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+INSERT INTO t_p63326274_course_download_plat.cache_versions (scope) VALUES
+    ('works'), ('blog'), ('reviews')
+ON CONFLICT (scope) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION t_p63326274_course_download_plat.bump_cache_version()
+RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p63326274_course_download_plat.cache_versions (scope, version, updated_at)
+    VALUES (TG_ARGV[0], 1, NOW())
+    ON CONFLICT (scope) DO UPDATE
+    SET version = t_p63326274_course_download_plat.cache_versions.version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Счётчики просмотров/скачиваний/отзывов версию не меняют, иначе каждый просмотр сбрасывал бы кэш
+CREATE TRIGGER trg_works_cache_version
+AFTER INSERT OR DELETE OR UPDATE OF
+    title, work_type, subject, description, composition, price_points, rating, category,
+    preview_image_url, preview_urls, file_url, download_url, yandex_disk_link, author_id,
+    author_name, language, software, keywords, cover_images, discount, status, created_at
+ON t_p63326274_course_download_plat.works
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('works');
+
+CREATE TRIGGER trg_work_files_cache_version
+AFTER INSERT OR UPDATE OR DELETE ON t_p63326274_course_download_plat.work_files
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('works');
+
+CREATE TRIGGER trg_blog_posts_cache_version
+AFTER INSERT OR DELETE OR UPDATE OF
+    title, slug, content, excerpt, cover_image_url, status, published_at
+ON t_p63326274_course_download_plat.blog_posts
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('blog');
+
+CREATE TRIGGER trg_reviews_cache_version
+AFTER INSERT OR UPDATE OR DELETE ON t_p63326274_course_download_plat.reviews
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('reviews');
+
+-- Список всех отзывов показывает название работы
+CREATE TRIGGER trg_works_title_reviews_cache_version
+AFTER UPDATE OF title ON t_p63326274_course_download_plat.works
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('reviews');
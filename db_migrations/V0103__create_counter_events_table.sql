@@ -0,0 +1,16 @@
+-- Append-only журнал инкрементов счётчиков (просмотры, скачивания, отзывы)
+-- Горячий путь только вставляет строку, в works / blog_posts / work_stats
+-- события сливаются пачками через UPDATE ... FROM (VALUES ...)
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.counter_events (
+    id BIGSERIAL PRIMARY KEY,
+    target VARCHAR(30) NOT NULL,
+    target_id INTEGER NOT NULL,
+    counter VARCHAR(30) NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_counter_events_target_id ON t_p63326274_course_download_plat.counter_events(target, id);
+CREATE INDEX IF NOT EXISTS idx_counter_events_target_row ON t_p63326274_course_download_plat.counter_events(target, target_id);
+
+COMMENT ON TABLE t_p63326274_course_download_plat.counter_events IS 'Несведённые инкременты счётчиков; удаляются при сливе в целевую таблицу';
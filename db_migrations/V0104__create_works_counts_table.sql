@@ -0,0 +1,49 @@
+-- Счётчики работ по (status, category) для O(1) total в каталоге
+-- Учитываются только не удалённые работы (title NOT LIKE '[УДАЛЕНО]%'), как в выдаче
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.works_counts (
+    status VARCHAR(20) NOT NULL,
+    category VARCHAR(50) NOT NULL DEFAULT '',
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (status, category)
+);
+
+CREATE OR REPLACE FUNCTION t_p63326274_course_download_plat.maintain_works_counts()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.title NOT LIKE '[УДАЛЕНО]%' THEN
+        UPDATE t_p63326274_course_download_plat.works_counts
+        SET total = total - 1
+        WHERE status = COALESCE(OLD.status, '') AND category = COALESCE(OLD.category, '');
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.title NOT LIKE '[УДАЛЕНО]%' THEN
+        INSERT INTO t_p63326274_course_download_plat.works_counts (status, category, total)
+        VALUES (COALESCE(NEW.status, ''), COALESCE(NEW.category, ''), 1)
+        ON CONFLICT (status, category) DO UPDATE
+        SET total = t_p63326274_course_download_plat.works_counts.total + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_works_counts_insert_delete
+AFTER INSERT OR DELETE ON t_p63326274_course_download_plat.works
+FOR EACH ROW EXECUTE FUNCTION t_p63326274_course_download_plat.maintain_works_counts();
+
+-- Пересчёт только когда меняется ключ счётчика или признак удаления
+CREATE TRIGGER trg_works_counts_update
+AFTER UPDATE OF status, category, title ON t_p63326274_course_download_plat.works
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status
+      OR OLD.category IS DISTINCT FROM NEW.category
+      OR (OLD.title LIKE '[УДАЛЕНО]%') IS DISTINCT FROM (NEW.title LIKE '[УДАЛЕНО]%'))
+EXECUTE FUNCTION t_p63326274_course_download_plat.maintain_works_counts();
+
+-- Начальное заполнение
+INSERT INTO t_p63326274_course_download_plat.works_counts (status, category, total)
+SELECT COALESCE(status, ''), COALESCE(category, ''), COUNT(*)
+FROM t_p63326274_course_download_plat.works
+WHERE title NOT LIKE '[УДАЛЕНО]%'
+GROUP BY COALESCE(status, ''), COALESCE(category, '')
+ON CONFLICT (status, category) DO UPDATE SET total = EXCLUDED.total;
@@ -0,0 +1,33 @@
+-- Очередь категорий, чьи статические снапшоты каталога нужно перестроить
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.catalog_snapshot_dirty (
+    category VARCHAR(50) PRIMARY KEY,
+    marked_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION t_p63326274_course_download_plat.mark_catalog_snapshot_dirty()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO t_p63326274_course_download_plat.catalog_snapshot_dirty (category)
+        VALUES (COALESCE(OLD.category, ''))
+        ON CONFLICT (category) DO NOTHING;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        INSERT INTO t_p63326274_course_download_plat.catalog_snapshot_dirty (category)
+        VALUES (COALESCE(NEW.category, ''))
+        ON CONFLICT (category) DO NOTHING;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Счётчики просмотров/скачиваний снапшоты не трогают
+CREATE TRIGGER trg_works_catalog_snapshot_dirty
+AFTER INSERT OR DELETE OR UPDATE OF
+    title, work_type, subject, description, price_points, rating, category,
+    preview_image_url, preview_urls, file_url, author_id, author_name, language,
+    software, keywords, discount, status, created_at
+ON t_p63326274_course_download_plat.works
+FOR EACH ROW EXECUTE FUNCTION t_p63326274_course_download_plat.mark_catalog_snapshot_dirty();
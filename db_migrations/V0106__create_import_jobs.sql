@@ -0,0 +1,33 @@
+-- Задания импорта с Яндекс.Диска: закэшированный листинг папки и контрольная точка
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.import_jobs (
+    public_key TEXT PRIMARY KEY,
+    folders JSONB NOT NULL DEFAULT '[]',
+    total INTEGER NOT NULL DEFAULT 0,
+    next_offset INTEGER NOT NULL DEFAULT 0,
+    imported INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    listed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Пустая ссылка означает отсутствие ссылки
+UPDATE t_p63326274_course_download_plat.works
+SET yandex_disk_link = NULL
+WHERE yandex_disk_link = '';
+
+-- У дубликатов оставляем ссылку только у самой ранней работы
+UPDATE t_p63326274_course_download_plat.works w
+SET yandex_disk_link = NULL
+FROM (
+    SELECT yandex_disk_link, MIN(id) AS keep_id
+    FROM t_p63326274_course_download_plat.works
+    WHERE yandex_disk_link IS NOT NULL
+    GROUP BY yandex_disk_link
+    HAVING COUNT(*) > 1
+) d
+WHERE w.yandex_disk_link = d.yandex_disk_link AND w.id <> d.keep_id;
+
+-- Основа для INSERT ... ON CONFLICT (yandex_disk_link) DO NOTHING при импорте
+CREATE UNIQUE INDEX IF NOT EXISTS idx_works_yandex_disk_link_unique
+ON t_p63326274_course_download_plat.works (yandex_disk_link)
+WHERE yandex_disk_link IS NOT NULL;
@@ -0,0 +1,15 @@
+-- Нормализованный отпечаток названия для поиска дубликатов:
+-- без текста в скобках ("(курсовая)"), регистра, ё/е и пунктуации
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS title_fingerprint TEXT
+GENERATED ALWAYS AS (
+    btrim(regexp_replace(
+        regexp_replace(translate(lower(COALESCE(title, '')), 'ё', 'е'), '[\(\[][^\)\]]*[\)\]]', ' ', 'g'),
+        '[^[:alnum:]]+', ' ', 'g'
+    ))
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_works_title_fingerprint
+ON t_p63326274_course_download_plat.works (title_fingerprint, id);
+
+COMMENT ON COLUMN t_p63326274_course_download_plat.works.title_fingerprint IS 'Нормализованное название для поиска дубликатов, пересчитывается автоматически';
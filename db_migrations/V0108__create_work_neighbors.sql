@@ -0,0 +1,17 @@
+-- Похожие работы: top-K соседей по TF-IDF, считаются офлайн scripts/build_work_neighbors.py
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.work_neighbors (
+    work_id INTEGER NOT NULL REFERENCES t_p63326274_course_download_plat.works(id) ON DELETE CASCADE,
+    neighbor_id INTEGER NOT NULL REFERENCES t_p63326274_course_download_plat.works(id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (work_id, neighbor_id)
+);
+
+-- Выдача блока «Похожие работы» — один проход по индексу
+CREATE INDEX IF NOT EXISTS idx_work_neighbors_work_score
+ON t_p63326274_course_download_plat.work_neighbors (work_id, score DESC);
+
+-- Пересчёт соседей меняет ответы action=related
+CREATE TRIGGER trg_work_neighbors_cache_version
+AFTER INSERT OR UPDATE OR DELETE ON t_p63326274_course_download_plat.work_neighbors
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('works');
@@ -0,0 +1,48 @@
+-- Единый append-only журнал событий (скачивания, события безопасности).
+-- Горячий путь только вставляет строки, user_downloads / works.downloads_count / security_logs
+-- пересчитываются пачками функцией events-rollup
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.events (
+    id BIGSERIAL,
+    event_type VARCHAR(50) NOT NULL,
+    user_id INTEGER,
+    work_id INTEGER,
+    details TEXT,
+    ip_address VARCHAR(50),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (created_at, id)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_events_id ON t_p63326274_course_download_plat.events (id);
+
+-- Помесячные партиции: старые месяцы удаляются целиком через DROP TABLE
+CREATE OR REPLACE FUNCTION t_p63326274_course_download_plat.ensure_events_partition(month_start DATE)
+RETURNS void AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::date;
+    partition_name TEXT := 'events_' || to_char(first_day, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.%I
+         PARTITION OF t_p63326274_course_download_plat.events
+         FOR VALUES FROM (%L) TO (%L)',
+        partition_name, first_day, (first_day + INTERVAL '1 month')::date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT t_p63326274_course_download_plat.ensure_events_partition((CURRENT_DATE + (n || ' months')::interval)::date)
+FROM generate_series(0, 2) AS n;
+
+-- Страховка, если events-rollup не успел создать партицию на следующий месяц
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.events_default
+PARTITION OF t_p63326274_course_download_plat.events DEFAULT;
+
+-- Водяной знак свёртки: до какого id события уже учтены в производных таблицах
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.events_rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+INSERT INTO t_p63326274_course_download_plat.events_rollup_state (name) VALUES ('events')
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,13 @@
+-- Токены скачивания теперь подписываются HMAC и проверяются без БД.
+-- Здесь хранится только небольшой список отозванных токенов до истечения их срока
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.revoked_download_tokens (
+    token_id VARCHAR(32) PRIMARY KEY,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_download_tokens_expires
+ON t_p63326274_course_download_plat.revoked_download_tokens(expires_at);
+
+-- Новые строки в download_tokens больше не пишутся; накопленные удаляет scripts/cleanup_download_tokens.py
+COMMENT ON TABLE t_p63326274_course_download_plat.download_tokens IS 'Устарела: токены скачивания подписываются HMAC (purchase-work). Очистка: scripts/cleanup_download_tokens.py';
@@ -0,0 +1,13 @@
+-- Курсор populate-files-list: повторные запуски продолжают с последней обработанной работы
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.populate_files_state (
+    name VARCHAR(50) PRIMARY KEY,
+    last_work_id INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    pass_started_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+INSERT INTO t_p63326274_course_download_plat.populate_files_state (name) VALUES ('files_list')
+ON CONFLICT (name) DO NOTHING;
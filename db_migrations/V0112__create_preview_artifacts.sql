@@ -0,0 +1,19 @@
+-- Кэш превью по содержимому: SHA-256 исходного документа + версия рендерера.
+-- Повторный запуск на неизменном архиве — поиск в этой таблице, без рендеринга;
+-- смена версии рендерера даёт промах только для тех работ, которые ещё не перерисованы
+CREATE TABLE IF NOT EXISTS t_p63326274_course_download_plat.preview_artifacts (
+    source_sha256 CHAR(64) NOT NULL,
+    renderer VARCHAR(50) NOT NULL,
+    renderer_version INTEGER NOT NULL,
+    preview_urls JSONB NOT NULL DEFAULT '[]',
+    source_name TEXT,
+    source_size BIGINT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (source_sha256, renderer, renderer_version)
+);
+
+-- Из какого документа и какой версии архива построено текущее превью работы:
+-- совпадение ETag архива позволяет не скачивать документ повторно
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS preview_source_sha256 CHAR(64),
+ADD COLUMN IF NOT EXISTS preview_archive_etag TEXT;
@@ -0,0 +1,29 @@
+-- Производные изображений превью и обложек: несколько ширин в WebP (и AVIF, если доступен).
+-- Формат: {"preview": {"src", "width", "height", "srcset": {"image/webp": "url 320w, ..."}},
+--          "covers": [{...}, ...]}; src — исходный URL, по нему клиент проверяет актуальность
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS image_variants JSONB;
+
+-- Производные превью кэшируются вместе с ним: при попадании в кэш копируются в works
+ALTER TABLE t_p63326274_course_download_plat.preview_artifacts
+ADD COLUMN IF NOT EXISTS image_variants JSONB;
+
+-- image_variants попадает в выдачу каталога — добавляем в списки колонок триггеров
+DROP TRIGGER IF EXISTS trg_works_cache_version ON t_p63326274_course_download_plat.works;
+CREATE TRIGGER trg_works_cache_version
+AFTER INSERT OR DELETE OR UPDATE OF
+    title, work_type, subject, description, composition, price_points, rating, category,
+    preview_image_url, preview_urls, file_url, download_url, yandex_disk_link, author_id,
+    author_name, language, software, keywords, cover_images, discount, status, created_at,
+    image_variants
+ON t_p63326274_course_download_plat.works
+FOR EACH STATEMENT EXECUTE FUNCTION t_p63326274_course_download_plat.bump_cache_version('works');
+
+DROP TRIGGER IF EXISTS trg_works_catalog_snapshot_dirty ON t_p63326274_course_download_plat.works;
+CREATE TRIGGER trg_works_catalog_snapshot_dirty
+AFTER INSERT OR DELETE OR UPDATE OF
+    title, work_type, subject, description, price_points, rating, category,
+    preview_image_url, preview_urls, file_url, author_id, author_name, language,
+    software, keywords, discount, status, created_at, image_variants
+ON t_p63326274_course_download_plat.works
+FOR EACH ROW EXECUTE FUNCTION t_p63326274_course_download_plat.mark_catalog_snapshot_dirty();
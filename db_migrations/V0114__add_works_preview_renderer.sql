@@ -0,0 +1,12 @@
+-- Каким рендерером построено текущее превью работы. Превью строят и generate-work-preview
+-- (docx-toc), и локальный скрипт (office-screenshot): «устаревшим» каждый считает только своё
+-- превью прошлой версии, а не превью другого рендерера
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS preview_renderer VARCHAR(50);
+
+UPDATE t_p63326274_course_download_plat.works w
+SET preview_renderer = pa.renderer
+FROM t_p63326274_course_download_plat.preview_artifacts pa
+WHERE pa.source_sha256 = w.preview_source_sha256
+  AND pa.preview_urls->>0 = w.preview_image_url
+  AND w.preview_renderer IS NULL;
@@ -0,0 +1,8 @@
+-- Неудачные попытки populate-files-list: после POPULATE_MAX_ATTEMPTS работа больше не попадает
+-- в проход, пока не сменится ссылка на архив (files_list_failed_url — ссылка последней попытки).
+-- Ссылка не на архив и пустой архив сразу считаются исчерпавшими попытки
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS files_list_attempts SMALLINT NOT NULL DEFAULT 0;
+
+ALTER TABLE t_p63326274_course_download_plat.works
+ADD COLUMN IF NOT EXISTS files_list_failed_url TEXT;
@@ -11,9 +11,13 @@
 import os
 import sys
 import json
+import hashlib
 import zipfile
+import shutil
 import tempfile
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Tuple
 import requests
@@ -28,6 +32,16 @@ DATABASE_URL = None
 YANDEX_S3_KEY_ID = "your_s3_key_id_here"
 YANDEX_S3_SECRET_KEY = "your_s3_secret_key_here"
 
+# Кэш превью (таблица preview_artifacts): ключ — SHA-256 документа + рендерер.
+# Версию повышаем при изменении вида скриншотов — перерисуются только работы со старой версией
+PREVIEW_RENDERER = 'office-screenshot'
+PREVIEW_RENDERER_VERSION = 1
+
+# Пока Word/LibreOffice рисует текущую работу, архивы следующих уже скачиваются.
+# Рендер остаётся последовательным: Word один на машину. Больше PREFETCH_WORKS + 1
+# распакованных архивов на диске одновременно не лежит
+PREFETCH_WORKS = 2
+
 
 def load_config():
     """Загружает конфигурацию из переменных окружения или .env файла"""
@@ -72,18 +86,26 @@ def load_config():
         sys.exit(1)
 
 
-def get_works_without_preview() -> List[Tuple[int, str, str]]:
-    """Получает список работ без превью из БД"""
+def get_works_without_preview(include_stale: bool = False) -> List[Tuple[int, str, str]]:
+    """
+    Получает список работ без превью из БД. С include_stale — ещё и работы, превью которых
+    построено прошлой версией этого рендерера (проверка по preview_artifacts, без скачивания);
+    превью другого рендерера (docx-toc) и загруженные вручную не трогаются
+    """
     conn = psycopg2.connect(DATABASE_URL)
     cur = conn.cursor()
     
     cur.execute("""
-        SELECT id, title, file_url 
-        FROM t_p63326274_course_download_plat.works 
-        WHERE file_url IS NOT NULL 
-        AND (preview_image_url IS NULL OR preview_image_url = '')
-        ORDER BY id
-    """)
+        SELECT w.id, w.title, w.file_url 
+        FROM t_p63326274_course_download_plat.works w
+        LEFT JOIN t_p63326274_course_download_plat.preview_artifacts pa
+            ON pa.source_sha256 = w.preview_source_sha256
+           AND pa.renderer = %s AND pa.renderer_version = %s
+        WHERE w.file_url IS NOT NULL 
+        AND ((w.preview_image_url IS NULL OR w.preview_image_url = '')
+             OR (%s AND w.preview_renderer = %s AND pa.source_sha256 IS NULL))
+        ORDER BY w.id
+    """, (PREVIEW_RENDERER, PREVIEW_RENDERER_VERSION, include_stale, PREVIEW_RENDERER))
     
     works = cur.fetchall()
     cur.close()
@@ -93,8 +115,7 @@ def get_works_without_preview() -> List[Tuple[int, str, str]]:
 
 
 def download_and_extract_zip(file_url: str, temp_dir: str) -> List[str]:
-    """Скачивает ZIP и возвращает пути к .docx файлам"""
-    print(f"  Скачиваю ZIP...")
+    """Скачивает ZIP и возвращает пути к .docx файлам (выполняется в фоновом потоке)"""
     response = requests.get(file_url, timeout=120)
     response.raise_for_status()
     
@@ -102,7 +123,6 @@ def download_and_extract_zip(file_url: str, temp_dir: str) -> List[str]:
     with open(zip_path, 'wb') as f:
         f.write(response.content)
     
-    print(f"  Распаковываю ZIP...")
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
         zip_ref.extractall(temp_dir)
     
@@ -116,6 +136,63 @@ def download_and_extract_zip(file_url: str, temp_dir: str) -> List[str]:
     return docx_files
 
 
+def file_sha256(path: str) -> str:
+    """SHA-256 файла без чтения его целиком в память"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_preview_artifact(source_sha256: str) -> Optional[List[str]]:
+    """URL готовых скриншотов этого документа для текущей версии рендерера"""
+    conn = psycopg2.connect(DATABASE_URL)
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT preview_urls FROM t_p63326274_course_download_plat.preview_artifacts
+        WHERE source_sha256 = %s AND renderer = %s AND renderer_version = %s
+    """, (source_sha256, PREVIEW_RENDERER, PREVIEW_RENDERER_VERSION))
+    
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    
+    return row[0] if row and row[0] else None
+
+
+def save_preview_artifact(source_sha256: str, preview_urls: List[str], docx_path: str):
+    """Запоминает скриншоты документа в preview_artifacts"""
+    conn = psycopg2.connect(DATABASE_URL)
+    cur = conn.cursor()
+    
+    cur.execute("""
+        INSERT INTO t_p63326274_course_download_plat.preview_artifacts
+            (source_sha256, renderer, renderer_version, preview_urls, source_name, source_size)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (source_sha256, renderer, renderer_version)
+        DO UPDATE SET preview_urls = EXCLUDED.preview_urls, created_at = NOW()
+    """, (source_sha256, PREVIEW_RENDERER, PREVIEW_RENDERER_VERSION, json.dumps(preview_urls),
+          os.path.basename(docx_path), os.path.getsize(docx_path)))
+    
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def prefetch_archive(file_url: str) -> Tuple[str, List[str], float]:
+    """Скачивает и распаковывает архив во временный каталог; удаляет его process_work"""
+    started = time.monotonic()
+    temp_dir = tempfile.mkdtemp(prefix='preview_')
+    try:
+        docx_files = download_and_extract_zip(file_url, temp_dir)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return temp_dir, docx_files, time.monotonic() - started
+
+
 def find_pages_in_docx(docx_path: str) -> Tuple[Optional[int], Optional[int]]:
     """Находит номера страниц 'Содержание' и 'Введение' в документе"""
     try:
@@ -243,8 +320,8 @@ def screenshot_word_pages_libreoffice(docx_path: str, output_dir: str) -> List[s
         return []
 
 
-def upload_to_s3(image_path: str, work_id: int, page_num: int) -> Optional[str]:
-    """Загружает изображение в S3"""
+def upload_to_s3(image_path: str, source_sha256: str, page_num: int) -> Optional[str]:
+    """Загружает изображение в S3; имя объекта зависит от содержимого документа и версии рендерера"""
     try:
         s3_client = boto3.client(
             's3',
@@ -255,7 +332,8 @@ def upload_to_s3(image_path: str, work_id: int, page_num: int) -> Optional[str]:
         )
         
         bucket_name = 'kyra'
-        object_name = f'previews/work_{work_id}_page_{page_num}.png'
+        object_name = (f'previews/{PREVIEW_RENDERER}/{source_sha256[:2]}/'
+                       f'{source_sha256}_v{PREVIEW_RENDERER_VERSION}_page_{page_num}.png')
         
         s3_client.upload_file(
             image_path,
@@ -271,14 +349,20 @@ def upload_to_s3(image_path: str, work_id: int, page_num: int) -> Optional[str]:
         return None
 
 
-def update_preview_url(work_id: int, preview_url: str):
-    """Обновляет preview_image_url в БД"""
+def update_preview_url(work_id: int, preview_urls: List[str], source_sha256: str):
+    """
+    Обновляет preview_image_url / preview_urls в БД и запоминает, из какого документа и каким
+    рендерером они построены. ETag архива сбрасывается: он относится к превью generate-work-preview
+    """
     conn = psycopg2.connect(DATABASE_URL)
     cur = conn.cursor()
     
     cur.execute(
-        "UPDATE t_p63326274_course_download_plat.works SET preview_image_url = %s WHERE id = %s",
-        (preview_url, work_id)
+        """UPDATE t_p63326274_course_download_plat.works
+           SET preview_image_url = %s, preview_urls = %s, preview_source_sha256 = %s,
+               preview_renderer = %s, preview_archive_etag = NULL
+           WHERE id = %s""",
+        (preview_urls[0], json.dumps(preview_urls), source_sha256, PREVIEW_RENDERER, work_id)
     )
     
     conn.commit()
@@ -286,65 +370,82 @@ def update_preview_url(work_id: int, preview_url: str):
     conn.close()
 
 
-def process_work(work_id: int, title: str, file_url: str) -> bool:
-    """Обрабатывает одну работу"""
+def process_work(work_id: int, title: str, prefetched: Future, timings: dict) -> bool:
+    """Обрабатывает одну работу; архив к этому моменту обычно уже скачан в фоне"""
     print(f"\n{'='*80}")
     print(f"Обработка работы #{work_id}: {title}")
     print(f"{'='*80}")
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            # Скачиваем и распаковываем
-            docx_files = download_and_extract_zip(file_url, temp_dir)
-            
-            if not docx_files:
-                print(f"  ⚠ Word файлы не найдены в архиве")
-                return False
-            
-            docx_path = docx_files[0]
-            print(f"  Найден файл: {os.path.basename(docx_path)}")
-            
-            # Создаем скриншоты
-            screenshots = []
-            
-            # Пробуем Windows способ
-            if sys.platform == 'win32':
-                screenshots = screenshot_word_pages_windows(docx_path, temp_dir)
-            
-            # Если не получилось, пробуем LibreOffice
-            if not screenshots:
-                screenshots = screenshot_word_pages_libreoffice(docx_path, temp_dir)
-            
-            if not screenshots:
-                print(f"  ❌ Не удалось создать скриншоты")
-                return False
-            
-            # Загружаем в S3
-            preview_urls = []
-            for i, screenshot_path in enumerate(screenshots):
-                print(f"  Загружаю скриншот {i+1} в S3...")
-                url = upload_to_s3(screenshot_path, work_id, i)
-                if url:
-                    preview_urls.append(url)
-                    print(f"  ✓ Загружено: {url}")
-            
-            if not preview_urls:
-                print(f"  ❌ Не удалось загрузить скриншоты в S3")
-                return False
-            
-            # Обновляем БД
-            print(f"  Обновляю БД...")
-            update_preview_url(work_id, preview_urls[0])
-            print(f"  ✓ Превью сохранено в БД")
-            
-            print(f"\n✅ Работа #{work_id} обработана успешно!")
+    temp_dir = None
+    try:
+        waited = time.monotonic()
+        temp_dir, docx_files, download_seconds = prefetched.result()
+        timings['download'] += download_seconds
+        timings['wait'] += time.monotonic() - waited
+        print(f"  Архив скачан и распакован за {download_seconds:.1f} с")
+        
+        if not docx_files:
+            print(f"  ⚠ Word файлы не найдены в архиве")
+            return False
+        
+        docx_path = docx_files[0]
+        print(f"  Найден файл: {os.path.basename(docx_path)}")
+        
+        # Документ уже рендерили (в этой или другой работе) текущей версией — берём готовое
+        source_sha256 = file_sha256(docx_path)
+        cached_urls = find_preview_artifact(source_sha256)
+        if cached_urls:
+            update_preview_url(work_id, cached_urls, source_sha256)
+            print(f"  ✓ Превью взято из кэша ({source_sha256[:12]})")
             return True
-            
-        except Exception as e:
-            print(f"\n❌ Ошибка при обработке работы #{work_id}: {e}")
-            import traceback
-            traceback.print_exc()
+        
+        # Создаем скриншоты
+        render_started = time.monotonic()
+        screenshots = []
+        
+        # Пробуем Windows способ
+        if sys.platform == 'win32':
+            screenshots = screenshot_word_pages_windows(docx_path, temp_dir)
+        
+        # Если не получилось, пробуем LibreOffice
+        if not screenshots:
+            screenshots = screenshot_word_pages_libreoffice(docx_path, temp_dir)
+        
+        timings['render'] += time.monotonic() - render_started
+        if not screenshots:
+            print(f"  ❌ Не удалось создать скриншоты")
             return False
+        
+        # Загружаем в S3
+        preview_urls = []
+        for i, screenshot_path in enumerate(screenshots):
+            print(f"  Загружаю скриншот {i+1} в S3...")
+            url = upload_to_s3(screenshot_path, source_sha256, i)
+            if url:
+                preview_urls.append(url)
+                print(f"  ✓ Загружено: {url}")
+        
+        if not preview_urls:
+            print(f"  ❌ Не удалось загрузить скриншоты в S3")
+            return False
+        
+        # Обновляем БД
+        print(f"  Обновляю БД...")
+        save_preview_artifact(source_sha256, preview_urls, docx_path)
+        update_preview_url(work_id, preview_urls, source_sha256)
+        print(f"  ✓ Превью сохранено в БД")
+        
+        print(f"\n✅ Работа #{work_id} обработана успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n❌ Ошибка при обработке работы #{work_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 def main():
@@ -356,9 +457,12 @@ def main():
     # Загружаем конфигурацию
     load_config()
     
+    # --all: ещё и работы, превью которых построено прошлой версией рендерера
+    include_stale = '--all' in sys.argv
+    
     # Получаем список работ
     print("\nПолучаю список работ без превью...")
-    works = get_works_without_preview()
+    works = get_works_without_preview(include_stale)
     
     if not works:
         print("\n✅ Все работы уже имеют превью!")
@@ -375,18 +479,34 @@ def main():
     # Обрабатываем все работы
     success_count = 0
     fail_count = 0
+    timings = {'download': 0.0, 'wait': 0.0, 'render': 0.0}
+    started = time.monotonic()
     
-    for i, (work_id, title, file_url) in enumerate(works, 1):
-        print(f"\n[{i}/{len(works)}]")
+    with ThreadPoolExecutor(max_workers=PREFETCH_WORKS) as downloads:
+        queued = deque()
+        upcoming = iter(works)
         
-        if process_work(work_id, title, file_url):
-            success_count += 1
-        else:
-            fail_count += 1
+        def schedule_next():
+            work = next(upcoming, None)
+            if work:
+                queued.append((work, downloads.submit(prefetch_archive, work[2])))
         
-        # Небольшая пауза между работами
-        if i < len(works):
-            time.sleep(2)
+        for _ in range(PREFETCH_WORKS + 1):
+            schedule_next()
+        
+        i = 0
+        while queued:
+            (work_id, title, _), prefetched = queued.popleft()
+            schedule_next()
+            i += 1
+            print(f"\n[{i}/{len(works)}]")
+            
+            if process_work(work_id, title, prefetched, timings):
+                success_count += 1
+            else:
+                fail_count += 1
+    
+    elapsed = time.monotonic() - started
     
     # Итоги
     print("\n" + "="*80)
@@ -394,7 +514,9 @@ def main():
     print("="*80)
     print(f"✅ Успешно обработано: {success_count}")
     print(f"❌ Ошибок: {fail_count}")
-    print(f"📊 Всего: {len(works)}")
+    print(f"📊 Всего: {len(works)} за {elapsed:.0f} с ({len(works) / elapsed * 60 if elapsed else 0:.1f} работ/мин)")
+    print(f"⏱  Скачивание (в фоне): {timings['download']:.0f} с, рендер: {timings['render']:.0f} с, "
+          f"ожидание скачивания: {timings['wait']:.0f} с")
 
 
 if __name__ == '__main__':
@@ -1,143 +1,372 @@
 #!/usr/bin/env python3
 """
-Скрипт для массового извлечения изображений из архивов всех работ
+Массовая генерация превью для всех работ каталога конвейером
+
+Этапы перекрываются во времени:
+    скачивание  — потоки: Range-чтение архива, выбор ПЗ, распаковка .docx, поиск в preview_artifacts
+    рендеринг   — процессы: разбор docx, отрисовка Pillow, производные WebP/AVIF и BlurHash (CPU), по процессу на ядро
+    выгрузка    — потоки: загрузка PNG и производных в S3, запись preview_artifacts и works
+Между этапами ограниченные очереди, а в рендер (вместе с ожидающими выгрузки) одновременно
+попадает не больше QUEUE_SIZE = 2 × RENDER_WORKERS документов: если рендер не успевает,
+скачивание ждёт свободного места, и временные файлы на диске не копятся.
+
+Рендер — тот же, что в backend/generate-work-preview (renderer / версия и кэш по SHA-256 общие).
+Контрольная точка — id, до которого все работы обработаны без ошибок; повторный запуск
+продолжает с неё, так что работы с ошибками обрабатываются снова.
+
+Запуск:
+    DATABASE_URL=... YANDEX_S3_KEY_ID=... YANDEX_S3_SECRET_KEY=... python3 scripts/batch_extract_previews.py
+    ... --all       # ещё и работы с превью прошлой версии рендерера
+    ... --restart   # начать с начала, игнорируя контрольную точку
 """
 
 import os
 import sys
+import json
 import time
-import requests
+import queue
+import shutil
+import zipfile
+import tempfile
+import threading
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+
 import psycopg2
 
-FUNCTION_URL = 'https://functions.poehali.dev/29bd33fc-96f3-4da2-af7c-ce84a7103573'
 DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p63326274_course_download_plat'
+DOWNLOAD_WORKERS = int(os.environ.get('PREVIEW_DOWNLOAD_WORKERS', 8))
+RENDER_WORKERS = int(os.environ.get('PREVIEW_RENDER_WORKERS', os.cpu_count() or 2))
+UPLOAD_WORKERS = int(os.environ.get('PREVIEW_UPLOAD_WORKERS', 8))
+QUEUE_SIZE = 2 * RENDER_WORKERS
+PAGE_SIZE = 200
+REPORT_INTERVAL = 10
+CHECKPOINT_FILE = os.environ.get(
+    'PREVIEW_CHECKPOINT', os.path.join(os.path.dirname(__file__), '.batch_previews_checkpoint.json'))
 
 if not DATABASE_URL:
     print('❌ DATABASE_URL не найден в переменных окружения')
     sys.exit(1)
 
+_preview_spec = importlib.util.spec_from_file_location(
+    'generate_work_preview',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'generate-work-preview', 'index.py'))
+preview = importlib.util.module_from_spec(_preview_spec)
+_preview_spec.loader.exec_module(preview)
 
-def get_works_without_preview(limit=50, offset=0):
-    """Получить работы без превью из БД"""
-    conn = psycopg2.connect(DATABASE_URL)
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            SELECT id, title, download_url, file_url
-            FROM t_p63326274_course_download_plat.works
-            WHERE title NOT LIKE '[УДАЛЕНО]%%'
-              AND (download_url IS NOT NULL OR file_url IS NOT NULL)
-              AND preview_image_url IS NULL
-            ORDER BY id DESC
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
-        
-        return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
-
-
-def extract_preview_for_work(work_id):
-    """Вызвать функцию извлечения превью для одной работы"""
-    try:
-        response = requests.post(
-            FUNCTION_URL,
-            json={
-                'work_id': work_id,
-                'extract_from_archive': True
-            },
-            timeout=120
-        )
-        
-        return response.json()
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+STOP = object()
 
 
-def main():
-    print('🚀 Начинаю массовое извлечение изображений из архивов...\n')
-    
-    stats = {
-        'total': 0,
-        'successful': 0,
-        'no_images': 0,
-        'failed': 0,
-        'errors': []
-    }
-    
-    offset = 0
-    batch_size = 50
-    
-    while True:
-        print(f'\n📦 Загрузка партии работ (offset={offset})...')
-        works = get_works_without_preview(batch_size, offset)
-        
-        if not works:
-            break
-        
-        print(f'📋 Найдено {len(works)} работ для обработки\n')
-        
-        for work in works:
-            work_id, title, download_url, file_url = work
-            stats['total'] += 1
-            
-            print(f'[{stats["total"]}] Обработка: {title[:60]}...')
-            print(f'    ID: {work_id}')
-            
-            result = extract_preview_for_work(work_id)
-            
-            if result.get('success'):
-                count = result.get('count', 0)
-                if count > 0:
-                    stats['successful'] += 1
-                    print(f'    ✅ Извлечено {count} изображений')
+def render_job(docx_path: str, img_path: str):
+    """Задача процесса рендеринга: превью и его производные; возвращает CPU-время и описание производных"""
+    started = time.process_time()
+    preview.render_formatted_preview(docx_path, img_path)
+    rendered = preview.render_image_variants(img_path, os.path.dirname(img_path), 'preview')
+    return time.process_time() - started, rendered
+
+
+class StageStats:
+    """Сколько элементов прошёл этап и сколько времени его исполнители были заняты"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.count = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.count += 1
+            self.busy += seconds
+
+    def line(self, elapsed: float) -> str:
+        rate = self.count / elapsed if elapsed else 0
+        avg = self.busy / self.count * 1000 if self.count else 0
+        load = self.busy / (elapsed * self.workers) * 100 if elapsed else 0
+        return (f'   {self.name:<11} {self.count:6d} шт  {rate:6.2f}/с  '
+                f'{avg:7.0f} мс/шт  загрузка {load:3.0f}% ({self.workers} исп.)')
+
+
+class Checkpoint:
+    """
+    Работы завершаются не по порядку, поэтому сохраняется нижняя граница:
+    максимальный id, до которого включительно всё обработано. Работа с ошибкой
+    не считается обработанной — контрольная точка останавливается перед ней
+    """
+
+    def __init__(self, path: str, last_id: int):
+        self.path = path
+        self.last_id = last_id
+        self.pending = []
+        self.done = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load(path: str) -> int:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return int(json.load(f).get('last_work_id', 0))
+        except (OSError, ValueError):
+            return 0
+
+    def issue(self, work_id: int):
+        with self.lock:
+            self.pending.append(work_id)
+
+    def finish(self, work_id: int, ok: bool = True):
+        if not ok:
+            return
+        with self.lock:
+            self.done.add(work_id)
+            advanced = False
+            while self.pending and self.pending[0] in self.done:
+                self.last_id = self.pending.pop(0)
+                self.done.discard(self.last_id)
+                advanced = True
+            if advanced:
+                self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_work_id': self.last_id, 'saved_at': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+        os.replace(tmp_path, self.path)
+
+
+class Pipeline:
+    def __init__(self, checkpoint: Checkpoint, include_stale: bool):
+        self.checkpoint = checkpoint
+        self.include_stale = include_stale
+        self.download_q = queue.Queue(maxsize=QUEUE_SIZE)
+        self.upload_q = queue.Queue(maxsize=QUEUE_SIZE)
+        self.renderers = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        # Пул процессов принимает задачи без ограничения — место в рендере занимается до submit
+        # и освобождается, когда работа выгружена и её временные файлы удалены
+        self.render_slots = threading.BoundedSemaphore(QUEUE_SIZE)
+        self.local = threading.local()
+        self.stats = {
+            'download': StageStats('скачивание', DOWNLOAD_WORKERS),
+            'render': StageStats('рендеринг', RENDER_WORKERS),
+            'upload': StageStats('выгрузка', UPLOAD_WORKERS),
+        }
+        self.results = {'rendered': 0, 'cached': 0, 'no_docx': 0, 'failed': 0}
+        self.errors = []
+        self.lock = threading.Lock()
+        # Один и тот же документ в нескольких работах рендерится один раз: остальные ждут результата
+        self.inflight = {}
+
+    def conn(self):
+        """Отдельное соединение на поток: psycopg2-соединение нельзя делить между потоками"""
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = psycopg2.connect(DATABASE_URL)
+            self.local.conn.autocommit = True
+        return self.local.conn
+
+    def s3(self):
+        """Клиент S3 на поток выгрузки"""
+        if not hasattr(self.local, 's3'):
+            self.local.s3 = preview.get_s3_client()
+        return self.local.s3
+
+    def result(self, work_id: int, outcome: str, error: str = None):
+        with self.lock:
+            self.results[outcome] += 1
+            if error:
+                self.errors.append({'work_id': work_id, 'error': error})
+        self.checkpoint.finish(work_id, outcome != 'failed')
+
+    def produce(self):
+        """Читает работы после контрольной точки страницами по id и кладёт их в очередь скачивания"""
+        cur = psycopg2.connect(DATABASE_URL).cursor()
+        last_id = self.checkpoint.last_id
+        while True:
+            cur.execute(f"""
+                SELECT w.id, w.file_url,
+                       CASE WHEN w.preview_renderer = %s THEN w.preview_archive_etag END,
+                       w.preview_source_sha256
+                FROM {SCHEMA}.works w
+                LEFT JOIN {SCHEMA}.preview_artifacts pa
+                    ON pa.source_sha256 = w.preview_source_sha256
+                   AND pa.renderer = %s AND pa.renderer_version = %s
+                WHERE w.id > %s
+                  AND w.title NOT LIKE '[УДАЛЕНО]%%'
+                  AND w.file_url IS NOT NULL
+                  AND ((w.preview_image_url IS NULL OR w.preview_image_url = '')
+                       OR (%s AND w.preview_renderer = %s AND pa.source_sha256 IS NULL))
+                ORDER BY w.id
+                LIMIT %s
+            """, (preview.PREVIEW_RENDERER, preview.PREVIEW_RENDERER, preview.PREVIEW_RENDERER_VERSION, last_id,
+                  self.include_stale, preview.PREVIEW_RENDERER, PAGE_SIZE))
+            works = cur.fetchall()
+            if not works:
+                break
+            for work in works:
+                self.checkpoint.issue(work[0])
+                # put блокируется, пока очередь полна, — так конвейер не убегает вперёд рендера
+                self.download_q.put(work)
+            last_id = works[-1][0]
+        cur.connection.close()
+
+    def download_worker(self):
+        while True:
+            work = self.download_q.get()
+            if work is STOP:
+                return
+            work_id, file_url, archive_etag, source_sha256 = work
+            started = time.monotonic()
+            temp_dir = tempfile.mkdtemp(prefix=f'preview_{work_id}_')
+            handed_off = False
+            owns_render = False
+            has_slot = False
+            try:
+                archive, fingerprint = preview.open_remote_archive(file_url, temp_dir)
+                cached = None
+                if fingerprint and fingerprint == archive_etag and source_sha256:
+                    cached = preview.find_preview_artifact(self.conn().cursor(), source_sha256)
+
+                member = None
+                if not cached:
+                    with archive, zipfile.ZipFile(archive) as zip_ref:
+                        member = preview.pick_pz_member(zip_ref)
+                        if member:
+                            docx_path = os.path.join(temp_dir, 'document.docx')
+                            source_sha256 = preview.extract_member(zip_ref, member, docx_path)
+                    if not member:
+                        self.stats['download'].add(time.monotonic() - started)
+                        self.result(work_id, 'no_docx')
+                        continue
+                    cached = preview.find_preview_artifact(self.conn().cursor(), source_sha256)
                 else:
-                    stats['no_images'] += 1
-                    print(f'    ⚠️  PNG не найдено в архиве')
-            else:
-                stats['failed'] += 1
-                error_msg = result.get('error') or result.get('message', 'Unknown error')
-                print(f'    ❌ Ошибка: {error_msg}')
-                stats['errors'].append({
-                    'work_id': work_id,
-                    'title': title,
-                    'error': error_msg
-                })
-            
-            # Пауза между запросами
-            time.sleep(2)
-        
-        offset += batch_size
-        
-        # Промежуточная статистика
-        print('\n' + '='*60)
-        print('📊 ПРОМЕЖУТОЧНАЯ СТАТИСТИКА:')
-        print(f'   Всего обработано: {stats["total"]}')
-        print(f'   ✅ Успешно: {stats["successful"]}')
-        print(f'   ⚠️  Без изображений: {stats["no_images"]}')
-        print(f'   ❌ Ошибки: {stats["failed"]}')
-        print('='*60 + '\n')
-    
-    # Финальная статистика
-    print('\n' + '='*60)
-    print('🎉 ОБРАБОТКА ЗАВЕРШЕНА!')
-    print('='*60)
-    print('📊 ИТОГОВАЯ СТАТИСТИКА:')
-    print(f'   Всего обработано: {stats["total"]}')
-    print(f'   ✅ Успешно: {stats["successful"]} ({stats["successful"]/stats["total"]*100:.1f}%)')
-    print(f'   ⚠️  Без изображений: {stats["no_images"]} ({stats["no_images"]/stats["total"]*100:.1f}%)')
-    print(f'   ❌ Ошибки: {stats["failed"]} ({stats["failed"]/stats["total"]*100:.1f}%)')
-    
-    if stats['errors']:
-        print('\n📝 Список ошибок:')
-        for idx, err in enumerate(stats['errors'][:10], 1):
-            print(f'   {idx}. Work #{err["work_id"]}: {err["error"]}')
-        if len(stats['errors']) > 10:
-            print(f'   ... и ещё {len(stats["errors"]) - 10} ошибок')
-    
-    print('='*60)
+                    archive.close()
+
+                self.stats['download'].add(time.monotonic() - started)
+                if cached:
+                    self.save(work_id, cached, source_sha256, fingerprint)
+                    self.result(work_id, 'cached')
+                    continue
+
+                with self.lock:
+                    waiters = self.inflight.get(source_sha256)
+                    if waiters is None:
+                        self.inflight[source_sha256] = []
+                    else:
+                        waiters.append((work_id, fingerprint))
+                if waiters is not None:
+                    continue
+                owns_render = True
+
+                img_path = os.path.join(temp_dir, 'preview_content.png')
+                self.render_slots.acquire()
+                has_slot = True
+                future = self.renderers.submit(render_job, docx_path, img_path)
+                self.upload_q.put((work_id, future, img_path, temp_dir, source_sha256, fingerprint, member))
+                handed_off = True
+            except Exception as e:
+                self.result(work_id, 'failed', f'скачивание: {e}')
+                if owns_render:
+                    self.release_waiters(source_sha256, None)
+            finally:
+                if not handed_off:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+                    if has_slot:
+                        self.render_slots.release()
+
+    def upload_worker(self):
+        while True:
+            item = self.upload_q.get()
+            if item is STOP:
+                return
+            work_id, future, img_path, temp_dir, source_sha256, fingerprint, member = item
+            url = None
+            try:
+                cpu_time, rendered = future.result()
+                self.stats['render'].add(cpu_time)
+                started = time.monotonic()
+                url = preview.upload_to_s3(img_path, source_sha256, 0)
+                if not url:
+                    raise Exception('S3 upload failed')
+                image_variants = preview.upload_image_variants(self.s3(), url, rendered)
+                preview.save_preview_artifact(self.conn().cursor(), source_sha256, [url], member, image_variants)
+                self.save(work_id, [url], source_sha256, fingerprint)
+                self.stats['upload'].add(time.monotonic() - started)
+                self.result(work_id, 'rendered')
+            except Exception as e:
+                self.result(work_id, 'failed', f'рендеринг/выгрузка: {e}')
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                self.render_slots.release()
+                self.release_waiters(source_sha256, url)
+
+    def release_waiters(self, source_sha256, url):
+        with self.lock:
+            waiters = self.inflight.pop(source_sha256, [])
+        for work_id, fingerprint in waiters:
+            try:
+                if not url:
+                    raise Exception('рендер того же документа не удался')
+                self.save(work_id, [url], source_sha256, fingerprint)
+                self.result(work_id, 'cached')
+            except Exception as e:
+                self.result(work_id, 'failed', f'выгрузка: {e}')
+
+    def save(self, work_id, preview_urls, source_sha256, fingerprint):
+        preview.save_work_preview(self.conn().cursor(), work_id, preview_urls, source_sha256, fingerprint)
+
+    def report(self, elapsed: float, title: str):
+        done = sum(self.results.values())
+        print('\n' + '=' * 72)
+        print(f'{title}: {done} работ за {elapsed:.0f} с ({done / elapsed if elapsed else 0:.2f} работ/с), '
+              f'контрольная точка id={self.checkpoint.last_id}')
+        for stage in self.stats.values():
+            print(stage.line(elapsed))
+        print(f"   ✅ отрисовано: {self.results['rendered']}   ♻️  из кэша: {self.results['cached']}   "
+              f"⚠️  без .docx: {self.results['no_docx']}   ❌ ошибки: {self.results['failed']}")
+        print('=' * 72)
+
+    def run(self):
+        started = time.monotonic()
+        downloaders = [threading.Thread(target=self.download_worker, daemon=True) for _ in range(DOWNLOAD_WORKERS)]
+        uploaders = [threading.Thread(target=self.upload_worker, daemon=True) for _ in range(UPLOAD_WORKERS)]
+        for thread in downloaders + uploaders:
+            thread.start()
+
+        producer = threading.Thread(target=self.produce, daemon=True)
+        producer.start()
+        try:
+            while producer.is_alive():
+                producer.join(REPORT_INTERVAL)
+                self.report(time.monotonic() - started, '📊 Промежуточно')
+
+            for _ in downloaders:
+                self.download_q.put(STOP)
+            for thread in downloaders:
+                thread.join()
+            for _ in uploaders:
+                self.upload_q.put(STOP)
+            for thread in uploaders:
+                thread.join()
+        finally:
+            self.renderers.shutdown(cancel_futures=True)
+
+        self.report(time.monotonic() - started, '🎉 ОБРАБОТКА ЗАВЕРШЕНА')
+        if self.errors:
+            print('\n📝 Список ошибок:')
+            for idx, err in enumerate(self.errors[:10], 1):
+                print(f'   {idx}. Work #{err["work_id"]}: {err["error"]}')
+            if len(self.errors) > 10:
+                print(f'   ... и ещё {len(self.errors) - 10} ошибок')
+
+
+def main():
+    start_id = 0 if '--restart' in sys.argv else Checkpoint.load(CHECKPOINT_FILE)
+    print(f'🚀 Генерация превью: {DOWNLOAD_WORKERS} потоков скачивания, {RENDER_WORKERS} процессов рендеринга, '
+          f'{UPLOAD_WORKERS} потоков выгрузки')
+    if start_id:
+        print(f'↪️  Продолжаю после работы id={start_id} (--restart — начать заново)')
+
+    Pipeline(Checkpoint(CHECKPOINT_FILE, start_id), include_stale='--all' in sys.argv).run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пагинации каталога: OFFSET против курсора (created_at, id)
+
+Создаёт в локальном Postgres схему bench_catalog с таблицей works на 100k строк,
+индексами как в V0100 и сравнивает задержку 1-й и 50-й страницы.
+
+Запуск:
+    DATABASE_URL=postgresql://postgres@localhost/postgres python3 scripts/benchmark_catalog_pagination.py
+"""
+
+import os
+import sys
+import time
+import statistics
+import psycopg2
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 'bench_catalog'
+ROWS = int(os.environ.get('BENCH_ROWS', 100_000))
+PAGE_SIZE = 50
+TARGET_PAGE = 50
+RUNS = 30
+
+if not DATABASE_URL:
+    print('❌ DATABASE_URL не найден в переменных окружения')
+    sys.exit(1)
+
+COLUMNS = """id, title, work_type, subject, description, price_points, rating, downloads,
+             category, preview_image_url, author_id, preview_urls, author_name, language,
+             software, views_count, reviews_count, keywords, file_url, downloads_count, discount,
+             created_at"""
+
+WHERE = "title NOT LIKE '[УДАЛЕНО]%%' AND status = 'approved'"
+
+
+def seed(cur):
+    """Создать и заполнить тестовую таблицу"""
+    print(f'🌱 Заполняю {SCHEMA}.works ({ROWS} строк)...')
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.works (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR(500) NOT NULL,
+            work_type VARCHAR(100),
+            subject VARCHAR(200),
+            description TEXT,
+            price_points INTEGER,
+            rating DECIMAL(2,1) DEFAULT 0,
+            downloads INTEGER DEFAULT 0,
+            category VARCHAR(50),
+            preview_image_url TEXT,
+            author_id INTEGER,
+            preview_urls TEXT,
+            author_name VARCHAR(255),
+            language VARCHAR(100) DEFAULT 'Русский',
+            software TEXT DEFAULT '[]',
+            views_count INTEGER DEFAULT 0,
+            reviews_count INTEGER DEFAULT 0,
+            keywords TEXT DEFAULT '[]',
+            file_url VARCHAR(500),
+            downloads_count INTEGER DEFAULT 0,
+            discount INTEGER DEFAULT 0,
+            status VARCHAR(20) DEFAULT 'pending',
+            created_at TIMESTAMP NOT NULL
+        )
+    """)
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.works (title, work_type, subject, description, price_points,
+                                    category, status, created_at)
+        SELECT 'Курсовая работа №' || g,
+               (ARRAY['курсовая', 'диплом', 'реферат'])[1 + g %% 3],
+               (ARRAY['Электроэнергетика', 'Строительство', 'Машиностроение'])[1 + g %% 3],
+               repeat('Описание работы. ', 20),
+               100 + g %% 500,
+               (ARRAY['coursework', 'thesis', 'essays', 'labs'])[1 + g %% 4],
+               CASE WHEN g %% 20 = 0 THEN 'pending' ELSE 'approved' END,
+               NOW() - (g || ' minutes')::interval
+        FROM generate_series(1, %s) AS g
+    """, (ROWS,))
+    cur.execute(f"CREATE INDEX ON {SCHEMA}.works (status, created_at DESC, id DESC)")
+    cur.execute(f"CREATE INDEX ON {SCHEMA}.works (status, category, created_at DESC, id DESC)")
+    cur.execute(f"ANALYZE {SCHEMA}.works")
+
+
+def timed(cur, sql, params=None):
+    """Выполнить запрос RUNS раз и вернуть задержки в мс"""
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def offset_query(page):
+    return (f"SELECT {COLUMNS} FROM {SCHEMA}.works WHERE {WHERE} "
+            f"ORDER BY created_at DESC, id DESC LIMIT {PAGE_SIZE + 1} OFFSET {(page - 1) * PAGE_SIZE}")
+
+
+def keyset_query(after):
+    sql = f"SELECT {COLUMNS} FROM {SCHEMA}.works WHERE {WHERE}"
+    if after:
+        sql += " AND (created_at, id) < (%s, %s)"
+    return sql + f" ORDER BY created_at DESC, id DESC LIMIT {PAGE_SIZE + 1}"
+
+
+def cursor_for_page(cur, page):
+    """Пройти курсором до нужной страницы и вернуть (created_at, id) её начала"""
+    after = None
+    for _ in range(page - 1):
+        cur.execute(keyset_query(after), after)
+        rows = cur.fetchall()[:PAGE_SIZE]
+        after = (rows[-1][21], rows[-1][0])
+    return after
+
+
+def report(name, samples):
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f'   {name:<28} median={statistics.median(samples):7.2f} мс   p95={p95:7.2f} мс')
+
+
+def main():
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True
+    cur = conn.cursor()
+    keep = '--keep' in sys.argv
+
+    try:
+        seed(cur)
+        after = cursor_for_page(cur, TARGET_PAGE)
+
+        print(f'\n📊 Страница 1 и {TARGET_PAGE} по {PAGE_SIZE} работ, {RUNS} прогонов:')
+        report('OFFSET, стр. 1', timed(cur, offset_query(1)))
+        report(f'OFFSET, стр. {TARGET_PAGE}', timed(cur, offset_query(TARGET_PAGE)))
+        report('cursor, стр. 1', timed(cur, keyset_query(None)))
+        report(f'cursor, стр. {TARGET_PAGE}', timed(cur, keyset_query(after), after))
+
+        cur.execute('EXPLAIN ' + keyset_query(after), after)
+        print('\n🔎 План для курсора:')
+        for (line,) in cur.fetchall():
+            print(f'   {line}')
+    finally:
+        if not keep:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
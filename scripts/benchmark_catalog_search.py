@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска по каталогу: ILIKE '%q%' против tsvector + GIN (V0101)
+
+Создаёт в локальном Postgres схему bench_search с таблицей works на 100k строк
+и сравнивает p95 задержки для набора поисковых запросов.
+
+Запуск:
+    DATABASE_URL=postgresql://postgres@localhost/postgres python3 scripts/benchmark_catalog_search.py
+"""
+
+import os
+import re
+import sys
+import time
+import statistics
+import psycopg2
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 'bench_search'
+ROWS = int(os.environ.get('BENCH_ROWS', 100_000))
+RUNS = 20
+QUERIES = ['электроснабжение', 'проектирование цеха', 'редуктор', 'фундамент', 'котельной']
+
+if not DATABASE_URL:
+    print('❌ DATABASE_URL не найден в переменных окружения')
+    sys.exit(1)
+
+
+def seed(cur):
+    """Создать и заполнить тестовую таблицу"""
+    print(f'🌱 Заполняю {SCHEMA}.works ({ROWS} строк)...')
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.works (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR(500) NOT NULL,
+            description TEXT,
+            keywords TEXT DEFAULT '[]',
+            status VARCHAR(20) DEFAULT 'approved',
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+                setweight(to_tsvector('russian', COALESCE(keywords, '')), 'B') ||
+                setweight(to_tsvector('russian', COALESCE(description, '')), 'C')
+            ) STORED
+        )
+    """)
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.works (title, description, keywords, created_at)
+        SELECT (ARRAY['Электроснабжение цеха', 'Проектирование котельной', 'Расчёт редуктора',
+                      'Фундамент промышленного здания', 'Технология машиностроения'])[1 + g %% 5]
+                   || ' вариант ' || g,
+               repeat('Пояснительная записка с расчётами и чертежами. ', 10),
+               '["курсовая", "расчёт", "вариант ' || g %% 100 || '"]',
+               NOW() - (g || ' minutes')::interval
+        FROM generate_series(1, %s) AS g
+    """, (ROWS,))
+    cur.execute(f"CREATE INDEX ON {SCHEMA}.works USING GIN (search_vector)")
+    cur.execute(f"ANALYZE {SCHEMA}.works")
+
+
+def ilike_sql(q):
+    safe = q.replace("'", "''")
+    return (f"SELECT id, title FROM {SCHEMA}.works WHERE status = 'approved' "
+            f"AND (title ILIKE '%{safe}%' OR description ILIKE '%{safe}%') "
+            f"ORDER BY created_at DESC LIMIT 50")
+
+
+def fts_sql(q):
+    terms = ' & '.join(f'{t}:*' for t in re.findall(r'[^\W_]+', q.lower()))
+    ts_query = f"to_tsquery('russian', '{terms}')"
+    return (f"SELECT id, title FROM {SCHEMA}.works WHERE status = 'approved' "
+            f"AND search_vector @@ {ts_query} "
+            f"ORDER BY ts_rank(search_vector, {ts_query}) DESC, created_at DESC LIMIT 50")
+
+
+def measure(cur, build):
+    samples = []
+    for _ in range(RUNS):
+        for q in QUERIES:
+            started = time.perf_counter()
+            cur.execute(build(q))
+            cur.fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name, samples):
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f'   {name:<10} median={statistics.median(samples):8.2f} мс   p95={p95:8.2f} мс')
+
+
+def main():
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        seed(cur)
+        print(f'\n📊 {len(QUERIES)} запросов × {RUNS} прогонов:')
+        report('ILIKE', measure(cur, ilike_sql))
+        report('tsvector', measure(cur, fts_sql))
+    finally:
+        if '--keep' not in sys.argv:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
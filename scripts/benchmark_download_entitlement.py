@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк проверки доступа в download-work: последовательные запросы против одного ENTITLEMENT_SQL
+
+Создаёт в локальном Postgres схему bench_download с users / works / purchases /
+user_downloads / events и сравнивает задержку одного скачивания:
+старый путь (роль, автор, покупка, INSERT, SELECT ссылки, UPDATE счётчика, два COMMIT)
+и новый (один оператор в autocommit).
+
+Запуск:
+    DATABASE_URL=postgresql://postgres@localhost/postgres python3 scripts/benchmark_download_entitlement.py
+"""
+
+import os
+import sys
+import time
+import random
+import statistics
+import psycopg2
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 'bench_download'
+USERS = 10_000
+WORKS = 20_000
+PURCHASES = 100_000
+RUNS = 500
+
+if not DATABASE_URL:
+    print('❌ DATABASE_URL не найден в переменных окружения')
+    sys.exit(1)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'download-work'))
+from index import ENTITLEMENT_SQL  # noqa: E402
+
+NEW_SQL = ENTITLEMENT_SQL.replace('t_p63326274_course_download_plat.', f'{SCHEMA}.')
+
+
+def seed(cur):
+    """Создать и заполнить тестовые таблицы"""
+    print(f'🌱 Заполняю {SCHEMA} ({USERS} пользователей, {WORKS} работ, {PURCHASES} покупок)...')
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.users (id SERIAL PRIMARY KEY, role VARCHAR(20) DEFAULT 'user');
+        CREATE TABLE {SCHEMA}.works (
+            id SERIAL PRIMARY KEY, title VARCHAR(500), author_id INTEGER,
+            download_url TEXT, file_url VARCHAR(500), downloads_count INTEGER DEFAULT 0
+        );
+        CREATE TABLE {SCHEMA}.purchases (
+            id SERIAL PRIMARY KEY, buyer_id INTEGER NOT NULL, work_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE TABLE {SCHEMA}.user_downloads (
+            id SERIAL PRIMARY KEY, user_id INTEGER, work_id INTEGER, downloaded_at TIMESTAMP
+        );
+        CREATE TABLE {SCHEMA}.events (
+            id BIGSERIAL PRIMARY KEY, event_type VARCHAR(50), user_id INTEGER, work_id INTEGER,
+            details TEXT, ip_address VARCHAR(50), created_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    cur.execute(f"INSERT INTO {SCHEMA}.users (role) SELECT 'user' FROM generate_series(1, %s)", (USERS,))
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.works (title, author_id, download_url)
+        SELECT 'Работа №' || g, 1 + g %% {USERS}, 'https://storage.yandexcloud.net/kyra/works/' || g || '.zip'
+        FROM generate_series(1, %s) AS g
+    """, (WORKS,))
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.purchases (buyer_id, work_id, created_at)
+        SELECT 1 + (g * 7919) %% {USERS}, 1 + (g * 104729) %% {WORKS}, NOW() - ((g %% 6) || ' days')::interval
+        FROM generate_series(1, %s) AS g
+    """, (PURCHASES,))
+    cur.execute(f"CREATE INDEX ON {SCHEMA}.purchases (buyer_id, work_id, created_at DESC)")
+    for table in ('users', 'works', 'purchases'):
+        cur.execute(f"ANALYZE {SCHEMA}.{table}")
+
+
+def old_path(conn, user_id, work_id):
+    """Повтор прежней последовательности запросов download-work"""
+    cur = conn.cursor()
+    cur.execute(f"SELECT role FROM {SCHEMA}.users WHERE id = %s", (user_id,))
+    cur.fetchone()
+    cur.execute(f"SELECT author_id FROM {SCHEMA}.works WHERE id = %s", (work_id,))
+    cur.fetchone()
+    cur.execute(f"""SELECT id, created_at FROM {SCHEMA}.purchases
+                    WHERE buyer_id = %s AND work_id = %s ORDER BY created_at DESC LIMIT 1""", (user_id, work_id))
+    cur.fetchone()
+    cur.execute(f"INSERT INTO {SCHEMA}.user_downloads (user_id, work_id, downloaded_at) VALUES (%s, %s, NOW())",
+                (user_id, work_id))
+    conn.commit()
+    cur.execute(f"SELECT title, download_url, file_url FROM {SCHEMA}.works WHERE id = %s", (work_id,))
+    cur.fetchone()
+    cur.execute(f"UPDATE {SCHEMA}.works SET downloads_count = COALESCE(downloads_count, 0) + 1 WHERE id = %s",
+                (work_id,))
+    conn.commit()
+    cur.close()
+
+
+def new_path(conn, user_id, work_id):
+    cur = conn.cursor()
+    cur.execute(NEW_SQL, {'user_id': user_id, 'work_id': work_id})
+    cur.fetchone()
+    cur.close()
+
+
+def measure(conn, path, pairs):
+    samples = []
+    for user_id, work_id in pairs:
+        started = time.perf_counter()
+        path(conn, user_id, work_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name, samples):
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f'   {name:<24} median={statistics.median(samples):7.2f} мс   p95={p95:7.2f} мс')
+
+
+def main():
+    setup = psycopg2.connect(DATABASE_URL)
+    setup.autocommit = True
+    cur = setup.cursor()
+    old_conn = psycopg2.connect(DATABASE_URL)
+    new_conn = psycopg2.connect(DATABASE_URL)
+    new_conn.autocommit = True
+
+    try:
+        seed(cur)
+        cur.execute(f"SELECT buyer_id, work_id FROM {SCHEMA}.purchases ORDER BY id LIMIT %s", (RUNS,))
+        pairs = cur.fetchall()
+        random.Random(42).shuffle(pairs)
+
+        print(f'\n📊 {RUNS} скачиваний купленных работ:')
+        report('5 запросов + 2 COMMIT', measure(old_conn, old_path, pairs))
+        report('ENTITLEMENT_SQL', measure(new_conn, new_path, pairs))
+    finally:
+        if '--keep' not in sys.argv:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.close()
+        setup.close()
+        old_conn.close()
+        new_conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Построение блока «Похожие работы»: TF-IDF по названию, ключевым словам,
+предмету и ПО + top-K ближайших соседей по косинусной близости
+
+Векторы разреженные (словарь термин → вес), близость считается через
+инвертированный индекс, поэтому сравниваются только работы с общими терминами.
+Результат пишется в work_neighbors (V0108), откуда его отдаёт GET /works?action=related.
+
+Запуск:
+    DATABASE_URL=... python3 scripts/build_work_neighbors.py                # полный пересчёт
+    DATABASE_URL=... python3 scripts/build_work_neighbors.py --incremental  # только новые одобренные работы
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import heapq
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p63326274_course_download_plat'
+TOP_K = int(os.environ.get('NEIGHBORS_TOP_K', 12))
+MIN_SCORE = 0.05
+# Термины, встречающиеся больше чем в половине работ, ничего не различают и раздувают перебор
+MAX_DF_RATIO = 0.5
+TITLE_WEIGHT = 2
+
+if not DATABASE_URL:
+    print('❌ DATABASE_URL не найден в переменных окружения')
+    sys.exit(1)
+
+STOP_WORDS = {
+    'и', 'в', 'во', 'на', 'по', 'с', 'со', 'для', 'из', 'от', 'до', 'за', 'при', 'под', 'над',
+    'о', 'об', 'к', 'ко', 'а', 'но', 'или', 'не', 'как', 'что', 'его', 'ее', 'их', 'это',
+    'работа', 'курсовая', 'курсовой', 'проект', 'дипломная', 'диплом', 'реферат', 'тема',
+}
+
+# Окончания русских слов от длинных к коротким (упрощённый стеммер в духе Snowball)
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ую', 'юю', 'ом', 'ем', 'ам',
+    'ям', 'ах', 'ях', 'ов', 'ев', 'ия', 'ие', 'ию', 'ии', 'ть', 'ет', 'ит', 'ут', 'ют',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+
+def stem(token: str) -> str:
+    for ending in RUSSIAN_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = re.findall(r'[^\W_]+', (text or '').lower().replace('ё', 'е'))
+    return [stem(t) for t in tokens if len(t) > 1 and t not in STOP_WORDS]
+
+
+def parse_list(value) -> List[str]:
+    """keywords/software хранятся JSON-строкой, но встречается и обычный текст"""
+    if not value:
+        return []
+    try:
+        parsed = json.loads(value)
+    except (TypeError, ValueError):
+        return [value]
+    return [str(item) for item in parsed] if isinstance(parsed, list) else [str(parsed)]
+
+
+def work_terms(title, keywords, subject, software) -> Counter:
+    terms = Counter()
+    for token in tokenize(title):
+        terms[token] += TITLE_WEIGHT
+    for keyword in parse_list(keywords):
+        terms.update(tokenize(keyword))
+    # Предмет и ПО — категориальные признаки, берём целиком
+    if subject:
+        terms['subject:' + subject.strip().lower()] += 1
+    for item in parse_list(software):
+        terms['software:' + item.strip().lower()] += 1
+    return terms
+
+
+def load_works(cur) -> Dict[int, Counter]:
+    cur.execute(f"""
+        SELECT id, title, keywords, subject, software
+        FROM {SCHEMA}.works
+        WHERE status = 'approved' AND title NOT LIKE '[УДАЛЕНО]%'
+    """)
+    return {row[0]: work_terms(*row[1:]) for row in cur.fetchall()}
+
+
+def tfidf_vectors(docs: Dict[int, Counter]) -> Dict[int, Dict[str, float]]:
+    """Нормированные TF-IDF векторы: tf = 1 + log(n), idf сглаженный"""
+    total = len(docs)
+    df = Counter(term for terms in docs.values() for term in terms)
+    max_df = max(2, int(total * MAX_DF_RATIO))
+    idf = {term: math.log((1 + total) / (1 + n)) + 1 for term, n in df.items() if n <= max_df}
+
+    vectors = {}
+    for work_id, terms in docs.items():
+        vector = {t: (1 + math.log(n)) * idf[t] for t, n in terms.items() if t in idf}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        vectors[work_id] = {t: w / norm for t, w in vector.items()} if norm else {}
+    return vectors
+
+
+def nearest_neighbors(vectors: Dict[int, Dict[str, float]], targets) -> Dict[int, List[Tuple[int, float]]]:
+    """top-K соседей для targets через инвертированный индекс"""
+    postings = defaultdict(list)
+    for work_id, vector in vectors.items():
+        for term, weight in vector.items():
+            postings[term].append((work_id, weight))
+
+    result = {}
+    for work_id in targets:
+        scores = defaultdict(float)
+        for term, weight in vectors[work_id].items():
+            for other_id, other_weight in postings[term]:
+                if other_id != work_id:
+                    scores[other_id] += weight * other_weight
+        best = heapq.nlargest(TOP_K, scores.items(), key=lambda item: item[1])
+        result[work_id] = [(other_id, score) for other_id, score in best if score >= MIN_SCORE]
+    return result
+
+
+def save_full(cur, neighbors):
+    cur.execute(f"DELETE FROM {SCHEMA}.work_neighbors")
+    rows = [(w, n, s) for w, items in neighbors.items() for n, s in items]
+    execute_values(cur, f"INSERT INTO {SCHEMA}.work_neighbors (work_id, neighbor_id, score) VALUES %s",
+                   rows, page_size=1000)
+    return len(rows)
+
+
+def save_incremental(cur, neighbors):
+    """Записать соседей новых работ и добавить новые работы в списки их соседей, оставив top-K"""
+    rows = [(w, n, s) for w, items in neighbors.items() for n, s in items]
+    reverse = [(n, w, s) for w, n, s in rows if n not in neighbors]
+    execute_values(cur, f"""
+        INSERT INTO {SCHEMA}.work_neighbors (work_id, neighbor_id, score) VALUES %s
+        ON CONFLICT (work_id, neighbor_id) DO UPDATE SET score = EXCLUDED.score, computed_at = NOW()
+    """, rows + reverse, page_size=1000)
+
+    touched = list({n for n, _, _ in reverse})
+    if touched:
+        cur.execute(f"""
+            DELETE FROM {SCHEMA}.work_neighbors wn
+            USING (
+                SELECT work_id, neighbor_id,
+                       ROW_NUMBER() OVER (PARTITION BY work_id ORDER BY score DESC) AS rn
+                FROM {SCHEMA}.work_neighbors
+                WHERE work_id = ANY(%s)
+            ) ranked
+            WHERE wn.work_id = ranked.work_id AND wn.neighbor_id = ranked.neighbor_id
+              AND ranked.rn > %s
+        """, (touched, TOP_K))
+
+    # Снятые с публикации работы не должны оставаться в чужих списках
+    cur.execute(f"""
+        DELETE FROM {SCHEMA}.work_neighbors wn
+        USING {SCHEMA}.works w
+        WHERE w.id = wn.neighbor_id AND w.status <> 'approved'
+    """)
+    return len(rows) + len(reverse)
+
+
+def main():
+    incremental = '--incremental' in sys.argv
+    conn = psycopg2.connect(DATABASE_URL)
+    cur = conn.cursor()
+
+    try:
+        started = time.time()
+        docs = load_works(cur)
+        print(f'📚 Загружено одобренных работ: {len(docs)}')
+        vectors = tfidf_vectors(docs)
+
+        if incremental:
+            cur.execute(f"SELECT DISTINCT work_id FROM {SCHEMA}.work_neighbors")
+            done = {row[0] for row in cur.fetchall()}
+            targets = [work_id for work_id in vectors if work_id not in done]
+            print(f'🆕 Работ без соседей: {len(targets)}')
+        else:
+            targets = list(vectors)
+
+        neighbors = nearest_neighbors(vectors, targets)
+        written = save_incremental(cur, neighbors) if incremental else save_full(cur, neighbors)
+        conn.commit()
+        print(f'✅ Записано пар соседей: {written} за {time.time() - started:.1f} с')
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
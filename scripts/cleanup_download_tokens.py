@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Очистка устаревшей таблицы download_tokens (см. V0110)
+
+Удаляет истёкшие токены пачками, чтобы не держать долгую блокировку,
+затем чистит истёкшие записи revoked_download_tokens и делает VACUUM.
+
+Запуск:
+    DATABASE_URL=... python3 scripts/cleanup_download_tokens.py
+"""
+
+import os
+import sys
+import time
+import psycopg2
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p63326274_course_download_plat'
+BATCH = 10_000
+
+if not DATABASE_URL:
+    print('❌ DATABASE_URL не найден в переменных окружения')
+    sys.exit(1)
+
+
+def main():
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        started = time.time()
+        deleted = 0
+        while True:
+            cur.execute(f"""
+                DELETE FROM {SCHEMA}.download_tokens
+                WHERE id IN (
+                    SELECT id FROM {SCHEMA}.download_tokens
+                    WHERE expires_at < NOW()
+                    LIMIT %s
+                )
+            """, (BATCH,))
+            deleted += cur.rowcount
+            print(f'🗑️ Удалено токенов: {deleted}')
+            if cur.rowcount < BATCH:
+                break
+
+        cur.execute(f"DELETE FROM {SCHEMA}.revoked_download_tokens WHERE expires_at < NOW()")
+        print(f'🗑️ Удалено истёкших отзывов: {cur.rowcount}')
+
+        cur.execute(f"VACUUM ANALYZE {SCHEMA}.download_tokens")
+        print(f'✅ Готово за {time.time() - started:.1f} с')
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
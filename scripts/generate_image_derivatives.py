@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Производные превью и обложек для srcset и плейсхолдеры BlurHash у уже загруженных работ
+
+Новые превью и обложки получают производные сразу (generate-work-preview,
+batch_extract_previews.py, upload-work-cover). Скрипт догоняет остальное: превью из
+local_scripts/generate_previews.py и upload-preview, а также всё, что загружено до V0113.
+Исходник скачивается и декодируется один раз, из него получаются все ширины
+DERIVATIVE_WIDTHS в WebP (и AVIF, если в Pillow есть кодер) и BlurHash; ключи и формат
+карты — те же, что у generate-work-preview. Производные считаются актуальными, если у записи
+тот же src, есть blurhash и ETag исходника (HEAD) совпадает с сохранённым: перезалитый под
+тем же URL файл получает новые производные.
+
+Запуск:
+    DATABASE_URL=... YANDEX_S3_KEY_ID=... YANDEX_S3_SECRET_KEY=... python3 scripts/generate_image_derivatives.py
+    ... --force   # пересоздать производные и у работ, где они уже актуальны
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import psycopg2
+import requests
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+SCHEMA = 't_p63326274_course_download_plat'
+# Pillow отпускает GIL при декодировании, ресайзе и кодировании — потоков хватает
+WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', os.cpu_count() or 2))
+PAGE_SIZE = 200
+DOWNLOAD_TIMEOUT = 60
+MAX_SOURCE_BYTES = 30 * 1024 * 1024
+
+if not DATABASE_URL:
+    print('❌ DATABASE_URL не найден в переменных окружения')
+    sys.exit(1)
+
+_preview_spec = importlib.util.spec_from_file_location(
+    'generate_work_preview',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'generate-work-preview', 'index.py'))
+preview = importlib.util.module_from_spec(_preview_spec)
+_preview_spec.loader.exec_module(preview)
+
+local = threading.local()
+
+
+def s3():
+    """Клиент S3 на поток"""
+    if not hasattr(local, 's3'):
+        local.s3 = preview.get_s3_client()
+    return local.s3
+
+
+def etag_of(response) -> Optional[str]:
+    return (response.headers.get('ETag') or '').strip('"') or None
+
+
+def download(url: str, path: str) -> Optional[str]:
+    """Скачать исходник, вернуть его ETag"""
+    size = 0
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=256 * 1024):
+                size += len(chunk)
+                if size > MAX_SOURCE_BYTES:
+                    raise ValueError(f'изображение больше {MAX_SOURCE_BYTES // (1024 * 1024)} МБ')
+                f.write(chunk)
+        return etag_of(response)
+
+
+def build_variants(url: str, temp_dir: str, name: str):
+    source_path = os.path.join(temp_dir, name)
+    etag = download(url, source_path)
+    rendered = preview.render_image_variants(source_path, temp_dir, name)
+    return preview.upload_image_variants(s3(), url, rendered, etag)
+
+
+def is_current(item, url: str) -> bool:
+    """Производные построены из того файла, что сейчас лежит по url"""
+    if not isinstance(item, dict) or item.get('src') != url or not item.get('blurhash') or not item.get('etag'):
+        return False
+    try:
+        response = requests.head(url, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True)
+    except requests.RequestException:
+        return False
+    return response.ok and etag_of(response) == item['etag']
+
+
+def pending_images(row, force: bool):
+    """Какие изображения работы ещё без актуальных производных: (превью или None, обложки или None)"""
+    _, preview_url, cover_images, variants = row
+    variants = variants or {}
+    cover_images = [url for url in (cover_images or []) if url]
+
+    preview_pending = None
+    if preview_url and (force or not is_current(variants.get('preview'), preview_url)):
+        preview_pending = preview_url
+
+    done_covers = variants.get('covers') or []
+    covers_pending = None
+    if cover_images and (force or len(done_covers) != len(cover_images)
+                         or not all(is_current(item, url) for item, url in zip(done_covers, cover_images))):
+        covers_pending = cover_images
+    return preview_pending, covers_pending
+
+
+def process_work(row, force: bool) -> bool:
+    """Обновить производные работы; False — все актуальны"""
+    work_id = row[0]
+    # Проверка свежести — HEAD на каждое изображение, поэтому тоже в пуле потоков
+    preview_url, covers = pending_images(row, force)
+    if not preview_url and not covers:
+        return False
+    temp_dir = tempfile.mkdtemp(prefix=f'derivatives_{work_id}_')
+    try:
+        update = {}
+        if preview_url:
+            update['preview'] = build_variants(preview_url, temp_dir, 'preview')
+        if covers:
+            update['covers'] = [build_variants(url, temp_dir, f'cover_{idx}') for idx, url in enumerate(covers)]
+
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            cur = conn.cursor()
+            # Условия на исходные URL: если превью или обложки сменились, пока шла обработка, не затираем
+            if 'preview' in update:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.works
+                    SET image_variants = COALESCE(image_variants, '{{}}'::jsonb) || jsonb_build_object('preview', %s::jsonb)
+                    WHERE id = %s AND preview_image_url = %s
+                """, (json.dumps(update['preview']), work_id, preview_url))
+                # Кэш превью по документу тоже получает производные, чтобы повторный рендер их не терял
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.preview_artifacts pa
+                    SET image_variants = %s
+                    FROM {SCHEMA}.works w
+                    WHERE w.id = %s AND pa.source_sha256 = w.preview_source_sha256
+                      AND pa.preview_urls->>0 = %s
+                      AND pa.image_variants IS DISTINCT FROM %s::jsonb
+                """, (json.dumps(update['preview']), work_id, preview_url, json.dumps(update['preview'])))
+            if 'covers' in update:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.works
+                    SET image_variants = COALESCE(image_variants, '{{}}'::jsonb) || jsonb_build_object('covers', %s::jsonb)
+                    WHERE id = %s AND cover_images = %s
+                """, (json.dumps(update['covers']), work_id, covers))
+            conn.commit()
+        finally:
+            conn.close()
+        return True
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    force = '--force' in sys.argv
+    conn = psycopg2.connect(DATABASE_URL)
+    cur = conn.cursor()
+    formats = ', '.join(fmt[1] for fmt in preview.derivative_formats())
+    print(f'🚀 Производные изображений: ширины {preview.DERIVATIVE_WIDTHS}, форматы {formats}, {WORKERS} потоков')
+
+    started = time.monotonic()
+    results = {'done': 0, 'skipped': 0, 'failed': 0}
+    errors = []
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        while True:
+            cur.execute(f"""
+                SELECT id, preview_image_url, cover_images, image_variants
+                FROM {SCHEMA}.works
+                WHERE id > %s AND title NOT LIKE '[УДАЛЕНО]%%'
+                  AND (COALESCE(preview_image_url, '') <> '' OR cardinality(cover_images) > 0)
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, PAGE_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            futures = {pool.submit(process_work, row, force): row[0] for row in rows}
+            for future, work_id in futures.items():
+                try:
+                    results['done' if future.result() else 'skipped'] += 1
+                except Exception as e:
+                    results['failed'] += 1
+                    errors.append({'work_id': work_id, 'error': str(e)})
+            print(f"   id ≤ {last_id}: ✅ {results['done']}  ⏭️  {results['skipped']}  ❌ {results['failed']}")
+    cur.close()
+    conn.close()
+
+    elapsed = time.monotonic() - started
+    print('\n' + '=' * 72)
+    print(f"🎉 Готово за {elapsed:.0f} с: производные созданы у {results['done']} работ, "
+          f"актуальны у {results['skipped']}, ошибки у {results['failed']}")
+    print('=' * 72)
+    if errors:
+        print('\n📝 Список ошибок:')
+        for idx, err in enumerate(errors[:10], 1):
+            print(f'   {idx}. Work #{err["work_id"]}: {err["error"]}')
+        if len(errors) > 10:
+            print(f'   ... и ещё {len(errors) - 10} ошибок')
+
+
+if __name__ == '__main__':
+    main()
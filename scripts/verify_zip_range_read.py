@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Проверка чтения архивов через HTTP Range: отдельные файлы ZIP (backend/download-work)
+и список файлов ZIP / RAR4 / RAR5 / 7z по заголовкам (backend/populate-files-list)
+
+Файлы больше лимита ответа download-work распаковывает в S3; вместо бакета здесь
+S3 в памяти, который собирает части multipart upload.
+
+Поднимает локальный HTTP-сервер с поддержкой Range, раздаёт ZIP-фикстуры
+(stored, deflate, имена в cp866 и UTF-8, ZIP64 с центральным каталогом за пределами хвоста)
+и собранные вручную RAR4 / RAR5 / 7z без сжатия, затем сверяет прочитанные элементы
+с исходными данными и числом скачанных байт.
+
+Запуск:
+    python3 scripts/verify_zip_range_read.py
+"""
+
+import os
+import re
+import sys
+import random
+import struct
+import tempfile
+import threading
+import zipfile
+import zlib
+import importlib.util
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'download-work'))
+import index  # noqa: E402
+
+_populate_spec = importlib.util.spec_from_file_location(
+    'populate_files_list', os.path.join(os.path.dirname(__file__), '..', 'backend', 'populate-files-list', 'index.py'))
+populate = importlib.util.module_from_spec(_populate_spec)
+_populate_spec.loader.exec_module(populate)
+
+served_bytes = 0
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Статика с поддержкой одного диапазона bytes=a-b / bytes=-n"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        global served_bytes
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if not match or self.path.startswith('/norange/'):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            served_bytes += len(data)
+            self.send_body(data)
+            return
+
+        start, end = match.groups()
+        if start:
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+        else:
+            start, end = max(len(data) - int(end), 0), len(data) - 1
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        served_bytes += len(body)
+        self.send_body(body)
+
+    def send_body(self, data):
+        # Клиент без поддержки Range закрывает соединение, не дочитав ответ
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def build_fixtures(root):
+    rng = random.Random(7)
+    docx = rng.randbytes(300_000)
+    text = ('Пояснительная записка. ' * 200_000).encode('utf-8')
+    drawing = rng.randbytes(50_000)
+    assembly = rng.randbytes(3_000_000)
+
+    with zipfile.ZipFile(os.path.join(root, 'work.zip'), 'w') as zf:
+        zf.writestr(zipfile.ZipInfo('Чертежи/'), b'')
+        zf.writestr('ПЗ.docx', docx, compress_type=zipfile.ZIP_STORED)
+        zf.writestr('Записка.txt', text, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr('Чертежи/Лист 1.dwg', drawing, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr('Чертежи/Сборка.bin', assembly, compress_type=zipfile.ZIP_STORED)
+
+    # Имя в cp866 без флага UTF-8, как пишут Windows-архиваторы
+    class Cp866Info(zipfile.ZipInfo):
+        def _encodeFilenameFlags(self):
+            return self.filename.encode('cp866'), self.flag_bits
+
+    with zipfile.ZipFile(os.path.join(root, 'cp866.zip'), 'w') as zf:
+        zf.writestr(Cp866Info('Расчёт.txt'), b'cp866 name')
+
+    # >65535 элементов: ZIP64 EOCD, центральный каталог не влезает в хвост
+    with zipfile.ZipFile(os.path.join(root, 'zip64.zip'), 'w') as zf:
+        for i in range(70_000):
+            zf.writestr(f'f/{i}.txt', b'x')
+        zf.writestr('last.bin', drawing, compress_type=zipfile.ZIP_DEFLATED)
+
+    with open(os.path.join(root, 'not-a-zip.rar'), 'wb') as f:
+        f.write(b'Rar!\x1a\x07\x00' + rng.randbytes(1000))
+
+    members = [('ПЗ.docx', docx), ('Чертежи/Лист 1.dwg', drawing), ('Пусто.txt', b'')]
+    with open(os.path.join(root, 'work4.rar'), 'wb') as f:
+        f.write(build_rar4(members))
+    with open(os.path.join(root, 'work5.rar'), 'wb') as f:
+        f.write(build_rar5(members))
+    with open(os.path.join(root, 'work.7z'), 'wb') as f:
+        f.write(build_7z(members))
+
+    return {'ПЗ.docx': docx, 'Записка.txt': text, 'Чертежи/Лист 1.dwg': drawing, 'Чертежи/Сборка.bin': assembly,
+            'last.bin': drawing}
+
+
+def rar4_block(block_type, flags, body):
+    header = struct.pack('<BHH', block_type, flags, 7 + len(body)) + body
+    return struct.pack('<H', zlib.crc32(header) & 0xFFFF) + header
+
+
+def build_rar4(members):
+    """RAR 2.9 без сжатия: имена с флагом Unicode, без стандартной части"""
+    out = b'Rar!\x1a\x07\x00' + rar4_block(0x73, 0, b'\x00' * 6)
+    for name, data in members:
+        raw_name = name.replace('/', '\\').encode('utf-8')
+        body = struct.pack('<IIBIIBBHI', len(data), len(data), 2, zlib.crc32(data), 0, 29, 0x30,
+                           len(raw_name), 0x20) + raw_name
+        out += rar4_block(0x74, 0x8000 | 0x0200, body) + data
+    return out + rar4_block(0x7B, 0, b'')
+
+
+def vint(value):
+    out = b''
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out += bytes([byte | (0x80 if value else 0)])
+        if not value:
+            return out
+
+
+def rar5_block(body):
+    size = vint(len(body))
+    return struct.pack('<I', zlib.crc32(size + body)) + size + body
+
+
+def build_rar5(members):
+    out = b'Rar!\x1a\x07\x01\x00' + rar5_block(vint(1) + vint(0) + vint(0))
+    for name, data in members:
+        raw_name = name.encode('utf-8')
+        body = (vint(2) + vint(0x2) + vint(len(data)) + vint(0x4) + vint(len(data)) + vint(0x20)
+                + struct.pack('<I', zlib.crc32(data)) + vint(0) + vint(0) + vint(len(raw_name)) + raw_name)
+        out += rar5_block(body) + data
+    return out + rar5_block(vint(5) + vint(0) + vint(0))
+
+
+def number_7z(value):
+    """Запись числа в формате ReadNumber 7z: n единичных старших бит — n дополнительных байт"""
+    for extra in range(8):
+        if value < 1 << (7 * (extra + 1)):
+            high = value >> (8 * extra)
+            prefix = (0xFF00 >> extra) & 0xFF
+            return bytes([prefix | high]) + (value & ((1 << (8 * extra)) - 1)).to_bytes(extra, 'little')
+    return b'\xff' + value.to_bytes(8, 'little')
+
+
+def build_7z(members):
+    """7z с одним потоком Copy, пустые файлы — через kEmptyStream / kEmptyFile"""
+    packed = b''.join(data for _, data in members if data)
+    sizes = [len(data) for _, data in members if data]
+    empty = [not data for _, data in members]
+    empty_bits = bytes([sum(0x80 >> i for i, e in enumerate(empty) if e)])
+    names = b''.join(name.encode('utf-16-le') + b'\x00\x00' for name, _ in members)
+    header = (
+        b'\x01\x04'
+        + b'\x06\x00\x01\x09' + number_7z(len(packed)) + b'\x00'
+        + b'\x07\x0b\x01\x00\x01\x01\x00\x0c' + number_7z(len(packed)) + b'\x00'
+        + b'\x08\x0d' + number_7z(len(sizes)) + b'\x09'
+        + b''.join(number_7z(size) for size in sizes[:-1]) + b'\x00'
+        + b'\x00'
+        + b'\x05' + number_7z(len(members))
+        + b'\x0e\x01' + empty_bits
+        + b'\x0f\x01\x80'
+        + b'\x11' + number_7z(len(names) + 1) + b'\x00' + names
+        + b'\x00\x00'
+    )
+    start = struct.pack('<QQI', len(packed), len(header), zlib.crc32(header))
+    return b'7z\xbc\xaf\x27\x1c\x00\x04' + struct.pack('<I', zlib.crc32(start)) + start + packed + header
+
+
+class MemoryS3:
+    """Методы S3, которые вызывает stage_zip_member, поверх словаря"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.max_part = 0
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys):
+        return {'Contents': [{'Key': key, 'Size': len(data)} for key, data in self.objects.items()
+                             if key.startswith(Prefix)][:MaxKeys]}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        self.max_part = max(self.max_part, len(Body))
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[p['PartNumber']] for p in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def check(name, condition):
+    print(f"   {'✅' if condition else '❌'} {name}")
+    return condition
+
+
+def main():
+    global served_bytes
+    ok = True
+
+    with tempfile.TemporaryDirectory() as root:
+        expected = build_fixtures(root)
+        os.makedirs(os.path.join(root, 'norange'))
+        os.link(os.path.join(root, 'work.zip'), os.path.join(root, 'norange', 'work.zip'))
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), lambda *a: RangeHandler(*a, directory=root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        archive_size = os.path.getsize(os.path.join(root, 'work.zip'))
+
+        print('📦 work.zip:')
+        names = [e['name'] for e in index.read_zip_directory(f'{base}/work.zip')]
+        ok &= check('каталог без директорий',
+                    names == ['ПЗ.docx', 'Записка.txt', 'Чертежи/Лист 1.dwg', 'Чертежи/Сборка.bin'])
+        for member in ('ПЗ.docx', 'Записка.txt', 'Чертежи/Лист 1.dwg'):
+            served_bytes = 0
+            entry, content = index.read_zip_member(f'{base}/work.zip', member, max_bytes=10 ** 8)
+            ok &= check(f'{member}: {entry["size"]} байт, скачано {served_bytes} из {archive_size}',
+                        content == expected[member] and served_bytes < archive_size)
+
+        entry, content = index.read_zip_member(f'{base}/work.zip', 'Записка.txt')
+        ok &= check('лимит размера не скачивает тело', entry is not None and content == b'')
+
+        print('☁️  больше лимита — через S3:')
+        s3 = MemoryS3()
+        for member in ('Записка.txt', 'Чертежи/Сборка.bin'):
+            entry = next(e for e in index.read_zip_directory(f'{base}/work.zip') if e['name'] == member)
+            location = index.stage_zip_member(s3, f'{base}/work.zip', entry, part_bytes=1_000_000)
+            key = location.split('/kyra/', 1)[1].split('?', 1)[0]
+            ok &= check(f'{member}: {entry["size"]} байт, частей по ≤ {s3.max_part} байт',
+                        s3.objects.get(key) == expected[member] and s3.max_part <= 1_000_000)
+        response = index.zip_member_response(f'{base}/work.zip', 'Чертежи/Сборка.bin', s3_client=s3)
+        ok &= check('ответ — 302 на временную ссылку',
+                    response['statusCode'] == 302 and response['headers']['Location'].startswith('https://s3.local/'))
+        served_bytes = 0
+        index.zip_member_response(f'{base}/work.zip', 'Чертежи/Сборка.bin', s3_client=s3)
+        ok &= check(f'повторный запрос не распаковывает заново (скачано {served_bytes} байт)',
+                    served_bytes < 100_000 and len(s3.objects) == 2)
+        ok &= check('без S3 — 413',
+                    index.zip_member_response(f'{base}/work.zip', 'Записка.txt')['statusCode'] == 413)
+        ok &= check('отсутствующий элемент', index.read_zip_member(f'{base}/work.zip', 'nope.txt')[0] is None)
+
+        print('📦 cp866.zip:')
+        entry, content = index.read_zip_member(f'{base}/cp866.zip', 'Расчёт.txt')
+        ok &= check('имя в cp866', content == b'cp866 name')
+
+        print('📦 zip64.zip:')
+        served_bytes = 0
+        entry, content = index.read_zip_member(f'{base}/zip64.zip', 'last.bin')
+        ok &= check(f'ZIP64, скачано {served_bytes} байт', content == expected['last.bin'])
+
+        print('📋 populate-files-list:')
+        for name in ('work.zip', 'cp866.zip', 'zip64.zip'):
+            with zipfile.ZipFile(os.path.join(root, name)) as zf:
+                local = [(i.filename, i.file_size) for i in zf.filelist if not i.is_dir()]
+            if name == 'cp866.zip':
+                local = [('Расчёт.txt', 10)]
+            served_bytes = 0
+            remote = populate.list_remote_zip(f'{base}/{name}')
+            ok &= check(f'{name}: {len(remote)} файлов, скачано {served_bytes} байт', remote == local)
+        ok &= check('без Range — полный архив',
+                    len(populate.list_remote_zip(f'{base}/norange/work.zip')) == 4)
+
+        local = [('ПЗ.docx', len(expected['ПЗ.docx'])), ('Чертежи/Лист 1.dwg', len(expected['Чертежи/Лист 1.dwg'])),
+                 ('Пусто.txt', 0)]
+        for name in ('work4.rar', 'work5.rar', 'work.7z'):
+            served_bytes = 0
+            remote = populate.list_remote_archive(f'{base}/{name}')
+            archive_size = os.path.getsize(os.path.join(root, name))
+            ok &= check(f'{name}: {len(remote)} файлов, скачано {served_bytes} из {archive_size} байт',
+                        remote == local and served_bytes < archive_size)
+            os.link(os.path.join(root, name), os.path.join(root, 'norange', name))
+            ok &= check(f'{name} без Range', populate.list_remote_archive(f'{base}/norange/{name}') == local)
+
+        print('🚫 ошибки:')
+        for url, label in ((f'{base}/not-a-zip.rar', 'не ZIP'), (f'{base}/norange/work.zip', 'сервер без Range')):
+            try:
+                index.read_zip_directory(url)
+                ok &= check(label, False)
+            except ValueError as e:
+                ok &= check(f'{label}: {e}', True)
+
+        server.shutdown()
+
+    print('\n✅ Все проверки пройдены' if ok else '\n❌ Есть ошибки')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
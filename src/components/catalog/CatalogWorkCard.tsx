@@ -4,6 +4,8 @@ import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
 import { Tooltip, TooltipContent, TooltipTrigger } from '@/components/ui/tooltip';
 import Icon from '@/components/ui/icon';
+import { findImageVariant, variantSources, type ImageVariants } from '@/utils/imageOptimization';
+import { blurhashToDataUrl } from '@/utils/blurhash';
 
 interface Work {
   id: string;
@@ -29,6 +31,7 @@ interface Work {
   views?: number;
   downloads?: number;
   reviewsCount?: number;
+  imageVariants?: ImageVariants | null;
 }
 
 interface CatalogWorkCardProps {
@@ -49,17 +52,39 @@ const CatalogWorkCard = memo(function CatalogWorkCard({
   onToggleFavorite,
   onNavigate
 }: CatalogWorkCardProps) {
+  const imageUrl = work.previewUrl || work.previewUrls?.[0] || '';
+  const imageVariant = findImageVariant(work.imageVariants, imageUrl);
+  // Размытый плейсхолдер под картинкой, пока она грузится, вместо пустого серого блока
+  const placeholder = imageVariant
+    ? blurhashToDataUrl(imageVariant.blurhash, imageVariant.width, imageVariant.height)
+    : null;
+
   const cardContent = (
     <>
-      <div className="relative bg-gradient-to-br from-gray-50 to-gray-100 aspect-[4/3] overflow-hidden">
+      <div
+        className="relative bg-gradient-to-br from-gray-50 to-gray-100 aspect-[4/3] overflow-hidden bg-cover bg-center"
+        style={placeholder ? { backgroundImage: `url(${placeholder})` } : undefined}
+      >
         {work.previewUrl || (work.previewUrls && work.previewUrls.length > 0) ? (
           <>
-            <img 
-              src={work.previewUrl || work.previewUrls?.[0] || ''} 
-              alt={work.title}
-              className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
-              loading="lazy"
-            />
+            <picture>
+              {imageVariant && variantSources(imageVariant).map((source) => (
+                <source
+                  key={source.type}
+                  type={source.type}
+                  srcSet={source.srcSet}
+                  sizes="(min-width: 1280px) 25vw, (min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw"
+                />
+              ))}
+              <img 
+                src={imageUrl} 
+                alt={work.title}
+                width={imageVariant?.width}
+                height={imageVariant?.height}
+                className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
+                loading="lazy"
+              />
+            </picture>
             <div className="absolute inset-0 bg-gradient-to-t from-black/20 to-transparent opacity-0 group-hover:opacity-100 transition-opacity duration-300"></div>
           </>
         ) : (
@@ -18,6 +18,7 @@ import { useScrollTracking } from '@/hooks/useScrollTracking';
 import CatalogHeader from '@/components/catalog/CatalogHeader';
 import CatalogLoadingState from '@/components/catalog/CatalogLoadingState';
 import CatalogWorkCard from '@/components/catalog/CatalogWorkCard';
+import type { ImageVariants } from '@/utils/imageOptimization';
 
 
 interface Work {
@@ -44,6 +45,7 @@ interface Work {
   views?: number;
   downloads?: number;
   reviewsCount?: number;
+  imageVariants?: ImageVariants | null;
 }
 
 export default function CatalogPage() {
@@ -309,6 +311,7 @@ export default function CatalogPage() {
               rating: determineRating(workType),
               previewUrl: work.preview_image_url || null,
               previewUrls: work.cover_images || [],
+              imageVariants: work.image_variants || null,
               yandexDiskLink: work.yandex_disk_link || null,
               purchaseCount: work.downloads || 0,
               isHit: false,
@@ -0,0 +1,106 @@
+/**
+ * Декодирование BlurHash (works.image_variants[*].blurhash) в маленькую картинку-плейсхолдер.
+ * Строка ~30 символов разворачивается в PNG 32px, который браузер растягивает на всю карточку.
+ */
+
+const ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~';
+const PLACEHOLDER_SIZE = 32;
+
+// Одни и те же хеши встречаются при каждом ререндере каталога — декодируем один раз
+const cache = new Map<string, string | null>();
+
+function decode83(value: string): number {
+  let result = 0;
+  for (const char of value) {
+    const digit = ALPHABET.indexOf(char);
+    if (digit < 0) throw new Error('invalid blurhash');
+    result = result * 83 + digit;
+  }
+  return result;
+}
+
+function srgbToLinear(value: number): number {
+  const v = value / 255;
+  return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+}
+
+function linearToSrgb(value: number): number {
+  const v = Math.max(0, Math.min(1, value));
+  return Math.round((v <= 0.0031308 ? v * 12.92 : 1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+}
+
+function signPow(value: number, exp: number): number {
+  return Math.sign(value) * Math.pow(Math.abs(value), exp);
+}
+
+function decodePixels(hash: string, width: number, height: number): Uint8ClampedArray {
+  const sizeFlag = decode83(hash[0]);
+  const numY = Math.floor(sizeFlag / 9) + 1;
+  const numX = (sizeFlag % 9) + 1;
+  if (hash.length !== 4 + 2 * numX * numY) throw new Error('invalid blurhash length');
+
+  const maxValue = (decode83(hash[1]) + 1) / 166;
+  const colors: number[][] = [];
+  const dc = decode83(hash.substring(2, 6));
+  colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)]);
+  for (let i = 1; i < numX * numY; i++) {
+    const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+    colors.push([
+      signPow((Math.floor(ac / 361) - 9) / 9, 2) * maxValue,
+      signPow(((Math.floor(ac / 19) % 19) - 9) / 9, 2) * maxValue,
+      signPow(((ac % 19) - 9) / 9, 2) * maxValue
+    ]);
+  }
+
+  const pixels = new Uint8ClampedArray(width * height * 4);
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      let r = 0;
+      let g = 0;
+      let b = 0;
+      for (let j = 0; j < numY; j++) {
+        const basisY = Math.cos((Math.PI * y * j) / height);
+        for (let i = 0; i < numX; i++) {
+          const basis = Math.cos((Math.PI * x * i) / width) * basisY;
+          const color = colors[i + j * numX];
+          r += color[0] * basis;
+          g += color[1] * basis;
+          b += color[2] * basis;
+        }
+      }
+      const offset = 4 * (x + y * width);
+      pixels[offset] = linearToSrgb(r);
+      pixels[offset + 1] = linearToSrgb(g);
+      pixels[offset + 2] = linearToSrgb(b);
+      pixels[offset + 3] = 255;
+    }
+  }
+  return pixels;
+}
+
+/**
+ * data:-URL плейсхолдера с пропорциями исходника; null, если хеш битый или нет canvas
+ */
+export function blurhashToDataUrl(hash: string | null | undefined, width = 1, height = 1): string | null {
+  if (!hash || typeof document === 'undefined') return null;
+  if (cache.has(hash)) return cache.get(hash) ?? null;
+
+  let url: string | null = null;
+  try {
+    const ratio = width > 0 && height > 0 ? width / height : 1;
+    const w = ratio >= 1 ? PLACEHOLDER_SIZE : Math.max(1, Math.round(PLACEHOLDER_SIZE * ratio));
+    const h = ratio >= 1 ? Math.max(1, Math.round(PLACEHOLDER_SIZE / ratio)) : PLACEHOLDER_SIZE;
+    const canvas = document.createElement('canvas');
+    canvas.width = w;
+    canvas.height = h;
+    const ctx = canvas.getContext('2d');
+    if (ctx) {
+      ctx.putImageData(new ImageData(decodePixels(hash, w, h), w, h), 0, 0);
+      url = canvas.toDataURL('image/png');
+    }
+  } catch (error) {
+    url = null;
+  }
+  cache.set(hash, url);
+  return url;
+}
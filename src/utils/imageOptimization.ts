@@ -235,3 +235,48 @@ export async function validateImage(
 
   return { valid: true };
 }
+
+/**
+ * Производные изображения, подготовленные бэкендом (works.image_variants):
+ * src — исходный URL, srcset — по MIME-типу строка вида "url 320w, url 640w",
+ * version / etag — MD5 и ETag исходника, по ним бэкенд проверяет свежесть производных,
+ * blurhash — плейсхолдер на время загрузки (см. utils/blurhash)
+ */
+export interface ImageVariant {
+  src: string;
+  width: number;
+  height: number;
+  version?: string;
+  etag?: string;
+  blurhash?: string;
+  srcset: Record<string, string>;
+}
+
+export interface ImageVariants {
+  preview?: ImageVariant | null;
+  covers?: ImageVariant[];
+}
+
+// AVIF раньше WebP: браузер берёт первый поддерживаемый <source>
+const VARIANT_MIME_ORDER = ['image/avif', 'image/webp'];
+
+/**
+ * Производные для конкретного URL; если изображение сменилось, а производные ещё старые — null
+ */
+export function findImageVariant(
+  variants: ImageVariants | null | undefined,
+  url: string | null | undefined
+): ImageVariant | null {
+  if (!variants || !url) return null;
+  if (variants.preview?.src === url) return variants.preview;
+  return variants.covers?.find((variant) => variant.src === url) || null;
+}
+
+/**
+ * Источники для <picture> в порядке предпочтения
+ */
+export function variantSources(variant: ImageVariant): { type: string; srcSet: string }[] {
+  return VARIANT_MIME_ORDER
+    .filter((type) => variant.srcset[type])
+    .map((type) => ({ type, srcSet: variant.srcset[type] }));
+}